@@ -44,9 +44,12 @@ INSTALLED_APPS = [
     'apps.authentication',
     'apps.users',
     'apps.dataAPI',
+    'apps.monitoring',
 ]
 
 MIDDLEWARE = [
+    'apps.monitoring.middleware.MetricsMiddleware',
+    'apps.monitoring.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,10 +89,117 @@ DATABASES = {
         'NAME': BASE_DIR / "db.sqlite3",
         'OPTIONS': {
             'timeout': 45,
+            # Transactions take the write lock when they begin, so concurrent
+            # data sends wait for it (up to "timeout") instead of failing with
+            # "database is locked" when a read lock cannot be upgraded
+            'transaction_mode': 'IMMEDIATE',
         }
     }
 }
 
+# PostgreSQL when POSTGRES_DB is set in the environment (needs "pip install
+# psycopg[binary]"). Data sends are then written with COPY and the measurements
+# table is partitioned by month (see apps.dataAPI.postgres)
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 60,
+        }
+    }
+
+# PRAGMAs run on every new SQLite connection (see apps.dataAPI.database). WAL lets
+# the views read while a data send is written, and with synchronous=NORMAL a
+# commit only waits for the WAL, not for the database file. mmap_size (bytes),
+# cache_size (negative: KiB per connection) and temp_store speed up large reads.
+# An empty dict keeps the SQLite defaults.
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "temp_store": "memory",
+}
+
+
+# Measurements ingestion
+# Number of rows written by each bulk INSERT of a data send
+MEASUREMENTS_BULK_CHUNK_SIZE = 500
+# Validation of the data sends: "serializer" (DRF MeasurementsSerializer) or
+# "fast" (columnar checks with the same error messages, faster for large sends)
+MEASUREMENTS_VALIDATION = "serializer"
+# "sync" stores each data send before answering; "spool" queues it in
+# MEASUREMENTS_SPOOL_PATH, answers 202 and leaves the writes to
+# "python manage.py drain_ingest_spool", which must be kept running
+MEASUREMENTS_INGEST_MODE = "sync"
+MEASUREMENTS_SPOOL_PATH = BASE_DIR / "ingest_spool.sqlite3"
+# Pending data sends above which the endpoint answers 429 with Retry-After (seconds)
+MEASUREMENTS_SPOOL_MAX_DEPTH = 10000
+MEASUREMENTS_SPOOL_RETRY_AFTER = 5
+# Async send endpoint (measurements-api/send-async/, served by an ASGI server):
+# threads that write the data sends and calls waiting for them above which it
+# answers 429 with Retry-After
+MEASUREMENTS_ASYNC_WORKERS = 4
+MEASUREMENTS_ASYNC_MAX_PENDING = 1000
+# Live view of the measurements (live-measurements/, ASGI only): minimum seconds
+# between the events sent to a client, points per experiment and type in each
+# event, and new samples buffered per client before the oldest are dropped
+MEASUREMENTS_LIVE_INTERVAL = 1.0
+MEASUREMENTS_LIVE_POINTS = 500
+MEASUREMENTS_LIVE_BUFFER = 100000
+# Retried data sends are detected by their X-Batch-Id header or "batch_id" field
+# and, when missing, by the SHA-256 of their body
+MEASUREMENTS_DEDUPLICATE_CONTENT = True
+# Days the keys of the stored data sends are kept to detect their retries
+# (deleted by "python manage.py dedupe_measurements --keys-only")
+MEASUREMENTS_BATCH_KEY_DAYS = 7
+# Largest data send accepted, in bytes, compressed or not. Data sends are not
+# limited by DATA_UPLOAD_MAX_MEMORY_SIZE, smaller than the backlog of a watch
+# that was offline for a while
+MEASUREMENTS_MAX_BODY_SIZE = 64 * 1024 * 1024
+# Resolutions (seconds) of the pre-aggregated statistics kept per experiment and
+# type; an empty list disables them
+MEASUREMENTS_ROLLUP_RESOLUTIONS = [1, 60, 3600]
+# Storage of the samples: "orm" (one Measurement row per sample) or "segments"
+# (compressed per type segments of up to MEASUREMENTS_SEGMENT_SAMPLES samples).
+# Move the stored samples with "python manage.py migrate_measurement_storage"
+MEASUREMENTS_STORAGE = "orm"
+MEASUREMENTS_SEGMENT_SAMPLES = 10000
+# Directory of the archive files of the experiments moved out of the live storage
+# by "python manage.py archive_experiments", which archives the experiments
+# without data sends for MEASUREMENTS_ARCHIVE_AFTER_DAYS days
+MEASUREMENTS_ARCHIVE_PATH = BASE_DIR / "archive"
+MEASUREMENTS_ARCHIVE_AFTER_DAYS = 30
+# PostgreSQL only: monthly partitions of the measurements table created ahead
+# of the current month by "python manage.py create_measurement_partitions"
+MEASUREMENTS_PARTITION_MONTHS_AHEAD = 3
+# Experiments are deleted in a background thread, MEASUREMENTS_DELETE_CHUNK_SIZE
+# primary keys per transaction with a pause (seconds) between them so data sends
+# are not blocked; "python manage.py delete_experiments" resumes interrupted ones
+MEASUREMENTS_DELETE_IN_BACKGROUND = True
+MEASUREMENTS_DELETE_CHUNK_SIZE = 5000
+MEASUREMENTS_DELETE_PAUSE = 0.05
+
+# Prometheus metrics of each server process (request times, steps of the data
+# sends, samples stored per type, database queries, SQLite lock errors) served
+# at /metrics; when METRICS_TOKEN is set, scrapers send "Authorization: Bearer <token>"
+METRICS_ENABLED = False
+METRICS_TOKEN = None
+# Most queries of each view (@query_budget, see apps.monitoring.budget): "log"
+# checks QUERY_BUDGET_SAMPLE_RATE of the requests and logs the ones over budget,
+# "raise" fails them (set by the test runner) and "off" checks nothing
+QUERY_BUDGET_MODE = "log"
+QUERY_BUDGET_SAMPLE_RATE = 0.01
+# Roles of the logged in user are kept in the session for this many seconds, or
+# until the groups of the user change (see apps.users.roles)
+USER_ROLES_CACHE_SECONDS = 300
+
+TEST_RUNNER = 'apps.monitoring.runner.QueryBudgetTestRunner'
 
 
 # Password validation
@@ -23,7 +23,8 @@ urlpatterns = [
     path("", include("apps.viewData.urls")),
     path("", include("apps.authentication.urls")),
     path("", include("apps.users.urls")),
-    path("", include("apps.dataAPI.urls"))
+    path("", include("apps.dataAPI.urls")),
+    path("", include("apps.monitoring.urls")),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
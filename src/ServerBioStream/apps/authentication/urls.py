@@ -1,9 +1,10 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 from apps.authentication.views import CustomLoginView
+from apps.monitoring.budget import query_budget
 
 
 urlpatterns = [
     path("", CustomLoginView, name="login"),
-    path("logout", LogoutView.as_view(next_page="/"), name="logout"),
+    path("logout", query_budget(6)(LogoutView.as_view(next_page="/")), name="logout"),
 ]
\ No newline at end of file
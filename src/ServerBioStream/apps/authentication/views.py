@@ -2,6 +2,9 @@ from django.contrib.auth import authenticate, login
 from django.shortcuts import render, redirect
 from django.contrib import messages
 
+from apps.monitoring.budget import query_budget
+
+@query_budget(10)
 def CustomLoginView(request):
     if request.method == 'POST':
         username = request.POST['username']
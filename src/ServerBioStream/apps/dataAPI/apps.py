@@ -5,3 +5,10 @@ class DataapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.dataAPI'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .database import configure_sqlite
+
+        # WAL and the other SQLITE_PRAGMAS on every new database connection
+        connection_created.connect(configure_sqlite, dispatch_uid="apps.dataAPI.configure_sqlite")
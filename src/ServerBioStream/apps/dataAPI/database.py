@@ -0,0 +1,32 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# PRAGMA statements cannot take parameters, so names and values are checked
+PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+PRAGMA_VALUE = re.compile(r"^(-?[0-9]+|[A-Za-z_]+)$")
+
+
+"""
+Return the PRAGMAs applied to every SQLite connection, as a dict {name: value}
+(none, i.e. the SQLite defaults, without SQLITE_PRAGMAS in the settings)
+"""
+def get_sqlite_pragmas():
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None) or {}
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME.match(str(name)) or not PRAGMA_VALUE.match(str(value)):
+            raise ImproperlyConfigured(f"Invalid SQLITE_PRAGMAS entry: {name} = {value}")
+    return pragmas
+
+
+"""
+Receiver of the connection_created signal (connected in DataapiConfig.ready):
+apply SQLITE_PRAGMAS to each new SQLite connection
+"""
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
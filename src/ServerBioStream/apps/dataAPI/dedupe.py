@@ -0,0 +1,70 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+
+from .models import IngestedBatch
+
+KEY_MAX_LENGTH = 100
+DEFAULT_BATCH_KEY_DAYS = 7
+
+
+"""
+Key of a data send identified by the client (X-Batch-Id header or "batch_id" field)
+"""
+def batch_key_from_id(batch_id):
+    batch_id = str(batch_id).strip()
+    if not batch_id:
+        return None
+    return ("id:" + batch_id)[:KEY_MAX_LENGTH]
+
+
+"""
+Key of a data send identified by the hash of its body, as SmartBioStream does
+not send batch ids and retries the exact same body. With
+MEASUREMENTS_DEDUPLICATE_CONTENT (True by default), every data send without an
+X-Batch-Id header is hashed before it is parsed: a pass over the whole body, about
+a millisecond per MB, and an index lookup of the key. Set it to False when
+every client sends batch ids; None is returned then.
+"""
+def batch_key_from_body(body):
+    if not getattr(settings, "MEASUREMENTS_DEDUPLICATE_CONTENT", True):
+        return None
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+"""
+Return True when a data send with this key has already been stored
+"""
+def is_duplicate(key):
+    return key is not None and IngestedBatch.objects.filter(key=key).exists()
+
+
+"""
+Record the key of a batch. Returns False when it was already recorded, which
+the unique index detects even for concurrent uploads of the same batch.
+"""
+def record_batch(batch):
+    try:
+        with transaction.atomic():
+            IngestedBatch.objects.create(key=batch.key, experiment=batch.identifier, samples=len(batch))
+    except IntegrityError:
+        return False
+    return True
+
+
+"""
+Delete the keys of the data sends recorded more than MEASUREMENTS_BATCH_KEY_DAYS
+days ago, long after the watches stopped retrying them. Return how many were
+deleted, or would be with "dry_run".
+"""
+def prune_batch_keys(days=None, dry_run=False):
+    if days is None:
+        days = getattr(settings, "MEASUREMENTS_BATCH_KEY_DAYS", DEFAULT_BATCH_KEY_DAYS)
+    expired = IngestedBatch.objects.filter(created__lt=now() - timedelta(days=days))
+    if dry_run:
+        return expired.count()
+    deleted, _ = expired.delete()
+    return deleted
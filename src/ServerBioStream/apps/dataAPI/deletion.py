@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .dimensions import forget_experiment
+from .models import Experiment, ExperimentDeletion, Measurement, MeasurementRollup, MeasurementSegment
+from .rollups import rebuild_rollups
+from .storage import get_storage
+from .summaries import rebuild_summary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELETE_CHUNK_SIZE = 5000
+DEFAULT_DELETE_PAUSE = 0.05
+
+# Running deletions not updated for this long were interrupted (e.g. the server
+# restarted) and can be resumed
+STALE_AFTER = timedelta(minutes=5)
+
+# Tables holding rows of an experiment, deleted in this order
+CHUNKED_MODELS = (Measurement, MeasurementSegment, MeasurementRollup)
+
+ACTIVE_STATUSES = (ExperimentDeletion.PENDING, ExperimentDeletion.RUNNING)
+
+
+def get_delete_chunk_size():
+    return getattr(settings, "MEASUREMENTS_DELETE_CHUNK_SIZE", DEFAULT_DELETE_CHUNK_SIZE)
+
+
+def get_delete_pause():
+    return getattr(settings, "MEASUREMENTS_DELETE_PAUSE", DEFAULT_DELETE_PAUSE)
+
+
+"""
+DELETE statement of one chunk of delete_rows, taking the experiment id and
+the primary key range [start, end). The experiment column is written as
++column, so SQLite searches the primary key range rather than the experiment
+index, which would scan every remaining row of the experiment at each chunk.
+"""
+def delete_chunk_sql(model):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    experiment = quote(model._meta.get_field("experiment").column)
+    return f"DELETE FROM {table} WHERE +{experiment} = %s AND {pk} >= %s AND {pk} < %s"
+
+
+"""
+Delete the rows of "model" that belong to an experiment, one primary key range
+of "chunk_size" ids per transaction, and yield the rows deleted by each one.
+Ranges holding only rows of other experiments are skipped without a pause.
+The DELETE statements are raw SQL, so no object is loaded into memory.
+"""
+def delete_rows(model, experiment_id, chunk_size):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    experiment = quote(model._meta.get_field("experiment").column)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({pk}), MAX({pk}) FROM {table} WHERE {experiment} = %s", [experiment_id])
+        first, last = cursor.fetchone()
+    if first is None:
+        return
+
+    sql = delete_chunk_sql(model)
+    for start in range(first, last + 1, chunk_size):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [experiment_id, start, start + chunk_size])
+                deleted = cursor.rowcount
+        if not deleted:
+            continue
+        yield deleted
+        # Leave the database to the data sends waiting for the write lock
+        time.sleep(get_delete_pause())
+
+
+"""
+Create the deletion of an experiment, or return the one already in progress.
+The experiment leaves the experiments list right away; its rows are deleted by
+run_deletion, in a background thread when "background" (by default
+MEASUREMENTS_DELETE_IN_BACKGROUND) is set, once the transaction commits, or
+before returning otherwise. Return None when the experiment does not exist.
+"""
+def start_deletion(identifier, background=None):
+    with transaction.atomic():
+        experiment = Experiment.objects.select_for_update().filter(identifier=identifier).first()
+        if experiment is None:
+            return None
+        deletion = experiment.deletions.filter(status__in=ACTIVE_STATUSES).first()
+        if deletion is not None:
+            return deletion
+        deletion = ExperimentDeletion.objects.create(identifier=identifier, experiment=experiment)
+
+        if background is None:
+            background = getattr(settings, "MEASUREMENTS_DELETE_IN_BACKGROUND", True)
+        if background:
+            thread = threading.Thread(target=run_deletion_thread, args=(deletion.id,), daemon=True)
+            transaction.on_commit(thread.start)
+            return deletion
+
+    run_deletion(deletion.id)
+    deletion.refresh_from_db()
+    return deletion
+
+
+def run_deletion_thread(deletion_id):
+    try:
+        run_deletion(deletion_id)
+    finally:
+        # Each thread has its own connection
+        connection.close()
+
+
+"""
+Claim a deletion (pending, or running but interrupted) and delete the rows of
+its experiment chunk by chunk, updating its progress. Once the tables are
+empty, the experiment, its summary and its archive file are deleted in one
+short transaction. If it fails, the summary and the rollups are rebuilt from
+the samples left, so the experiments list stays consistent.
+Return whether the deletion was run.
+"""
+def run_deletion(deletion_id):
+    claimed = ExperimentDeletion.objects.filter(
+        Q(status=ExperimentDeletion.PENDING) | Q(status=ExperimentDeletion.RUNNING, updated__lt=now() - STALE_AFTER),
+        id=deletion_id,
+    ).update(status=ExperimentDeletion.RUNNING, updated=now())
+    if not claimed:
+        return False
+
+    deletion = ExperimentDeletion.objects.get(id=deletion_id)
+    experiment_id = deletion.experiment_id
+    try:
+        if experiment_id is not None:
+            total = sum(model.objects.filter(experiment_id=experiment_id).count() for model in CHUNKED_MODELS)
+            ExperimentDeletion.objects.filter(id=deletion_id).update(total=F("deleted") + total, updated=now())
+
+            chunk_size = get_delete_chunk_size()
+            for model in CHUNKED_MODELS:
+                for deleted in delete_rows(model, experiment_id, chunk_size):
+                    ExperimentDeletion.objects.filter(id=deletion_id).update(deleted=F("deleted") + deleted, updated=now())
+
+            # Rows of data sends stored meanwhile are deleted in cascade
+            with transaction.atomic():
+                get_storage().delete([experiment_id])
+                Experiment.objects.filter(id=experiment_id).delete()
+        forget_experiment(deletion.identifier)
+        ExperimentDeletion.objects.filter(id=deletion_id).update(status=ExperimentDeletion.DONE, updated=now())
+    except Exception as e:
+        logger.exception("Deletion of experiment %s failed", deletion.identifier)
+        ExperimentDeletion.objects.filter(id=deletion_id).update(
+            status=ExperimentDeletion.FAILED, error=str(e), updated=now()
+        )
+        experiment = Experiment.objects.filter(id=experiment_id).first()
+        if experiment is not None:
+            with transaction.atomic():
+                rebuild_summary(experiment)
+                rebuild_rollups(experiment)
+    return True
+
@@ -0,0 +1,83 @@
+import threading
+
+from django.db import transaction
+
+from .models import Experiment, SensorType
+
+# In-process caches of the dimension tables: experiment identifier -> id and
+# measurement type name -> id. Both tables are tiny and almost never change, so
+# after the first data send of an experiment ingestion needs no lookups.
+experiment_ids = {}
+sensor_type_ids = {}
+cache_lock = threading.Lock()
+
+
+# Cache ids only once the transaction that created or read them commits, so a
+# rolled back row is never cached
+def remember(cache, entries):
+    def store():
+        with cache_lock:
+            cache.update(entries)
+
+    transaction.on_commit(store)
+
+
+"""
+Return the id of an experiment, creating it on its first data send
+"""
+def get_experiment_id(identifier):
+    experiment_id = experiment_ids.get(identifier)
+    if experiment_id is None:
+        experiment, _ = Experiment.objects.get_or_create(identifier=identifier)
+        experiment_id = experiment.id
+        remember(experiment_ids, {identifier: experiment_id})
+    return experiment_id
+
+
+"""
+Return a dict with the id of each measurement type name, creating the new ones
+"""
+def get_sensor_type_ids(names):
+    ids = {}
+    missing = []
+    for name in set(names):
+        sensor_type_id = sensor_type_ids.get(name)
+        if sensor_type_id is None:
+            missing.append(name)
+        else:
+            ids[name] = sensor_type_id
+
+    if missing:
+        found = dict(SensorType.objects.filter(name__in=missing).values_list("name", "id"))
+        for name in missing:
+            if name not in found:
+                sensor_type, _ = SensorType.objects.get_or_create(name=name)
+                found[name] = sensor_type.id
+        remember(sensor_type_ids, found)
+        ids.update(found)
+
+    return ids
+
+
+"""
+Return a dict with the name of every measurement type id
+"""
+def get_sensor_type_names():
+    return {sensor_type_id: name for name, sensor_type_id in SensorType.objects.values_list("name", "id")}
+
+
+"""
+Drop an experiment from the cache, e.g. after deleting it
+"""
+def forget_experiment(identifier):
+    with cache_lock:
+        experiment_ids.pop(identifier, None)
+
+
+"""
+Empty both caches. Used when a cached id may belong to a row deleted by another process.
+"""
+def clear_cache():
+    with cache_lock:
+        experiment_ids.clear()
+        sensor_type_ids.clear()
@@ -0,0 +1,242 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+
+from apps.monitoring.metrics import record_ingested, span
+
+from .dedupe import record_batch
+from .dimensions import clear_cache, get_experiment_id, get_sensor_type_ids
+from .live import broker
+from .rollups import add_rollups, aggregate, get_rollup_resolutions
+from .storage import get_storage
+from .summaries import add_to_summary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+"""
+Convert a UNIX timestamp in milliseconds (as sent by SmartBioStream) to an aware datetime
+"""
+def timestamp_from_millis(millis):
+    return EPOCH + timedelta(milliseconds=int(millis))
+
+
+# Columnar representation of a data send: the identifier of the experiment and
+# three parallel lists (or arrays) with the date (ms), type and value of each
+# sample. With "column_types", "types" is an array of indexes into that list of
+# names instead, as decoded from the columnar wire format without building a
+# Python object per sample.
+# The key, when present, identifies the data send to detect retried uploads.
+class MeasurementBatch:
+
+    def __init__(self, identifier, dates, types, values, key=None, column_types=None):
+        self.identifier = identifier
+        self.dates = dates
+        self.types = types
+        self.values = values
+        self.key = key
+        self.column_types = column_types
+
+    # Build a batch from the validated "measurements" list of the serializer
+    @classmethod
+    def from_measurements(cls, identifier, measurements):
+        dates = [element["date"] for element in measurements]
+        types = [element["type"] for element in measurements]
+        values = [element["value"] for element in measurements]
+        return cls(identifier, dates, types, values)
+
+    def __len__(self):
+        return len(self.dates)
+
+    # Names of the types of the batch
+    def type_set(self):
+        return set(self.types) if self.column_types is None else set(self.column_types)
+
+    # The batch as three lists with the date, type name and value of each sample
+    def to_lists(self):
+        if self.column_types is None:
+            return list(self.dates), list(self.types), list(self.values)
+        return (
+            np.asarray(self.dates).tolist(),
+            [self.column_types[index] for index in np.asarray(self.types).tolist()],
+            np.asarray(self.values).tolist(),
+        )
+
+    # Convert the whole batch into the id of its experiment and arrays of dates
+    # (ms), type ids and values, as written by the storage backends
+    def to_arrays(self):
+        experiment_id = get_experiment_id(self.identifier)
+        type_ids = get_sensor_type_ids(self.type_set())
+        if self.column_types is None:
+            types = np.fromiter((type_ids[sample_type] for sample_type in self.types), dtype=np.int64, count=len(self.types))
+        else:
+            types = np.array([type_ids[name] for name in self.column_types], dtype=np.int64)[self.types]
+        return (
+            experiment_id,
+            np.asarray(self.dates, dtype=np.int64),
+            types,
+            np.asarray(self.values, dtype=np.float64),
+        )
+
+
+# Result of an ingestion: how many samples were received and stored, and the
+# error of every chunk that could not be written
+class IngestReport:
+
+    def __init__(self, identifier, received):
+        self.identifier = identifier
+        self.received = received
+        self.inserted = 0
+        self.duplicate = False
+        self.errors = []
+
+    @property
+    def failed(self):
+        if self.duplicate:
+            return 0
+        return self.received - self.inserted
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add_error(self, chunk, start, size, error):
+        self.errors.append(
+            {"chunk": chunk, "start": start, "size": size, "error": str(error)}
+        )
+
+    def as_dict(self):
+        return {
+            "identifier": self.identifier,
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "duplicate": self.duplicate,
+            "errors": self.errors,
+        }
+
+
+"""
+Return the configured number of rows written by each INSERT
+"""
+def get_chunk_size(chunk_size=None):
+    if chunk_size is None:
+        chunk_size = getattr(settings, "MEASUREMENTS_BULK_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+    return max(1, int(chunk_size))
+
+
+"""
+Store a batch of measurements with chunked bulk inserts inside a single transaction.
+Each chunk runs in its own savepoint, so a failing chunk is rolled back and
+reported without discarding the rest of the batch. A batch whose key was
+already stored is reported as duplicate and not written again; a keyed batch
+with a failing chunk is rolled back whole, so its retry stores every chunk.
+"""
+def ingest_batch(batch, chunk_size=None):
+    chunk_size = get_chunk_size(chunk_size)
+
+    if transaction.get_connection().in_atomic_block:
+        return write_batch(batch, chunk_size)
+
+    try:
+        return write_batch(batch, chunk_size)
+    except IntegrityError:
+        # A cached experiment or type id belonged to a row deleted by another
+        # process: the foreign keys failed on commit, so look them up again
+        clear_cache()
+        return write_batch(batch, chunk_size)
+
+
+def write_batch(batch, chunk_size):
+    report = IngestReport(batch.identifier, len(batch))
+
+    with transaction.atomic():
+        if batch.key is not None and not record_batch(batch):
+            report.duplicate = True
+            return report
+
+        storage = get_storage()
+        experiment_id, dates, type_ids, values = batch.to_arrays()
+        stored = []
+        with span("ingest.write"):
+            for chunk, start in enumerate(range(0, len(dates), chunk_size)):
+                end = min(start + chunk_size, len(dates))
+                try:
+                    with transaction.atomic():
+                        storage.write(experiment_id, dates[start:end], type_ids[start:end], values[start:end])
+                    report.inserted += end - start
+                    stored.append((start, end))
+                except DatabaseError as e:
+                    report.add_error(chunk, start, end - start, e)
+
+        # Once its key is stored, every retry of the batch is acknowledged as
+        # duplicate: drop the key and the chunks stored so the watch sends it again
+        if batch.key is not None and report.errors:
+            transaction.set_rollback(True)
+            report.inserted = 0
+            stored = []
+
+        if stored:
+            rows = np.concatenate([np.arange(start, end) for start, end in stored])
+            type_names = {type_id: name for name, type_id in get_sensor_type_ids(batch.type_set()).items()}
+            type_counts = count_types(type_ids[rows], type_names)
+            with span("ingest.aggregates"):
+                update_summary(experiment_id, dates[rows], type_counts)
+                update_rollups(experiment_id, dates[rows], type_ids[rows], values[rows])
+            publish_live(batch.identifier, dates[rows], type_ids[rows], values[rows], type_names)
+            record_ingested(type_counts)
+
+    if not report.ok:
+        logger.error(
+            "Stored %s of %s measurements of experiment %s. Failed chunks: %s",
+            report.inserted,
+            report.received,
+            report.identifier,
+            report.errors,
+        )
+
+    return report
+
+
+"""
+Return the samples of each type, as a Counter {type name: samples}
+"""
+def count_types(type_ids, type_names):
+    type_counts = Counter()
+    for type_id, samples in zip(*np.unique(type_ids, return_counts=True)):
+        type_counts[type_names[int(type_id)]] = int(samples)
+    return type_counts
+
+
+"""
+Add the samples of a batch that were stored to the summary of its experiment
+"""
+def update_summary(experiment_id, dates, type_counts):
+    add_to_summary(
+        experiment_id, timestamp_from_millis(dates.min()), timestamp_from_millis(dates.max()), type_counts
+    )
+
+
+"""
+Add the samples of a batch that were stored to the rollups of its experiment
+"""
+def update_rollups(experiment_id, dates, type_ids, values):
+    for resolution in get_rollup_resolutions():
+        add_rollups(experiment_id, resolution, aggregate(dates, type_ids, values, resolution))
+
+
+"""
+Send the samples of a batch that were stored to the live views of its
+experiment, once the transaction commits
+"""
+def publish_live(identifier, dates, type_ids, values, type_names):
+    if broker.has_subscribers(identifier):
+        transaction.on_commit(lambda: broker.publish(identifier, dates, type_ids, values, type_names))
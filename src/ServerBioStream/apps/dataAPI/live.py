@@ -0,0 +1,112 @@
+"""
+In-process fan-out of the samples stored by the ingestion to the live views
+(see viewData.views.live_measurements). write_batch publishes each stored batch
+once its transaction commits; the broker hands it to the subscriptions of its
+experiment, which buffer the new samples until their client reads them. Only
+the samples stored by the same server process are published, so the live view
+needs the data sends to be stored by the process that serves it (see docs).
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_LIVE_BUFFER = 100000
+
+
+def get_live_buffer():
+    return getattr(settings, "MEASUREMENTS_LIVE_BUFFER", DEFAULT_LIVE_BUFFER)
+
+
+# New samples of some experiments (and types, None for all) for one client.
+# Samples are added from the ingestion threads and read on the event loop of
+# the client; beyond MEASUREMENTS_LIVE_BUFFER samples the oldest are dropped.
+class Subscription:
+
+    def __init__(self, identifiers, types, loop):
+        self.identifiers = set(identifiers)
+        self.types = set(types) if types else None
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.chunks = []
+        self.samples = 0
+        self.dropped = 0
+
+    # Called from any thread
+    def push(self, identifier, dates, type_names, values):
+        if self.types is not None:
+            selected = np.isin(type_names, list(self.types))
+            if not selected.any():
+                return
+            dates, type_names, values = dates[selected], type_names[selected], values[selected]
+        try:
+            self.loop.call_soon_threadsafe(self.add, identifier, dates, type_names, values)
+        except RuntimeError:
+            # The event loop of the client is closed
+            pass
+
+    def add(self, identifier, dates, type_names, values):
+        self.chunks.append((identifier, dates, type_names, values))
+        self.samples += len(dates)
+        while self.samples > get_live_buffer() and len(self.chunks) > 1:
+            removed = self.chunks.pop(0)
+            self.samples -= len(removed[1])
+            self.dropped += len(removed[1])
+        self.event.set()
+
+    """
+    Wait up to "timeout" seconds for new samples and return the chunks
+    (identifier, dates, type names, values) received since the last call and
+    the number of samples dropped meanwhile
+    """
+    async def take(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+        chunks, dropped = self.chunks, self.dropped
+        self.chunks, self.samples, self.dropped = [], 0, 0
+        return chunks, dropped
+
+
+class LiveBroker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, identifiers, types=None):
+        subscription = Subscription(identifiers, types, asyncio.get_running_loop())
+        with self.lock:
+            for identifier in subscription.identifiers:
+                self.subscriptions[identifier].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for identifier in subscription.identifiers:
+                self.subscriptions[identifier].discard(subscription)
+                if not self.subscriptions[identifier]:
+                    del self.subscriptions[identifier]
+
+    def has_subscribers(self, identifier):
+        return identifier in self.subscriptions
+
+    """
+    Hand stored samples of an experiment to its subscriptions. "type_names" is
+    a dict {type id: name}.
+    """
+    def publish(self, identifier, dates, type_ids, values, type_names):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(identifier, ()))
+        if not subscriptions:
+            return
+        names = np.array([type_names[type_id] for type_id in type_ids.tolist()], dtype=object)
+        for subscription in subscriptions:
+            subscription.push(identifier, dates, names, values)
+
+
+broker = LiveBroker()
@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from django.db.models import Q
+from django.utils.timezone import now
+
+from apps.dataAPI.models import Experiment
+from apps.dataAPI.storage import get_storage
+from apps.dataAPI.storage.archive import ArchiveError, get_archive_path
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+
+
+class Command(BaseCommand):
+    help = 'Move the measurements of idle experiments from the live storage to archive files'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the archiving job.
+        """
+        parser.add_argument('--days', type=float, default=None, help='Archive the experiments without data sends for this many days (default MEASUREMENTS_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--experiment', action='append', help='Archive this experiment whether it is idle or not (can be repeated)')
+        parser.add_argument('--restore', action='store_true', help='Move the given experiments (--experiment) back to the live storage')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the experiments that would be archived')
+        parser.add_argument('--interval', type=float, default=None, help='Keep running and archive every INTERVAL seconds')
+
+    def handle(self, *args, **kwargs):
+        """
+        Archive (or restore) the experiments one at a time; each one is moved in
+        its own transaction. With --interval, the idle experiments are looked up
+        again every INTERVAL seconds, so the command can run as a background job.
+        """
+        while True:
+            if kwargs['restore']:
+                self.restore(kwargs['experiment'] or [])
+            else:
+                self.archive(self.experiments(kwargs), kwargs['dry_run'])
+            if kwargs['interval'] is None or kwargs['restore'] or kwargs['dry_run']:
+                break
+            time.sleep(kwargs['interval'])
+
+    def experiments(self, kwargs):
+        experiments = Experiment.objects.filter(archived=False).order_by('identifier')
+        if kwargs['experiment']:
+            return experiments.filter(identifier__in=kwargs['experiment'])
+
+        days = kwargs['days']
+        if days is None:
+            days = getattr(settings, 'MEASUREMENTS_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+        limit = now() - timedelta(days=days)
+        # Summaries from before last_ingested was recorded use the last sample
+        return experiments.filter(summary__samples__gt=0).filter(
+            Q(summary__last_ingested__lt=limit) | Q(summary__last_ingested__isnull=True, summary__end_date__lt=limit)
+        )
+
+    def archive(self, experiments, dry_run):
+        storage = get_storage()
+        total = 0
+        for experiment in experiments:
+            if dry_run:
+                self.stdout.write(f'{experiment.identifier}: would be archived')
+                continue
+            try:
+                samples = storage.archive_experiment(experiment.id)
+            except (ArchiveError, DatabaseError, OSError) as e:
+                # Left live; tried again on the next run
+                self.stderr.write(self.style.WARNING(f'{experiment.identifier}: not archived. Reason: {e}'))
+                continue
+            self.stdout.write(f'{experiment.identifier}: {samples} measurements archived')
+            total += samples
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} measurements to {get_archive_path()}'))
+
+    def restore(self, identifiers):
+        storage = get_storage()
+        for experiment in Experiment.objects.filter(identifier__in=identifiers, archived=True).order_by('identifier'):
+            samples = storage.restore_experiment(experiment.id)
+            self.stdout.write(f'{experiment.identifier}: {samples} measurements restored')
+        self.stdout.write(self.style.SUCCESS('Restore finished'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.dataAPI.postgres import create_partitions, get_partition_months_ahead, is_partitioned, months_to_partition
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of the measurements table (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the partitioning job.
+        """
+        parser.add_argument('--months-ahead', type=int, default=None, help='Months after the current one to create partitions for (default MEASUREMENTS_PARTITION_MONTHS_AHEAD)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Create the partitions missing from the first stored sample to the months
+        ahead; samples that went to the default partition are moved to the new
+        partition of their month. Run it monthly (e.g. from cron) so the data
+        sends of the next months always have a partition.
+        """
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'The {connection.vendor} database has no partitions; nothing to do')
+            return
+        if not is_partitioned(connection):
+            self.stderr.write(self.style.WARNING('The measurements table is not partitioned; run "python manage.py migrate" first'))
+            return
+
+        months_ahead = kwargs['months_ahead']
+        if months_ahead is None:
+            months_ahead = get_partition_months_ahead()
+        with transaction.atomic():
+            created = create_partitions(connection, months_to_partition(connection, months_ahead))
+        for name in created:
+            self.stdout.write(f'{name}: created')
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} partitions'))
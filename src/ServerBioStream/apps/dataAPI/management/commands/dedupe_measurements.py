@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.dataAPI.dedupe import prune_batch_keys
+from apps.dataAPI.models import Experiment
+from apps.dataAPI.rollups import rebuild_rollups
+from apps.dataAPI.storage import get_storage
+from apps.dataAPI.summaries import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = 'Delete duplicated measurements (same experiment, type and timestamp), keeping the first one stored'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the deduplication.
+        """
+        parser.add_argument('--experiment', action='append', help='Only deduplicate this experiment (can be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=400, help='Duplicated samples deleted per transaction (orm storage)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the duplicated measurements')
+        parser.add_argument('--keys-only', action='store_true', help='Only delete the keys of old data sends')
+        parser.add_argument('--key-days', type=int, help='Days the keys of the data sends are kept (default MEASUREMENTS_BATCH_KEY_DAYS)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Delete the expired keys of the data sends, then deduplicate experiment by
+        experiment through the configured storage backend.
+        """
+        keys = prune_batch_keys(kwargs['key_days'], kwargs['dry_run'])
+        action = 'Found' if kwargs['dry_run'] else 'Deleted'
+        self.stdout.write(f'{action} {keys} expired data send keys')
+        if kwargs['keys_only']:
+            return
+
+        experiments = Experiment.objects.order_by('identifier')
+        if kwargs['experiment']:
+            experiments = experiments.filter(identifier__in=kwargs['experiment'])
+        storage = get_storage()
+        total = 0
+
+        for experiment in experiments:
+            deleted = storage.deduplicate(experiment.id, kwargs['dry_run'], chunk_size=max(1, kwargs['chunk_size']))
+
+            if deleted:
+                self.stdout.write(f'{experiment.identifier}: {deleted} duplicated measurements')
+                if not kwargs['dry_run']:
+                    # The duplicates were counted in the summary and rollups
+                    with transaction.atomic():
+                        rebuild_summary(experiment)
+                    rebuild_rollups(experiment)
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'{action} {total} duplicated measurements'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from apps.dataAPI.deletion import ACTIVE_STATUSES, run_deletion, start_deletion
+from apps.dataAPI.models import ExperimentDeletion
+
+
+class Command(BaseCommand):
+    help = 'Delete experiments in chunks, and resume the deletions interrupted by a restart of the server'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the deletion job.
+        """
+        parser.add_argument('--experiment', action='append', help='Delete this experiment (can be repeated)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Run the deletions in this process, one after the other. Without
+        --experiment, the deletions left pending or running by a stopped server
+        are resumed; the ones still running elsewhere are skipped.
+        """
+        for identifier in kwargs['experiment'] or []:
+            deletion = start_deletion(identifier, background=False)
+            if deletion is None:
+                self.stderr.write(self.style.WARNING(f'{identifier}: not found'))
+                continue
+            self.report(deletion)
+
+        if not kwargs['experiment']:
+            for deletion in ExperimentDeletion.objects.filter(status__in=ACTIVE_STATUSES).order_by('created'):
+                if run_deletion(deletion.id):
+                    self.report(deletion)
+        self.stdout.write(self.style.SUCCESS('Deletions finished'))
+
+    def report(self, deletion):
+        deletion.refresh_from_db()
+        self.stdout.write(f'{deletion.identifier}: {deletion.deleted} rows deleted ({deletion.status})')
@@ -0,0 +1,110 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, transaction
+
+from apps.dataAPI.dimensions import clear_cache
+from apps.dataAPI.ingestion import ingest_batch
+from apps.dataAPI.spool import get_spool
+from apps.monitoring.metrics import is_busy_error, record_busy
+
+
+class Command(BaseCommand):
+    help = 'Write the data sends queued in the ingest spool to the Measurement table'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the background writer.
+        """
+        parser.add_argument('--once', action='store_true', help='Exit when the spool is empty instead of waiting for new batches')
+        parser.add_argument('--max-batches', type=int, default=500, help='Maximum data sends written per transaction')
+        parser.add_argument('--max-samples', type=int, default=100000, help='Maximum samples written per transaction')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the spool is empty or the database is busy')
+
+    def handle(self, *args, **kwargs):
+        """
+        Drain the spool in large transactions. A batch is removed from the spool
+        only after the transaction that stores all its samples has been committed,
+        or moved to its failed_batches table when it cannot be stored.
+        """
+        spool = get_spool()
+        interval = kwargs['interval']
+
+        while True:
+            batches = spool.peek(limit=kwargs['max_batches'], max_samples=kwargs['max_samples'])
+            if not batches:
+                if kwargs['once']:
+                    break
+                time.sleep(interval)
+                continue
+
+            try:
+                reports = self.write_group(spool, batches)
+            except DatabaseError as e:
+                clear_cache()
+                record_busy(e, "drain_ingest_spool")
+                self.stderr.write(self.style.WARNING(f'Database busy, retrying in {interval}s. Reason: {e}'))
+                time.sleep(interval)
+                continue
+
+            inserted = sum(report.inserted for report in reports)
+            duplicates = sum(report.duplicate for report in reports)
+            self.stdout.write(
+                f'Wrote {inserted} measurements from {len(reports)} data sends ({duplicates} duplicate data sends skipped)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Ingest spool drained'))
+
+    def write(self, batches):
+        """
+        Write batches in one transaction and return their reports. Failed chunks
+        (e.g. "database is locked") are caught in the reports; roll back every
+        batch rather than drop them.
+        """
+        with transaction.atomic():
+            reports = [ingest_batch(batch) for _, batch in batches]
+            failed = [report for report in reports if not report.ok]
+            if failed:
+                raise DatabaseError(failed[0].errors[0]["error"])
+        return reports
+
+    def write_group(self, spool, batches):
+        """
+        Write a group of batches and remove them from the spool. Only the errors
+        of a busy database are raised, to retry the whole group later; after any
+        other error the batches are written one at a time, so a batch that can
+        never be written is set aside instead of blocking the others.
+        """
+        try:
+            reports = self.write(batches)
+        except Exception as e:
+            if is_busy_error(e):
+                raise
+            # Also covers cached experiment ids deleted meanwhile (foreign key errors on commit)
+            clear_cache()
+            self.stderr.write(self.style.WARNING(f'Writing {len(batches)} data sends one at a time. Reason: {e}'))
+            return self.write_each(spool, batches)
+
+        spool.acknowledge([spool_id for spool_id, _ in batches])
+        return reports
+
+    def write_each(self, spool, batches):
+        """
+        Write batches one transaction each, moving those that fail to the
+        failed_batches table of the spool.
+        """
+        reports = []
+        for spool_id, batch in batches:
+            try:
+                reports.extend(self.write([(spool_id, batch)]))
+            except Exception as e:
+                if is_busy_error(e):
+                    raise
+                clear_cache()
+                spool.reject(spool_id, e)
+                self.stderr.write(self.style.ERROR(
+                    f'Moved data send {spool_id} of experiment {batch.identifier} to the failed batches. Reason: {e}'
+                ))
+                continue
+            spool.acknowledge([spool_id])
+        return reports
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.dataAPI.models import Experiment
+from apps.dataAPI.storage import BACKENDS, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Move the stored measurements from one storage backend to another (see MEASUREMENTS_STORAGE)'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the migration.
+        """
+        parser.add_argument('source', help=f'Backend to read: {", ".join(BACKENDS)} or a dotted path')
+        parser.add_argument('target', help='Backend to write')
+        parser.add_argument('--experiment', action='append', help='Only migrate this experiment (can be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Samples read and written at once')
+        parser.add_argument('--keep-source', action='store_true', help='Do not delete the samples from the source')
+
+    def handle(self, *args, **kwargs):
+        """
+        Migrate one experiment per transaction: its samples are copied, the copy
+        is counted and the source samples are deleted. Samples already in the
+        target (e.g. sent after switching MEASUREMENTS_STORAGE) are kept.
+        """
+        if kwargs['source'] == kwargs['target']:
+            raise CommandError('The source and target backends are the same')
+        source = get_backend(kwargs['source'])
+        target = get_backend(kwargs['target'])
+
+        experiments = Experiment.objects.order_by('identifier')
+        if kwargs['experiment']:
+            experiments = experiments.filter(identifier__in=kwargs['experiment'])
+        chunk_size = max(1, kwargs['chunk_size'])
+        total = 0
+
+        for experiment in experiments:
+            with transaction.atomic():
+                samples = source.count([experiment.id])
+                if not samples:
+                    continue
+                existing = target.count([experiment.id])
+                for _, dates, type_ids, values in source.read([experiment.id], chunk_size=chunk_size):
+                    target.write(experiment.id, dates, type_ids, values)
+
+                copied = target.count([experiment.id]) - existing
+                if copied != samples:
+                    raise CommandError(f'{experiment.identifier}: copied {copied} of {samples} samples, rolled back')
+                if not kwargs['keep_source']:
+                    source.delete([experiment.id])
+
+            self.stdout.write(f'{experiment.identifier}: {samples} measurements')
+            total += samples
+
+        self.stdout.write(self.style.SUCCESS(f'Migrated {total} measurements from {source.name} to {target.name}'))
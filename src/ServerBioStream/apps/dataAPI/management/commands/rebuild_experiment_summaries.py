@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.dataAPI.models import Experiment
+from apps.dataAPI.summaries import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = 'Recompute the experiment summaries shown in the experiments list from the stored measurements'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the rebuild.
+        """
+        parser.add_argument('--experiment', action='append', help='Only rebuild this experiment (can be repeated)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Rebuild the summaries one experiment per transaction.
+        """
+        experiments = Experiment.objects.order_by('identifier')
+        if kwargs['experiment']:
+            experiments = experiments.filter(identifier__in=kwargs['experiment'])
+
+        for experiment in experiments:
+            with transaction.atomic():
+                summary = rebuild_summary(experiment)
+            self.stdout.write(f'{experiment.identifier}: {summary.samples} measurements')
+
+        self.stdout.write(self.style.SUCCESS('Experiment summaries rebuilt'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.dataAPI.models import Experiment
+from apps.dataAPI.rollups import get_rollup_resolutions, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the pre-aggregated statistics (rollups) of the experiments from the stored measurements'
+
+    def add_arguments(self, parser):
+        """
+        Add the options of the rebuild.
+        """
+        parser.add_argument('--experiment', action='append', help='Only rebuild this experiment (can be repeated)')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Measurements read at once')
+
+    def handle(self, *args, **kwargs):
+        """
+        Rebuild the rollups one experiment per transaction.
+        """
+        experiments = Experiment.objects.order_by('identifier')
+        if kwargs['experiment']:
+            experiments = experiments.filter(identifier__in=kwargs['experiment'])
+        resolutions = ', '.join(f'{resolution}s' for resolution in get_rollup_resolutions()) or 'none'
+        self.stdout.write(f'Resolutions: {resolutions}')
+
+        for experiment in experiments:
+            created = rebuild_rollups(experiment, chunk_size=max(1, kwargs['chunk_size']))
+            self.stdout.write(f'{experiment.identifier}: {created} rollups')
+
+        self.stdout.write(self.style.SUCCESS('Measurement rollups rebuilt'))
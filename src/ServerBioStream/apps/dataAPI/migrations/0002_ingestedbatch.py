@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('experiment', models.CharField(default='', max_length=60)),
+                ('samples', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
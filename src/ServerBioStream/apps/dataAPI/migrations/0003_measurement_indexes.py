@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0002_ingestedbatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['experiment', 'type', 'timestamp'], name='measurement_exp_type_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['experiment', 'timestamp'], name='measurement_exp_ts'),
+        ),
+    ]
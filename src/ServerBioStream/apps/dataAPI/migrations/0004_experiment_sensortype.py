@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0003_measurement_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Experiment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.CharField(max_length=60, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SensorType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='experiment_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dataAPI.experiment'),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='type_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='dataAPI.sensortype'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+BATCH_SIZE = 50000
+
+
+def fill_dimensions(apps, schema_editor):
+    """
+    Point every measurement to its Experiment and SensorType. Rows are converted
+    by primary key ranges, each one in its own short transaction, so ingestion
+    and readers are never blocked for the whole table.
+    """
+    Measurement = apps.get_model("dataAPI", "Measurement")
+    Experiment = apps.get_model("dataAPI", "Experiment")
+    SensorType = apps.get_model("dataAPI", "SensorType")
+
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    measurements = quote(Measurement._meta.db_table)
+    experiments = quote(Experiment._meta.db_table)
+    sensor_types = quote(SensorType._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {experiments} (identifier) "
+            f"SELECT DISTINCT experiment FROM {measurements} "
+            f"WHERE experiment NOT IN (SELECT identifier FROM {experiments})"
+        )
+        cursor.execute(
+            f"INSERT INTO {sensor_types} (name) "
+            f"SELECT DISTINCT type FROM {measurements} "
+            f"WHERE type NOT IN (SELECT name FROM {sensor_types})"
+        )
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {measurements}")
+        first, last = cursor.fetchone()
+
+    if first is None:
+        return
+
+    for start in range(first, last + 1, BATCH_SIZE):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {measurements} SET "
+                f"experiment_ref_id = (SELECT id FROM {experiments} WHERE identifier = {measurements}.experiment), "
+                f"type_ref_id = (SELECT id FROM {sensor_types} WHERE name = {measurements}.type) "
+                f"WHERE id >= %s AND id < %s",
+                [start, start + BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+
+    # Commit every batch of fill_dimensions instead of one transaction for the table
+    atomic = False
+
+    dependencies = [
+        ("dataAPI", "0004_experiment_sensortype"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_dimensions, migrations.RunPython.noop),
+    ]
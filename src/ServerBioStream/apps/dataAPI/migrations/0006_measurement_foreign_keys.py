@@ -0,0 +1,84 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dataAPI", "0005_normalize_measurements"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="measurement",
+            name="measurement_exp_type_ts",
+        ),
+        migrations.RemoveIndex(
+            model_name="measurement",
+            name="measurement_exp_ts",
+        ),
+        migrations.RemoveField(
+            model_name="measurement",
+            name="experiment",
+        ),
+        migrations.RemoveField(
+            model_name="measurement",
+            name="type",
+        ),
+        # The filled columns are renamed in place. Making them NOT NULL would
+        # rebuild the whole table on SQLite (a copy of every row, in one
+        # transaction), so they stay nullable in the database; the ORM
+        # requires them and ingestion always sets both.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE "dataAPI_measurement" RENAME COLUMN "experiment_ref_id" TO "experiment_id"',
+                    'ALTER TABLE "dataAPI_measurement" RENAME COLUMN "experiment_id" TO "experiment_ref_id"',
+                ),
+                migrations.RunSQL(
+                    'ALTER TABLE "dataAPI_measurement" RENAME COLUMN "type_ref_id" TO "type_id"',
+                    'ALTER TABLE "dataAPI_measurement" RENAME COLUMN "type_id" TO "type_ref_id"',
+                ),
+            ],
+            state_operations=[
+                migrations.RenameField(
+                    model_name="measurement",
+                    old_name="experiment_ref",
+                    new_name="experiment",
+                ),
+                migrations.RenameField(
+                    model_name="measurement",
+                    old_name="type_ref",
+                    new_name="type",
+                ),
+                migrations.AlterField(
+                    model_name="measurement",
+                    name="experiment",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="measurements",
+                        to="dataAPI.experiment",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="measurement",
+                    name="type",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="measurements",
+                        to="dataAPI.sensortype",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="measurement",
+            index=models.Index(fields=["experiment", "type", "timestamp"], name="measurement_exp_type_ts"),
+        ),
+        migrations.AddIndex(
+            model_name="measurement",
+            index=models.Index(fields=["experiment", "timestamp"], name="measurement_exp_ts"),
+        ),
+    ]
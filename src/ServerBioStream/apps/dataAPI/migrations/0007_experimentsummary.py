@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def build_summaries(apps, schema_editor):
+    """
+    Summarize the measurements stored before summaries existed, one grouped
+    query per experiment.
+    """
+    Experiment = apps.get_model("dataAPI", "Experiment")
+    ExperimentSummary = apps.get_model("dataAPI", "ExperimentSummary")
+    Measurement = apps.get_model("dataAPI", "Measurement")
+    SensorType = apps.get_model("dataAPI", "SensorType")
+
+    type_names = dict(SensorType.objects.values_list("id", "name"))
+    for experiment_id in Experiment.objects.values_list("id", flat=True):
+        rows = (
+            Measurement.objects.filter(experiment_id=experiment_id)
+            .order_by()
+            .values("type_id")
+            .annotate(samples=Count("id"), start_date=Min("timestamp"), end_date=Max("timestamp"))
+        )
+        rows = list(rows)
+        if not rows:
+            continue
+        ExperimentSummary.objects.create(
+            experiment_id=experiment_id,
+            start_date=min(row["start_date"] for row in rows),
+            end_date=max(row["end_date"] for row in rows),
+            samples=sum(row["samples"] for row in rows),
+            type_counts={type_names[row["type_id"]]: row["samples"] for row in rows},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0006_measurement_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExperimentSummary',
+            fields=[
+                ('experiment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='dataAPI.experiment')),
+                ('start_date', models.DateTimeField(null=True)),
+                ('end_date', models.DateTimeField(null=True)),
+                ('samples', models.BigIntegerField(default=0)),
+                ('type_counts', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
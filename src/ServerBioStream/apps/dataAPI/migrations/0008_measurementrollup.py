@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0007_experimentsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('samples', models.IntegerField(default=0)),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('total', models.FloatField(default=0.0)),
+                ('total_squares', models.FloatField(default=0.0)),
+                ('experiment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='dataAPI.experiment')),
+                ('type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='rollups', to='dataAPI.sensortype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('experiment', 'type', 'resolution', 'bucket'), name='rollup_unique_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0008_measurementrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.BigIntegerField()),
+                ('end', models.BigIntegerField()),
+                ('samples', models.IntegerField()),
+                ('codec', models.CharField(max_length=20)),
+                ('data', models.BinaryField()),
+                ('experiment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='dataAPI.experiment')),
+                ('type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='segments', to='dataAPI.sensortype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['experiment', 'type', 'start'], name='segment_exp_type_start'), models.Index(fields=['experiment', 'start'], name='segment_exp_start')],
+            },
+        ),
+    ]
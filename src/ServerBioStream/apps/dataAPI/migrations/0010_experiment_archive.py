@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0009_measurementsegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='experimentsummary',
+            name='last_ingested',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+# Only PostgreSQL supports declarative partitioning; on the other databases the
+# measurements table is left as it is
+def partition_measurements(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    from apps.dataAPI.postgres import partition_measurements
+
+    partition_measurements(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataAPI', '0010_experiment_archive'),
+    ]
+
+    operations = [
+        # A partitioned table reads and writes like the plain one, so the
+        # reverse migration keeps it
+        migrations.RunPython(partition_measurements, migrations.RunPython.noop),
+    ]
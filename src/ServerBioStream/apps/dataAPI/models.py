@@ -2,12 +2,41 @@ from django.db import models
 from django.utils.timezone import get_current_timezone, now
 
 
+# Experiments (study cases), identified by the identifier sent by SmartBioStream
+class Experiment(models.Model):
+    identifier = models.CharField(max_length=60, unique=True)
+    # Samples moved from the live storage to an archive file (see apps.dataAPI.storage.tiered)
+    archived = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.identifier
+
+
+# Measurement types (heart_rate, acc-x, ...)
+class SensorType(models.Model):
+    name = models.CharField(max_length=60, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+# One sample. The experiment and type are integer foreign keys to small dimension
+# tables; their own indexes are left out because the composite indexes below
+# already start with the experiment.
 class Measurement(models.Model):
-    experiment = models.CharField(max_length=60, default="")
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, db_index=False, related_name="measurements")
     timestamp = models.DateTimeField(default=now)
-    type = models.CharField(max_length=60, default="")
+    type = models.ForeignKey(SensorType, on_delete=models.PROTECT, db_index=False, related_name="measurements")
     value = models.FloatField(default=0.0)
 
+    class Meta:
+        indexes = [
+            # Per type reads and time ranges of an experiment
+            models.Index(fields=["experiment", "type", "timestamp"], name="measurement_exp_type_ts"),
+            # Experiment listing (first/last timestamp) and full experiment reads
+            models.Index(fields=["experiment", "timestamp"], name="measurement_exp_ts"),
+        ]
+
     def __str__(self):
         return (
             "|timestamp: "
@@ -19,3 +48,113 @@ class Measurement(models.Model):
             + ", value: "
             + str(self.value)
         )
+
+
+# Data sends already stored, identified by the batch id sent by the client or by
+# the hash of their content, so retried uploads are detected with one index lookup
+class IngestedBatch(models.Model):
+    key = models.CharField(max_length=100, unique=True)
+    experiment = models.CharField(max_length=60, default="")
+    samples = models.IntegerField(default=0)
+    created = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return self.key + " (" + str(self.experiment) + ", " + str(self.samples) + " samples)"
+
+
+# Pre-computed overview of an experiment for the experiments list, kept up to
+# date by the ingestion (see apps.dataAPI.summaries)
+class ExperimentSummary(models.Model):
+    experiment = models.OneToOneField(Experiment, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+    start_date = models.DateTimeField(null=True)
+    end_date = models.DateTimeField(null=True)
+    samples = models.BigIntegerField(default=0)
+    # Number of samples of each measurement type: {"heart_rate": 120, ...}
+    type_counts = models.JSONField(default=dict)
+    # When the last data send was stored, to find idle experiments to archive
+    last_ingested = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return str(self.experiment) + " (" + str(self.samples) + " samples)"
+
+    @property
+    def types(self):
+        return sorted(self.type_counts)
+
+
+# Count, minimum, maximum, sum and sum of squares of the samples of an experiment
+# and type in the period of "resolution" seconds starting at "bucket" (UNIX ms).
+# Kept up to date by the ingestion at the resolutions of
+# MEASUREMENTS_ROLLUP_RESOLUTIONS (see apps.dataAPI.rollups).
+class MeasurementRollup(models.Model):
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, db_index=False, related_name="rollups")
+    type = models.ForeignKey(SensorType, on_delete=models.PROTECT, db_index=False, related_name="rollups")
+    resolution = models.IntegerField()
+    bucket = models.BigIntegerField()
+    samples = models.IntegerField(default=0)
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    total = models.FloatField(default=0.0)
+    total_squares = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["experiment", "type", "resolution", "bucket"], name="rollup_unique_bucket"),
+        ]
+
+    def __str__(self):
+        return str(self.experiment) + " " + str(self.type) + " " + str(self.resolution) + "s @" + str(self.bucket)
+
+
+# Samples of an experiment and type between "start" and "end" (UNIX ms, both
+# included), stored as compressed timestamp and value arrays by the "segments"
+# storage backend (see apps.dataAPI.storage.segments)
+class MeasurementSegment(models.Model):
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, db_index=False, related_name="segments")
+    type = models.ForeignKey(SensorType, on_delete=models.PROTECT, db_index=False, related_name="segments")
+    start = models.BigIntegerField()
+    end = models.BigIntegerField()
+    samples = models.IntegerField()
+    codec = models.CharField(max_length=20)
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            # Per type reads and appends to the last segment of a type
+            models.Index(fields=["experiment", "type", "start"], name="segment_exp_type_start"),
+            # Full experiment reads in time order
+            models.Index(fields=["experiment", "start"], name="segment_exp_start"),
+        ]
+
+    def __str__(self):
+        return str(self.experiment) + " " + str(self.type) + " (" + str(self.samples) + " samples)"
+
+
+# Deletion of an experiment run in the background (see apps.dataAPI.deletion):
+# its measurements are deleted in short transactions of a primary key range, so
+# the progress is shown while it runs and data sends are not blocked meanwhile
+class ExperimentDeletion(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    identifier = models.CharField(max_length=60)
+    experiment = models.ForeignKey(Experiment, on_delete=models.SET_NULL, null=True, related_name="deletions")
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    # Rows to delete (measurements, segments and rollups) and rows deleted so far
+    total = models.BigIntegerField(default=0)
+    deleted = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(default=now)
+    updated = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return self.identifier + " (" + self.status + ", " + str(self.deleted) + "/" + str(self.total) + ")"
+
+    @property
+    def progress(self):
+        if self.status == self.DONE:
+            return 100
+        return min(99, int(100 * self.deleted / self.total)) if self.total else 0
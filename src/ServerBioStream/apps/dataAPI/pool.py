@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_ASYNC_WORKERS = 4
+DEFAULT_ASYNC_MAX_PENDING = 1000
+
+executor = None
+executor_lock = threading.Lock()
+# Calls waiting for or running in the pool; only changed on the event loop
+pending = 0
+
+
+class PoolFull(Exception):
+    pass
+
+
+def get_async_workers():
+    return getattr(settings, "MEASUREMENTS_ASYNC_WORKERS", DEFAULT_ASYNC_WORKERS)
+
+
+def get_async_max_pending():
+    return getattr(settings, "MEASUREMENTS_ASYNC_MAX_PENDING", DEFAULT_ASYNC_MAX_PENDING)
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=get_async_workers(), thread_name_prefix="ingest")
+        return executor
+
+
+# Run in a pool thread, which keeps its database connection between calls as a
+# request would (closed when broken or older than CONN_MAX_AGE)
+def call_with_connection(func, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+"""
+Run the database work of an async view, func(*args), in the bounded pool of
+MEASUREMENTS_ASYNC_WORKERS threads and return its result. Raise PoolFull when
+MEASUREMENTS_ASYNC_MAX_PENDING calls are already waiting, so a slow database
+makes the watches retry later instead of piling up requests in memory.
+With 0 workers, it runs in Django's sync thread (sync_to_async).
+"""
+async def run_in_pool(func, *args):
+    global pending
+    if pending >= get_async_max_pending():
+        raise PoolFull(f"{pending} database calls pending")
+    pending += 1
+    try:
+        if not get_async_workers():
+            return await sync_to_async(func)(*args)
+        # In the context of the request, as sync_to_async does
+        call = partial(contextvars.copy_context().run, call_with_connection, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+    finally:
+        pending -= 1
@@ -0,0 +1,224 @@
+"""
+PostgreSQL specific parts of the measurements table: batches written with
+COPY FROM STDIN, and the table partitioned by month of "timestamp" (see the
+0011_measurement_partitions migration and "python manage.py
+create_measurement_partitions"). Every function here expects a PostgreSQL
+connection; callers check connection.vendor first.
+"""
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+from .models import Measurement
+
+# Monthly partitions created ahead of the current month
+DEFAULT_PARTITION_MONTHS_AHEAD = 3
+
+COPY_SPECIAL_VALUES = {float("inf"): "Infinity", float("-inf"): "-Infinity"}
+
+
+def quote(connection, name):
+    return connection.ops.quote_name(name)
+
+
+def measurement_table():
+    return Measurement._meta.db_table
+
+
+def column(name):
+    return Measurement._meta.get_field(name).column
+
+
+def get_partition_months_ahead():
+    return getattr(settings, "MEASUREMENTS_PARTITION_MONTHS_AHEAD", DEFAULT_PARTITION_MONTHS_AHEAD)
+
+
+"""
+Return the rows of a batch as the text format of COPY: one line per sample
+with the experiment, the timestamp (UTC, ms), the type and the value separated
+by tabs
+"""
+def copy_rows(experiment_id, dates, type_ids, values):
+    timestamps = np.datetime_as_string(np.asarray(dates, dtype="datetime64[ms]"), unit="ms").tolist()
+    values = np.asarray(values, dtype=np.float64)
+    texts = [repr(value) for value in values.tolist()]
+    if not np.isfinite(values).all():
+        texts = [COPY_SPECIAL_VALUES.get(value, text) for value, text in zip(values.tolist(), texts)]
+    return "".join(
+        f"{experiment_id}\t{timestamp}+00\t{type_id}\t{text}\n"
+        for timestamp, type_id, text in zip(timestamps, np.asarray(type_ids).tolist(), texts)
+    )
+
+
+"""
+Write the samples of an experiment with a single COPY FROM STDIN, which
+PostgreSQL parses and inserts much faster than multi-row INSERTs
+"""
+def copy_measurements(connection, experiment_id, dates, type_ids, values):
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    sql = "COPY {} ({}) FROM STDIN".format(
+        quote(connection, measurement_table()),
+        ", ".join(quote(connection, column(name)) for name in ("experiment", "timestamp", "type", "value")),
+    )
+    data = copy_rows(experiment_id, dates, type_ids, values)
+    with connection.cursor() as cursor:
+        if is_psycopg3:
+            with cursor.copy(sql) as copy:
+                copy.write(data)
+        else:
+            cursor.copy_expert(sql, io.StringIO(data))
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(moment):
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+"""
+Return the (start, end) of the months from the month of "first" to the month
+of "last", both included
+"""
+def month_ranges(first, last):
+    months = []
+    start = month_start(first)
+    while start <= last:
+        months.append((start, next_month(start)))
+        start = next_month(start)
+    return months
+
+
+def partition_name(start):
+    return f"{measurement_table()}_y{start.year:04d}m{start.month:02d}"
+
+
+def default_partition_name():
+    return f"{measurement_table()}_default"
+
+
+def is_partitioned(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+            "WHERE pg_class.relname = %s AND pg_class.relnamespace = current_schema()::regnamespace",
+            [measurement_table()],
+        )
+        return cursor.fetchone() is not None
+
+
+def existing_partitions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s AND parent.relnamespace = current_schema()::regnamespace",
+            [measurement_table()],
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+"""
+Create the partition of each month of "months" that does not exist yet. Samples
+of that month already in the default partition are moved to the new partition
+before it is attached, since PostgreSQL refuses to attach a range that the
+default partition holds rows of. Return the names of the partitions created.
+"""
+def create_partitions(connection, months):
+    table = quote(connection, measurement_table())
+    default = quote(connection, default_partition_name())
+    timestamp = quote(connection, column("timestamp"))
+    existing = existing_partitions(connection)
+    created = []
+    for start, end in months:
+        name = partition_name(start)
+        if name in existing:
+            continue
+        partition = quote(connection, name)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {default} WHERE {timestamp} >= %s AND {timestamp} < %s RETURNING *) "
+                f"INSERT INTO {partition} SELECT * FROM moved",
+                [start, end],
+            )
+            # Bounds are written literally: DDL statements take no parameters
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {partition} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        created.append(name)
+    return created
+
+
+"""
+Return the months from the first sample of "table" (or the current month) to
+"months_ahead" months after the current month, for create_partitions
+"""
+def months_to_partition(connection, months_ahead, table=None):
+    table = quote(connection, table or measurement_table())
+    timestamp = quote(connection, column("timestamp"))
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({timestamp}) FROM {table}")
+        first, = cursor.fetchone()
+    last = datetime.now(timezone.utc)
+    for _ in range(months_ahead):
+        last = next_month(last)
+    return month_ranges(min(first or last, datetime.now(timezone.utc)), last)
+
+
+"""
+Replace the measurements table with one partitioned by range of "timestamp":
+a partition per month, from the first stored sample to a few months ahead, and
+a default partition that takes the samples of any other month. The primary key
+becomes (id, timestamp), as the partition key must be part of it; the foreign
+keys and the indexes are kept. Run by the 0011_measurement_partitions migration.
+"""
+def partition_measurements(connection):
+    if is_partitioned(connection):
+        return
+    name = measurement_table()
+    table = quote(connection, name)
+    old_name = f"{name}_unpartitioned"
+    old = quote(connection, old_name)
+    sequence = quote(connection, f"{name}_id_partitioned_seq")
+    id_column, timestamp = quote(connection, column("id")), quote(connection, column("timestamp"))
+    indexes = [(index.name, [column(field) for field in index.fields]) for index in Measurement._meta.indexes]
+    foreign_keys = [
+        (column(field), Measurement._meta.get_field(field).related_model._meta.db_table)
+        for field in ("experiment", "type")
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        for index_name, _ in indexes:
+            cursor.execute(f"ALTER INDEX IF EXISTS {quote(connection, index_name)} RENAME TO {quote(connection, index_name + '_old')}")
+        cursor.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({timestamp})")
+        cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {table}.{id_column}")
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {id_column} SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({id_column}, {timestamp})")
+        for field_column, related_table in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {quote(connection, f'{name}_{field_column}_fk')} "
+                f"FOREIGN KEY ({quote(connection, field_column)}) REFERENCES {quote(connection, related_table)} (id) "
+                "DEFERRABLE INITIALLY DEFERRED"
+            )
+        for index_name, columns in indexes:
+            cursor.execute(
+                f"CREATE INDEX {quote(connection, index_name)} ON {table} "
+                f"({', '.join(quote(connection, index_column) for index_column in columns)})"
+            )
+        cursor.execute(f"CREATE TABLE {quote(connection, default_partition_name())} PARTITION OF {table} DEFAULT")
+
+    # The monthly partitions are created empty, then the samples are copied
+    create_partitions(connection, months_to_partition(connection, get_partition_months_ahead(), old_name))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+        cursor.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX({id_column}) FROM {old}), 0) + 1, false)")
+        cursor.execute(f"DROP TABLE {old}")
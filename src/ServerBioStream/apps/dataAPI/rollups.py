@@ -0,0 +1,261 @@
+"""
+Pre-aggregated statistics of the measurements (rollups).
+
+For every experiment and measurement type, MeasurementRollup stores the count,
+minimum, maximum, sum and sum of squares of the samples of each period of time
+at the resolutions of MEASUREMENTS_ROLLUP_RESOLUTIONS (1 s, 1 min and 1 h by
+default). The periods are aligned to the UNIX epoch. Rollups are added to by
+every stored data send and can be recomputed from the measurements with
+"python manage.py rebuild_measurement_rollups".
+
+Statistics over long periods are read from the coarsest resolution that divides
+the resolution requested instead of scanning the raw samples.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import MeasurementRollup
+from .storage import get_storage
+
+DEFAULT_RESOLUTIONS = (1, 60, 3600)
+DEFAULT_CHUNK_SIZE = 20000
+
+# Maximum number of periods returned by a query
+MAX_BUCKETS = 100000
+
+
+# Error raised for queries that cannot be answered
+class RollupError(ValueError):
+    pass
+
+
+"""
+Return the resolutions (seconds) maintained, from the finest to the coarsest
+"""
+def get_rollup_resolutions():
+    return sorted(set(getattr(settings, "MEASUREMENTS_ROLLUP_RESOLUTIONS", DEFAULT_RESOLUTIONS)))
+
+
+"""
+Aggregate samples per type and period of "resolution" seconds with NumPy.
+Returns a dict {(type id, bucket in ms): [samples, minimum, maximum, total,
+total of squares]} ordered by type and bucket.
+"""
+def aggregate(dates, type_ids, values, resolution):
+    if not len(dates):
+        return {}
+    step = resolution * 1000
+    buckets = dates // step * step
+    order = np.lexsort((buckets, type_ids))
+    buckets = buckets[order]
+    type_ids = type_ids[order]
+    values = values[order]
+
+    firsts = np.flatnonzero(np.r_[True, (buckets[1:] != buckets[:-1]) | (type_ids[1:] != type_ids[:-1])])
+    samples = np.diff(np.r_[firsts, len(values)])
+    minimums = np.minimum.reduceat(values, firsts)
+    maximums = np.maximum.reduceat(values, firsts)
+    totals = np.add.reduceat(values, firsts)
+    squares = np.add.reduceat(values * values, firsts)
+
+    return {
+        (type_id, bucket): [count, minimum, maximum, total, total_squares]
+        for type_id, bucket, count, minimum, maximum, total, total_squares in zip(
+            type_ids[firsts].tolist(),
+            buckets[firsts].tolist(),
+            samples.tolist(),
+            minimums.tolist(),
+            maximums.tolist(),
+            totals.tolist(),
+            squares.tolist(),
+        )
+    }
+
+
+def combine(first, second):
+    return [
+        first[0] + second[0],
+        min(first[1], second[1]),
+        max(first[2], second[2]),
+        first[3] + second[3],
+        first[4] + second[4],
+    ]
+
+
+def rollup_model(experiment_id, resolution, type_id, bucket, aggregates):
+    samples, minimum, maximum, total, total_squares = aggregates
+    return MeasurementRollup(
+        experiment_id=experiment_id,
+        type_id=type_id,
+        resolution=resolution,
+        bucket=bucket,
+        samples=samples,
+        minimum=minimum,
+        maximum=maximum,
+        total=total,
+        total_squares=total_squares,
+    )
+
+
+"""
+Add the aggregates of a stored batch (as returned by aggregate()) to the
+rollups of an experiment. Must run in the transaction of the batch, after the
+experiment summary is locked (see add_to_summary), so concurrent batches of the
+same experiment do not update the same rows at once.
+"""
+def add_rollups(experiment_id, resolution, aggregates):
+    if not aggregates:
+        return
+    buckets = [bucket for _, bucket in aggregates]
+    existing = MeasurementRollup.objects.filter(
+        experiment_id=experiment_id,
+        resolution=resolution,
+        type_id__in={type_id for type_id, _ in aggregates},
+        bucket__gte=min(buckets),
+        bucket__lte=max(buckets),
+    )
+    existing = {(rollup.type_id, rollup.bucket): rollup for rollup in existing}
+
+    created = []
+    updated = []
+    for (type_id, bucket), values in aggregates.items():
+        rollup = existing.get((type_id, bucket))
+        if rollup is None:
+            created.append(rollup_model(experiment_id, resolution, type_id, bucket, values))
+            continue
+        (
+            rollup.samples,
+            rollup.minimum,
+            rollup.maximum,
+            rollup.total,
+            rollup.total_squares,
+        ) = combine(
+            [rollup.samples, rollup.minimum, rollup.maximum, rollup.total, rollup.total_squares], values
+        )
+        updated.append(rollup)
+
+    MeasurementRollup.objects.bulk_create(created, batch_size=500)
+    MeasurementRollup.objects.bulk_update(
+        updated, ["samples", "minimum", "maximum", "total", "total_squares"], batch_size=500
+    )
+
+
+"""
+Recompute the rollups of an experiment from its stored samples. Each type is
+read in timestamp order, so every period but the last one of each chunk is complete
+and written right away.
+"""
+def rebuild_rollups(experiment, chunk_size=DEFAULT_CHUNK_SIZE):
+    resolutions = get_rollup_resolutions()
+    created = 0
+    with transaction.atomic():
+        MeasurementRollup.objects.filter(experiment=experiment).delete()
+        if not resolutions:
+            return created
+
+        storage = get_storage()
+        for type_id in sorted(storage.type_statistics(experiment.id)):
+            pending = {}
+            for _, dates, type_column, values in storage.read([experiment.id], [type_id], chunk_size=chunk_size):
+                rollups = []
+                for resolution in resolutions:
+                    items = list(aggregate(dates, type_column, values, resolution).items())
+                    last = pending.get(resolution)
+                    if last is not None and last[0] == items[0][0]:
+                        items[0] = (last[0], combine(last[1], items[0][1]))
+                    elif last is not None:
+                        items.insert(0, last)
+                    pending[resolution] = items.pop()
+                    rollups.extend(
+                        rollup_model(experiment.id, resolution, type_id, bucket, aggregates)
+                        for (_, bucket), aggregates in items
+                    )
+                MeasurementRollup.objects.bulk_create(rollups, batch_size=500)
+                created += len(rollups)
+
+            MeasurementRollup.objects.bulk_create(
+                [
+                    rollup_model(experiment.id, resolution, type_id, bucket, aggregates)
+                    for resolution, ((_, bucket), aggregates) in pending.items()
+                ],
+                batch_size=500,
+            )
+            created += len(pending)
+    return created
+
+
+"""
+Return the rollup resolution used to answer a query at "resolution" seconds:
+the coarsest one that divides it, or None when no rollup fits
+"""
+def choose_resolution(resolution):
+    usable = [tier for tier in get_rollup_resolutions() if tier <= resolution and resolution % tier == 0]
+    return usable[-1] if usable else None
+
+
+"""
+Statistics of the samples of an experiment and type per period of "resolution"
+seconds in [start, end) (UNIX ms). "start" is moved back to the beginning of its
+period; "end" is not moved, but rollups are read whole, so when they are used
+the last period also counts the samples of its rollups at or after "end". Read
+from the rollups when a resolution fits and from the raw samples otherwise.
+
+Returns the resolution read (None for the raw samples) and a list of
+{"bucket", "samples", "min", "max", "mean", "std", "sum"} ordered by period.
+"""
+def query_rollups(experiment_id, type_id, start, end, resolution):
+    if resolution < 1:
+        raise RollupError("resolution must be at least 1 second")
+    step = resolution * 1000
+    start = start // step * step
+    if (end - start) // step > MAX_BUCKETS:
+        raise RollupError(f"The query spans more than {MAX_BUCKETS} periods; use a coarser resolution")
+
+    tier = choose_resolution(resolution)
+    if tier is None:
+        periods = {}
+        for _, dates, type_ids, values in get_storage().read([experiment_id], [type_id], start, end):
+            chunk = aggregate(dates, type_ids, values, resolution)
+            for key, aggregates in chunk.items():
+                periods[key] = combine(periods[key], aggregates) if key in periods else aggregates
+        rows = [[bucket, *aggregates] for (_, bucket), aggregates in periods.items()]
+    else:
+        rows = list(
+            MeasurementRollup.objects.filter(
+                experiment_id=experiment_id,
+                type_id=type_id,
+                resolution=tier,
+                bucket__gte=start,
+                bucket__lt=end,
+            )
+            .order_by("bucket")
+            .values_list("bucket", "samples", "minimum", "maximum", "total", "total_squares")
+        )
+
+    if not rows:
+        return tier, []
+
+    columns = np.array(rows, dtype=np.float64)
+    buckets = columns[:, 0].astype(np.int64) // step * step
+    firsts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    samples = np.add.reduceat(columns[:, 1], firsts)
+    minimums = np.minimum.reduceat(columns[:, 2], firsts)
+    maximums = np.maximum.reduceat(columns[:, 3], firsts)
+    totals = np.add.reduceat(columns[:, 4], firsts)
+    squares = np.add.reduceat(columns[:, 5], firsts)
+    means = totals / samples
+    deviations = np.sqrt(np.maximum(squares / samples - means * means, 0))
+
+    return tier, [
+        {"bucket": bucket, "samples": int(count), "min": minimum, "max": maximum, "mean": mean, "std": std, "sum": total}
+        for bucket, count, minimum, maximum, mean, std, total in zip(
+            buckets[firsts].tolist(),
+            samples.tolist(),
+            minimums.tolist(),
+            maximums.tolist(),
+            means.tolist(),
+            deviations.tolist(),
+            totals.tolist(),
+        )
+    ]
@@ -1,15 +1,12 @@
-from datetime import datetime
-
-from django.db import IntegrityError
-from django.utils.timezone import get_current_timezone
 from rest_framework import serializers
 
-from .models import Measurement
+from .ingestion import MeasurementBatch, ingest_batch
+from .storage.base import MAX_MILLIS, MIN_MILLIS
 
 
 # Serialize each measurement of the measurements lists 
 class GroupSerializer(serializers.Serializer):
-    date = serializers.IntegerField()
+    date = serializers.IntegerField(min_value=MIN_MILLIS, max_value=MAX_MILLIS)
     type = serializers.CharField()
     value = serializers.FloatField()
 
@@ -18,30 +15,10 @@ class MeasurementsSerializer(serializers.Serializer):
     identifier = serializers.CharField()
     measurements = serializers.ListField(child=GroupSerializer())
 
-    # Create and return a new Measurement instance
-    def create(self, validated_data):
+    # Store the measurements with chunked bulk inserts and return the ingestion report
+    def create(self, validated_data, chunk_size=None):
         identifier = validated_data.get("identifier", None)
         data = validated_data.get("measurements", None)
-        actual_time_zone = get_current_timezone()
-
-        # For each measurement
-        for element in data:
-            time = datetime.fromtimestamp(
-                int(element["date"]) / 1000, tz=actual_time_zone
-            )
-
-            model = Measurement(
-                experiment=identifier,
-                timestamp=time,
-                value=element["value"],
-                type=element["type"],
-            )
 
-            try:
-                model.save()
-            except IntegrityError as e:
-                # Catches integrity exception, which may occur if there is a unique constraint violation (e.g. duplicate unique key).
-                print(f"Could not save the model instance. Reason:  {e}")
-            except Exception as e:
-                # Captures other general exceptions
-                print(f"Error when trying to save the model instance. Reason: {e}")
+        batch = MeasurementBatch.from_measurements(identifier, data)
+        return ingest_batch(batch, chunk_size=chunk_size)
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .ingestion import MeasurementBatch
+
+DEFAULT_MAX_DEPTH = 10000
+DEFAULT_RETRY_AFTER = 5
+
+INGEST_SYNC = "sync"
+INGEST_SPOOL = "spool"
+
+
+# Durable FIFO of validated data sends, stored in its own SQLite file in WAL mode
+# so appending a batch never waits for the writes to the Measurement table.
+# Batches are appended by the send endpoint and removed by a single writer
+# process (manage.py drain_ingest_spool) once they are committed.
+class IngestSpool:
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    # One connection per thread, in autocommit mode
+    @property
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "identifier TEXT NOT NULL, "
+                "samples INTEGER NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "key TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS failed_batches ("
+                "id INTEGER PRIMARY KEY, "
+                "identifier TEXT NOT NULL, "
+                "samples INTEGER NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "key TEXT, "
+                "error TEXT NOT NULL, "
+                "failed REAL NOT NULL)"
+            )
+            self.local.connection = connection
+        return connection
+
+    # Append a batch and return its position in the spool
+    def append(self, batch):
+        payload = json.dumps(batch.to_lists(), separators=(",", ":"))
+        cursor = self.connection.execute(
+            "INSERT INTO batches (identifier, samples, payload, created, key) VALUES (?, ?, ?, ?, ?)",
+            (batch.identifier, len(batch), payload, time.time(), batch.key),
+        )
+        return cursor.lastrowid
+
+    # Number of pending batches. Batches are removed oldest first, so the ids
+    # still in the spool are contiguous and the depth is read from the primary key.
+    def depth(self):
+        first, last = self.connection.execute("SELECT MIN(id), MAX(id) FROM batches").fetchone()
+        if first is None:
+            return 0
+        return last - first + 1
+
+    # Oldest pending batches, up to "limit" batches or "max_samples" samples
+    def peek(self, limit=100, max_samples=None):
+        rows = self.connection.execute(
+            "SELECT id, identifier, samples, payload, key FROM batches ORDER BY id LIMIT ?", (limit,)
+        )
+        batches = []
+        total = 0
+        for spool_id, identifier, samples, payload, key in rows:
+            if batches and max_samples is not None and total + samples > max_samples:
+                break
+            dates, types, values = json.loads(payload)
+            batches.append((spool_id, MeasurementBatch(identifier, dates, types, values, key)))
+            total += samples
+        return batches
+
+    # Remove the batches that have been written to the database
+    def acknowledge(self, spool_ids):
+        if not spool_ids:
+            return
+        self.connection.execute(
+            "DELETE FROM batches WHERE id BETWEEN ? AND ?", (min(spool_ids), max(spool_ids))
+        )
+
+    # Move a batch that cannot be written to the failed_batches table, with the
+    # error, so the batches behind it are drained. It must be the oldest pending
+    # batch, as the depth relies on the ids of the spool being contiguous.
+    def reject(self, spool_id, error):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute(
+                "INSERT INTO failed_batches (id, identifier, samples, payload, created, key, error, failed) "
+                "SELECT id, identifier, samples, payload, created, key, ?, ? FROM batches WHERE id = ?",
+                (str(error), time.time(), spool_id),
+            )
+            self.connection.execute("DELETE FROM batches WHERE id = ?", (spool_id,))
+
+    # Number of batches moved to the failed_batches table
+    def failed(self):
+        return self.connection.execute("SELECT COUNT(*) FROM failed_batches").fetchone()[0]
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+spools = {}
+spools_lock = threading.Lock()
+
+
+"""
+Return the spool configured in MEASUREMENTS_SPOOL_PATH (shared by the whole process)
+"""
+def get_spool():
+    path = str(getattr(settings, "MEASUREMENTS_SPOOL_PATH", settings.BASE_DIR / "ingest_spool.sqlite3"))
+    with spools_lock:
+        if path not in spools:
+            spools[path] = IngestSpool(path)
+        return spools[path]
+
+
+def get_ingest_mode():
+    return getattr(settings, "MEASUREMENTS_INGEST_MODE", INGEST_SYNC)
+
+
+def get_max_depth():
+    return getattr(settings, "MEASUREMENTS_SPOOL_MAX_DEPTH", DEFAULT_MAX_DEPTH)
+
+
+def get_retry_after():
+    return getattr(settings, "MEASUREMENTS_SPOOL_RETRY_AFTER", DEFAULT_RETRY_AFTER)
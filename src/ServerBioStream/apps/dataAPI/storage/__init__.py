@@ -0,0 +1,54 @@
+"""
+Storage of the measurement samples.
+
+Ingestion and the viewData queries read and write samples through a storage
+backend selected with MEASUREMENTS_STORAGE:
+
+    orm        one Measurement row per sample (default)
+    segments   per experiment and type segments of compressed timestamp and
+               value arrays stored as BLOBs in MeasurementSegment
+
+Samples are exchanged as NumPy arrays: timestamps in UNIX ms (int64), type and
+experiment ids (int64) and values (float64). Switching backends does not move
+the samples already stored; use "python manage.py migrate_measurement_storage".
+
+Experiments idle for a while can be moved out of the live backend to archive
+files ("python manage.py archive_experiments"); get_storage routes every
+experiment to the tier that holds it (see tiered).
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .archive import ArchiveStorage
+from .base import MeasurementStorage
+from .tiered import TieredStorage
+
+DEFAULT_STORAGE = "orm"
+
+BACKENDS = {
+    "orm": "apps.dataAPI.storage.orm.ORMStorage",
+    "segments": "apps.dataAPI.storage.segments.SegmentStorage",
+}
+
+backends = {}
+tiers = {}
+
+
+"""
+Return a storage backend by name (or dotted path of a MeasurementStorage subclass)
+"""
+def get_backend(name):
+    if name not in backends:
+        backends[name] = import_string(BACKENDS.get(name, name))()
+    return backends[name]
+
+
+"""
+Return the storage of the samples: the backend configured in MEASUREMENTS_STORAGE
+for the live experiments and the archive files for the archived ones
+"""
+def get_storage():
+    name = getattr(settings, "MEASUREMENTS_STORAGE", DEFAULT_STORAGE)
+    if name not in tiers:
+        tiers[name] = TieredStorage(get_backend(name), ArchiveStorage())
+    return tiers[name]
@@ -0,0 +1,192 @@
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .base import DEFAULT_CHUNK_SIZE, MeasurementStorage
+from .codec import decode, encode
+from .segments import Samples, get_segment_samples, merge_segments
+
+MAGIC = b"BSARCH01"
+
+# Index offset, number of segments and magic, at the end of the file
+FOOTER = struct.Struct("<QQ8s")
+
+# One row per segment of the file
+INDEX_DTYPE = np.dtype(
+    [
+        ("type", "<i8"),
+        ("start", "<i8"),
+        ("end", "<i8"),
+        ("samples", "<i8"),
+        ("offset", "<i8"),
+        ("length", "<i8"),
+        ("codec", "S20"),
+    ]
+)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+"""
+Return the directory of the archive files
+"""
+def get_archive_path():
+    return Path(getattr(settings, "MEASUREMENTS_ARCHIVE_PATH", settings.BASE_DIR / "archive"))
+
+
+# Samples of archived experiments, one read-only file per experiment: the
+# segments of each type (encoded as in the segments backend, see codec), then an
+# index of the segments and a footer pointing to it. Files are memory-mapped to
+# read, so only the segments of the requested types and time range are touched.
+# The files are written whole by "create"; see TieredStorage for how experiments
+# are moved in and out of the archive.
+class ArchiveStorage(MeasurementStorage):
+    name = "archive"
+
+    def path(self, experiment_id):
+        return get_archive_path() / f"experiment-{experiment_id}.bsa"
+
+    def exists(self, experiment_id):
+        return self.path(experiment_id).exists()
+
+    """
+    Write the samples of an experiment, given as chunks of MeasurementStorage.read
+    in time order (or type by type), to its archive file, replacing it. Return the
+    number of samples written.
+    """
+    def create(self, experiment_id, chunks):
+        path = self.path(experiment_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        max_samples = get_segment_samples()
+        pending = {}
+        index = []
+
+        try:
+            with open(temporary, "wb") as output:
+                output.write(MAGIC)
+                for _, dates, type_ids, values in chunks:
+                    for type_id in np.unique(type_ids).tolist():
+                        selected = type_ids == type_id
+                        samples = pending.setdefault(type_id, Samples())
+                        samples.extend(dates[selected], type_ids[selected], values[selected])
+                        while len(samples) >= max_samples:
+                            self.write_segment(output, index, samples.pop_chunk(experiment_id, max_samples))
+                for samples in pending.values():
+                    if len(samples):
+                        self.write_segment(output, index, samples.pop_chunk(experiment_id, len(samples)))
+
+                index_offset = output.tell()
+                output.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+                output.write(FOOTER.pack(index_offset, len(index), MAGIC))
+                output.flush()
+                os.fsync(output.fileno())
+            os.replace(temporary, path)
+        finally:
+            temporary.unlink(missing_ok=True)
+        return sum(row[3] for row in index)
+
+    def write_segment(self, output, index, chunk):
+        _, dates, type_ids, values = chunk
+        codec, data = encode(dates, values)
+        index.append((int(type_ids[0]), int(dates[0]), int(dates[-1]), len(dates), output.tell(), len(data), codec))
+        output.write(data)
+
+    # Yield the index and the memory map of the file of an experiment, or
+    # (None, None) when it has no file
+    @contextmanager
+    def mapped(self, experiment_id):
+        try:
+            file = open(self.path(experiment_id), "rb")
+        except FileNotFoundError:
+            yield None, None
+            return
+        with file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < len(MAGIC) + FOOTER.size or mapped[:len(MAGIC)] != MAGIC:
+                raise ArchiveError(f"{file.name} is not an archive file")
+            index_offset, segments, magic = FOOTER.unpack_from(mapped, len(mapped) - FOOTER.size)
+            if magic != MAGIC:
+                raise ArchiveError(f"{file.name} is truncated")
+            yield np.frombuffer(mapped, dtype=INDEX_DTYPE, count=segments, offset=index_offset).copy(), mapped
+
+    def select(self, index, type_ids=None, start=None, end=None):
+        selected = np.ones(len(index), dtype=bool)
+        if type_ids is not None:
+            selected &= np.isin(index["type"], list(type_ids))
+        if start is not None:
+            selected &= index["end"] >= start
+        if end is not None:
+            selected &= index["start"] < end
+        return index[selected]
+
+    def read(self, experiment_ids, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        for experiment_id in sorted(experiment_ids):
+            with self.mapped(experiment_id) as (index, mapped):
+                if index is None:
+                    continue
+                rows = self.select(index, type_ids, start, end)
+                rows = rows[np.argsort(rows["start"], kind="stable")]
+
+                def decode_row(row):
+                    data = mapped[row["offset"]:row["offset"] + row["length"]]
+                    return decode(row["codec"].decode(), data, int(row["samples"]))
+
+                yield from merge_segments(
+                    experiment_id,
+                    ((int(row["start"]), int(row["type"]), row) for row in rows),
+                    decode_row,
+                    start,
+                    end,
+                    chunk_size,
+                )
+
+    def count(self, experiment_ids, type_ids=None, start=None, end=None):
+        if start is not None or end is not None:
+            return super().count(experiment_ids, type_ids, start, end)
+        samples = 0
+        for experiment_id in experiment_ids:
+            with self.mapped(experiment_id) as (index, _):
+                if index is not None:
+                    samples += int(self.select(index, type_ids)["samples"].sum())
+        return samples
+
+    def type_statistics(self, experiment_id):
+        with self.mapped(experiment_id) as (index, _):
+            if index is None:
+                return {}
+        statistics = {}
+        for type_id in np.unique(index["type"]).tolist():
+            rows = index[index["type"] == type_id]
+            statistics[type_id] = (int(rows["samples"].sum()), int(rows["start"].min()), int(rows["end"].max()))
+        return statistics
+
+    # The files are removed when the transaction commits, so a rollback keeps them
+    def delete(self, experiment_ids):
+        for experiment_id in experiment_ids:
+            path = self.path(experiment_id)
+            transaction.on_commit(lambda path=path: path.unlink(missing_ok=True))
+
+    # The file is written again without the duplicates, if there are any
+    def deduplicate(self, experiment_id, dry_run=False, chunk_size=400):
+        deleted = sum(removed for removed, _ in self.unique_chunks(experiment_id))
+        if deleted and not dry_run:
+            self.create(experiment_id, (chunk for _, chunk in self.unique_chunks(experiment_id)))
+        return deleted
+
+    # Type by type, the chunks of an experiment without the samples that repeat
+    # the timestamp of the previous one, and how many were left out
+    def unique_chunks(self, experiment_id):
+        for type_id in sorted(self.type_statistics(experiment_id)):
+            last_date = None
+            for experiment_ids, dates, type_ids, values in self.read([experiment_id], [type_id]):
+                keep = np.r_[dates[0] != last_date, dates[1:] != dates[:-1]]
+                last_date = dates[-1]
+                yield len(dates) - int(keep.sum()), (experiment_ids[keep], dates[keep], type_ids[keep], values[keep])
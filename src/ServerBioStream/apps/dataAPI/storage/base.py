@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 20000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def to_millis(moment):
+    return (moment - EPOCH) // MILLISECOND
+
+
+def from_millis(millis):
+    return EPOCH + int(millis) * MILLISECOND
+
+
+# Range of the timestamps that can be stored (the range of datetime), in UNIX ms
+MIN_MILLIS = to_millis(datetime.min.replace(tzinfo=timezone.utc))
+MAX_MILLIS = to_millis(datetime.max.replace(tzinfo=timezone.utc))
+
+
+# Interface of the storage backends of the measurement samples. Time ranges are
+# [start, end) in UNIX ms, None meaning unbounded; "type_ids" None means every type.
+class MeasurementStorage:
+    name = None
+
+    # Store samples of one experiment. Called inside the transaction (and
+    # savepoint) of the ingestion, so a failure rolls the samples back.
+    def write(self, experiment_id, dates, type_ids, values):
+        raise NotImplementedError
+
+    # Iterate the samples of some experiments in chunks of arrays
+    # (experiment ids, timestamps, type ids, values), ordered by experiment id
+    # and timestamp
+    def read(self, experiment_ids, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        raise NotImplementedError
+
+    # Number of samples matching a read
+    def count(self, experiment_ids, type_ids=None, start=None, end=None):
+        return sum(len(chunk[0]) for chunk in self.read(experiment_ids, type_ids, start, end))
+
+    # {type id: (samples, first timestamp, last timestamp)} of an experiment
+    def type_statistics(self, experiment_id):
+        statistics = {}
+        for _, dates, type_ids, _ in self.read([experiment_id]):
+            for type_id in np.unique(type_ids).tolist():
+                selected = dates[type_ids == type_id]
+                samples, first, last = statistics.get(type_id, (0, selected[0], selected[-1]))
+                statistics[type_id] = (samples + len(selected), min(first, selected[0]), max(last, selected[-1]))
+        return {type_id: (samples, int(first), int(last)) for type_id, (samples, first, last) in statistics.items()}
+
+    # Delete every sample of some experiments
+    def delete(self, experiment_ids):
+        raise NotImplementedError
+
+    # Delete the samples with the same type and timestamp as an earlier one,
+    # and return how many there were (only counted with dry_run). "chunk_size"
+    # bounds the samples deleted per transaction where the backend deletes rows.
+    def deduplicate(self, experiment_id, dry_run=False, chunk_size=400):
+        raise NotImplementedError
+
+    # Queryset of Measurement rows for backends that store them, so queries can
+    # run in the database (keyset pagination, search); None for the others
+    def queryset(self, experiment_ids):
+        return None
+
+
+"""
+Group rows of (experiment id, timestamp, type id, value) with datetimes into
+chunks of arrays as returned by MeasurementStorage.read
+"""
+def rows_to_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield rows_to_arrays(chunk)
+            chunk = []
+    if chunk:
+        yield rows_to_arrays(chunk)
+
+
+def rows_to_arrays(rows):
+    experiment_ids, timestamps, type_ids, values = zip(*rows)
+    return (
+        np.fromiter(experiment_ids, dtype=np.int64, count=len(rows)),
+        np.fromiter((to_millis(timestamp) for timestamp in timestamps), dtype=np.int64, count=len(rows)),
+        np.fromiter(type_ids, dtype=np.int64, count=len(rows)),
+        np.fromiter(values, dtype=np.float64, count=len(rows)),
+    )
@@ -0,0 +1,214 @@
+"""
+Encodings of the samples (timestamps in ms and values) of a measurement segment.
+
+"dod-xor" stores the delta-of-delta of the timestamps, which is mostly zero or
+close to it for regularly sampled sensors. The values are stored, in the first
+form that represents all of them exactly, as:
+
+- delta-encoded integers, when they are decimals with a few digits;
+- the XOR of consecutive float32 words (Gorilla style) and the digits of each
+  value, when they are the shortest decimals of float32 numbers, as the
+  Android sensors read and SmartBioStream sends them;
+- the XOR of consecutive float64 words otherwise.
+
+Integers are stored in the smallest width that fits and every array has its
+bytes shuffled into planes, so zlib compresses the runs of zero bytes. Every
+step is vectorized with NumPy and the encoding is lossless.
+
+"zlib" (delta timestamps and raw float64 values) compresses less but is faster
+to encode, so it is used for the segments that are still being filled and are
+rewritten with every data send.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+ZLIB = "zlib"
+DOD_XOR = "dod-xor"
+DEFAULT_CODEC = DOD_XOR
+
+# First timestamp, bytes per timestamp delta-of-delta, bytes per value and
+# decimal digits of the values, or one of the XOR forms below
+HEADER = struct.Struct("<qBBb")
+FLOAT64_WORDS = -1
+FLOAT32_WORDS = -2
+
+MAX_DIGITS = 9
+# 10 ** 22 is the largest power of ten that is exact in float64
+MAX_FLOAT32_DIGITS = 22
+MAX_EXACT_INTEGER = 2 ** 53
+
+
+class CodecError(ValueError):
+    pass
+
+
+def integer_dtype(array):
+    for dtype in (np.int8, np.int16, np.int32):
+        limits = np.iinfo(dtype)
+        if not len(array) or (array.min() >= limits.min and array.max() <= limits.max):
+            return np.dtype(dtype).newbyteorder("<")
+    return np.dtype("<i8")
+
+
+"""
+Split the bytes of an array into planes (all the first bytes, then all the
+second bytes...), so the high bytes of small numbers become runs of zeros
+"""
+def shuffle(array):
+    return np.ascontiguousarray(array).view(np.uint8).reshape(-1, array.itemsize).T.tobytes()
+
+
+def unshuffle(data, dtype, count, offset=0):
+    planes = np.frombuffer(data, dtype=np.uint8, count=count * dtype.itemsize, offset=offset)
+    return planes.reshape(dtype.itemsize, count).T.copy().view(dtype).reshape(count)
+
+
+"""
+Return the fewest decimal digits that represent every value exactly as an
+integer divided by a power of ten, or None when there is no such number
+"""
+def decimal_digits(values):
+    if not np.isfinite(values).all():
+        return None
+    bits = values.view(np.uint64)
+    for digits in range(MAX_DIGITS + 1):
+        scaled = np.round(values * 10.0 ** digits)
+        if np.abs(scaled).max(initial=0) >= MAX_EXACT_INTEGER:
+            return None
+        # Compared bit by bit, so -0.0 is kept as a XOR word
+        if np.array_equal((scaled.astype(np.int64) / 10.0 ** digits).view(np.uint64), bits):
+            return digits
+    return None
+
+
+"""
+Return the decimal digits of each value when every value is the decimal with
+those digits closest to a float32 number (as the shortest decimals of float32
+numbers are), or None
+"""
+def float32_digits(values):
+    with np.errstate(over="ignore", invalid="ignore"):
+        floats = values.astype(np.float32)
+    digits = np.zeros(len(values), dtype=np.int8)
+    pending = np.arange(len(values))
+    # Negative digits round to tens, hundreds... for large numbers
+    for candidate in [*range(MAX_FLOAT32_DIGITS + 1), *range(-1, -MAX_FLOAT32_DIGITS - 1, -1)]:
+        decoded = float32_to_decimals(floats[pending], candidate)
+        found = decoded.view(np.uint64) == values[pending].view(np.uint64)
+        digits[pending[found]] = candidate
+        pending = pending[~found]
+        if not len(pending):
+            return digits
+    return None
+
+
+def float32_to_decimals(floats, digits):
+    digits = np.asarray(digits)
+    # Only the non-negative powers of ten are exact
+    scale = 10.0 ** np.abs(digits).astype(np.float64)
+    floats = floats.astype(np.float64)
+    with np.errstate(over="ignore", invalid="ignore"):
+        return np.where(digits >= 0, np.round(floats * scale) / scale, np.round(floats / scale) * scale)
+
+
+def xor_words(words):
+    return words ^ np.concatenate((np.zeros(1, dtype=words.dtype), words[:-1]))
+
+
+"""
+Return the encodings (digits or XOR form, bytes per value, bytes) that represent
+the values exactly
+"""
+def encode_values(values):
+    encodings = []
+    digits = decimal_digits(values)
+    if digits is not None:
+        integers = np.round(values * 10.0 ** digits).astype(np.int64)
+        encoded = np.diff(integers, prepend=0)
+        value_dtype = integer_dtype(encoded)
+        encodings.append((digits, value_dtype.itemsize, shuffle(encoded.astype(value_dtype))))
+    float32_decimals = float32_digits(values)
+    if float32_decimals is not None:
+        words = xor_words(values.astype(np.float32).view(np.uint32))
+        encodings.append((FLOAT32_WORDS, 4, shuffle(words) + float32_decimals.tobytes()))
+    if not encodings:
+        encodings.append((FLOAT64_WORDS, 8, shuffle(xor_words(values.view(np.uint64)))))
+    return encodings
+
+
+def encode_dod_xor(dates, values):
+    dates = np.asarray(dates, dtype=np.int64)
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    deltas = np.diff(dates, prepend=dates[:1])
+    dod = np.diff(deltas, prepend=0)
+    date_dtype = integer_dtype(dod)
+    start = int(dates[0]) if len(dates) else 0
+    encoded_dates = shuffle(dod.astype(date_dtype))
+
+    # Decimals of float32 numbers may fit both forms: keep the smallest
+    return min(
+        (
+            zlib.compress(HEADER.pack(start, date_dtype.itemsize, value_size, digits) + encoded_dates + encoded)
+            for digits, value_size, encoded in encode_values(values)
+        ),
+        key=len,
+    )
+
+
+def decode_dod_xor(data, samples):
+    raw = zlib.decompress(data)
+    start, date_size, value_size, digits = HEADER.unpack_from(raw)
+    date_dtype = np.dtype(f"<i{date_size}")
+    dod = unshuffle(raw, date_dtype, samples, HEADER.size).astype(np.int64)
+    dates = start + np.cumsum(np.cumsum(dod), dtype=np.int64)
+
+    offset = HEADER.size + samples * date_size
+    if digits == FLOAT64_WORDS:
+        words = unshuffle(raw, np.dtype("<u8"), samples, offset)
+        values = np.bitwise_xor.accumulate(words).view(np.float64)
+    elif digits == FLOAT32_WORDS:
+        words = unshuffle(raw, np.dtype("<u4"), samples, offset)
+        float32_decimals = np.frombuffer(raw, dtype=np.int8, count=samples, offset=offset + 4 * samples)
+        values = float32_to_decimals(np.bitwise_xor.accumulate(words).view(np.float32), float32_decimals)
+    else:
+        encoded = unshuffle(raw, np.dtype(f"<i{value_size}"), samples, offset).astype(np.int64)
+        values = np.cumsum(encoded) / 10.0 ** digits
+    return dates, values
+
+
+def encode_zlib(dates, values):
+    deltas = np.diff(dates, prepend=dates[:1]).astype("<i8")
+    return zlib.compress(deltas.tobytes() + np.asarray(values, dtype="<f8").tobytes())
+
+
+def decode_zlib(data, samples, start):
+    raw = zlib.decompress(data)
+    deltas = np.frombuffer(raw, dtype="<i8", count=samples)
+    values = np.frombuffer(raw, dtype="<f8", count=samples, offset=8 * samples)
+    return start + np.cumsum(deltas, dtype=np.int64), values.astype(np.float64)
+
+
+"""
+Encode sorted timestamps (ms) and their values, and return the codec and the bytes
+"""
+def encode(dates, values, codec=DEFAULT_CODEC):
+    if codec == DOD_XOR:
+        return codec, encode_dod_xor(dates, values)
+    if codec == ZLIB:
+        return codec, encode_zlib(dates, values)
+    raise CodecError(f"Unknown segment codec: {codec}")
+
+
+"""
+Decode the timestamps and values of "samples" samples encoded with "codec".
+"start" is the first timestamp, which the "zlib" codec does not store.
+"""
+def decode(codec, data, samples, start=0):
+    data = bytes(data)
+    if codec == DOD_XOR:
+        return decode_dod_xor(data, samples)
+    if codec == ZLIB:
+        return decode_zlib(data, samples, start)
+    raise CodecError(f"Unknown segment codec: {codec}")
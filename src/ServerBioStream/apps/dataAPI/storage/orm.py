@@ -0,0 +1,92 @@
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+
+from ..models import Measurement
+from ..postgres import copy_measurements
+from .base import DEFAULT_CHUNK_SIZE, MeasurementStorage, from_millis, rows_to_chunks, to_millis
+
+
+# One Measurement row per sample, read through the (experiment, type, timestamp)
+# and (experiment, timestamp) indexes
+class ORMStorage(MeasurementStorage):
+    name = "orm"
+
+    # COPY FROM STDIN on PostgreSQL, bulk INSERTs on the other databases
+    def write(self, experiment_id, dates, type_ids, values):
+        if connection.vendor == "postgresql":
+            copy_measurements(connection, experiment_id, dates, type_ids, values)
+            return
+        Measurement.objects.bulk_create(
+            [
+                Measurement(experiment_id=experiment_id, timestamp=from_millis(date), type_id=type_id, value=value)
+                for date, type_id, value in zip(dates.tolist(), type_ids.tolist(), values.tolist())
+            ],
+            batch_size=max(len(dates), 1),
+        )
+
+    def filter(self, experiment_ids, type_ids=None, start=None, end=None):
+        measurements = Measurement.objects.filter(experiment_id__in=list(experiment_ids))
+        if type_ids is not None:
+            measurements = measurements.filter(type_id__in=list(type_ids))
+        if start is not None:
+            measurements = measurements.filter(timestamp__gte=from_millis(start))
+        if end is not None:
+            measurements = measurements.filter(timestamp__lt=from_millis(end))
+        return measurements
+
+    def read(self, experiment_ids, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        rows = (
+            self.filter(experiment_ids, type_ids, start, end)
+            .order_by("experiment_id", "timestamp", "id")
+            .values_list("experiment_id", "timestamp", "type_id", "value")
+            .iterator(chunk_size=chunk_size)
+        )
+        return rows_to_chunks(rows, chunk_size)
+
+    def count(self, experiment_ids, type_ids=None, start=None, end=None):
+        return self.filter(experiment_ids, type_ids, start, end).count()
+
+    # One grouped query over the (experiment, type, timestamp) index
+    def type_statistics(self, experiment_id):
+        rows = (
+            Measurement.objects.filter(experiment_id=experiment_id)
+            .order_by()
+            .values("type_id")
+            .annotate(samples=Count("id"), first=Min("timestamp"), last=Max("timestamp"))
+        )
+        return {row["type_id"]: (row["samples"], to_millis(row["first"]), to_millis(row["last"])) for row in rows}
+
+    def delete(self, experiment_ids):
+        Measurement.objects.filter(experiment_id__in=list(experiment_ids)).delete()
+
+    # Type by type, so the duplicate groups held in memory and each delete
+    # transaction stay small. The copy with the lowest id is kept.
+    def deduplicate(self, experiment_id, dry_run=False, chunk_size=400):
+        measurements = Measurement.objects.filter(experiment_id=experiment_id)
+        deleted = 0
+        for type_id in list(measurements.order_by().values_list("type_id", flat=True).distinct()):
+            groups = list(
+                measurements.filter(type_id=type_id)
+                .order_by()
+                .values("timestamp")
+                .annotate(keep=Min("id"), copies=Count("id"))
+                .filter(copies__gt=1)
+                .values_list("timestamp", "keep", "copies")
+            )
+            if dry_run:
+                deleted += sum(copies - 1 for _, _, copies in groups)
+                continue
+
+            for start in range(0, len(groups), chunk_size):
+                chunk = groups[start:start + chunk_size]
+                with transaction.atomic():
+                    count, _ = (
+                        measurements.filter(type_id=type_id, timestamp__in=[timestamp for timestamp, _, _ in chunk])
+                        .exclude(id__in=[keep for _, keep, _ in chunk])
+                        .delete()
+                    )
+                deleted += count
+        return deleted
+
+    def queryset(self, experiment_ids):
+        return Measurement.objects.filter(experiment_id__in=list(experiment_ids))
@@ -0,0 +1,217 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+
+from ..models import MeasurementSegment
+from .base import DEFAULT_CHUNK_SIZE, MeasurementStorage
+from .codec import DEFAULT_CODEC, ZLIB, decode, encode
+
+DEFAULT_SEGMENT_SAMPLES = 10000
+
+"""
+Return the maximum number of samples of a segment
+"""
+def get_segment_samples():
+    return max(1, int(getattr(settings, "MEASUREMENTS_SEGMENT_SAMPLES", DEFAULT_SEGMENT_SAMPLES)))
+
+
+"""
+Decode a segment into its timestamps and values
+"""
+def decode_segment(segment):
+    return decode(segment.codec, segment.data, segment.samples, segment.start)
+
+
+# Per experiment and type segments of up to MEASUREMENTS_SEGMENT_SAMPLES samples
+# stored as compressed BLOBs (see codec). New samples are appended to the last
+# segment of their type while it has room and they come after it; samples sent
+# out of order start new segments, which may overlap and are merged when read.
+class SegmentStorage(MeasurementStorage):
+    name = "segments"
+
+    # Full segments are encoded with the default codec, and the ones still
+    # being appended to with the faster zlib codec
+    def segment(self, experiment_id, type_id, dates, values, instance=None):
+        codec, data = encode(dates, values, DEFAULT_CODEC if len(dates) >= get_segment_samples() else ZLIB)
+        if instance is None:
+            instance = MeasurementSegment(experiment_id=experiment_id, type_id=type_id)
+        instance.start = int(dates[0])
+        instance.end = int(dates[-1])
+        instance.samples = len(dates)
+        instance.codec = codec
+        instance.data = data
+        return instance
+
+    def write(self, experiment_id, dates, type_ids, values):
+        for type_id in np.unique(type_ids).tolist():
+            selected = type_ids == type_id
+            order = np.argsort(dates[selected], kind="stable")
+            self.append(experiment_id, type_id, dates[selected][order], values[selected][order])
+
+    # The last segment is locked until the transaction commits, so a concurrent
+    # data send of the same type waits instead of overwriting its new samples
+    # (SQLite writers are already serialized by the IMMEDIATE transactions)
+    def append(self, experiment_id, type_id, dates, values):
+        max_samples = get_segment_samples()
+        last = (
+            MeasurementSegment.objects.select_for_update()
+            .filter(experiment_id=experiment_id, type_id=type_id)
+            .order_by("-start", "-id")
+            .first()
+        )
+        if last is not None and (last.samples >= max_samples or last.end > dates[0]):
+            last = None
+        if last is not None:
+            last_dates, last_values = decode_segment(last)
+            dates = np.concatenate((last_dates, dates))
+            values = np.concatenate((last_values, values))
+
+        created = []
+        for start in range(0, len(dates), max_samples):
+            piece = slice(start, start + max_samples)
+            if start == 0 and last is not None:
+                self.segment(experiment_id, type_id, dates[piece], values[piece], last).save()
+            else:
+                created.append(self.segment(experiment_id, type_id, dates[piece], values[piece]))
+        MeasurementSegment.objects.bulk_create(created)
+
+    def segments(self, experiment_ids, type_ids=None, start=None, end=None):
+        segments = MeasurementSegment.objects.filter(experiment_id__in=list(experiment_ids))
+        if type_ids is not None:
+            segments = segments.filter(type_id__in=list(type_ids))
+        if start is not None:
+            segments = segments.filter(end__gte=start)
+        if end is not None:
+            segments = segments.filter(start__lt=end)
+        return segments
+
+    def read(self, experiment_ids, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        for experiment_id in sorted(experiment_ids):
+            segments = self.segments([experiment_id], type_ids, start, end).order_by("start", "id")
+            yield from merge_segments(
+                experiment_id,
+                ((segment.start, segment.type_id, segment) for segment in segments.iterator(chunk_size=100)),
+                decode_segment,
+                start,
+                end,
+                chunk_size,
+            )
+
+    def count(self, experiment_ids, type_ids=None, start=None, end=None):
+        if start is None and end is None:
+            return self.segments(experiment_ids, type_ids).aggregate(samples=Sum("samples"))["samples"] or 0
+        return super().count(experiment_ids, type_ids, start, end)
+
+    def type_statistics(self, experiment_id):
+        rows = (
+            MeasurementSegment.objects.filter(experiment_id=experiment_id)
+            .order_by()
+            .values("type_id")
+            .annotate(samples=Sum("samples"), first=Min("start"), last=Max("end"))
+        )
+        return {row["type_id"]: (row["samples"], row["first"], row["last"]) for row in rows}
+
+    def delete(self, experiment_ids):
+        MeasurementSegment.objects.filter(experiment_id__in=list(experiment_ids)).delete()
+
+    # Type by type: the samples are read in order, the first one of each
+    # timestamp is kept and the segments of the type are written again
+    def deduplicate(self, experiment_id, dry_run=False, chunk_size=400):
+        deleted = 0
+        type_ids = (
+            MeasurementSegment.objects.filter(experiment_id=experiment_id)
+            .order_by("type_id")
+            .values_list("type_id", flat=True)
+            .distinct()
+        )
+        for type_id in list(type_ids):
+            with transaction.atomic():
+                old = list(self.segments([experiment_id], [type_id]).values_list("id", flat=True))
+                new = []
+                pending = Samples()
+                last_date = None
+                removed = 0
+                for _, dates, type_column, values in self.read([experiment_id], [type_id]):
+                    keep = np.r_[dates[0] != last_date, dates[1:] != dates[:-1]]
+                    removed += len(dates) - int(keep.sum())
+                    last_date = dates[-1]
+                    if dry_run:
+                        continue
+                    pending.extend(dates[keep], type_column[keep], values[keep])
+                    while len(pending) >= get_segment_samples():
+                        _, segment_dates, _, segment_values = pending.pop_chunk(experiment_id, get_segment_samples())
+                        new.append(self.segment(experiment_id, type_id, segment_dates, segment_values))
+                deleted += removed
+                if dry_run or not removed:
+                    continue
+                if len(pending):
+                    _, segment_dates, _, segment_values = pending.pop_chunk(experiment_id, len(pending))
+                    new.append(self.segment(experiment_id, type_id, segment_dates, segment_values))
+                MeasurementSegment.objects.filter(id__in=old).delete()
+                MeasurementSegment.objects.bulk_create(new)
+        return deleted
+
+
+"""
+Merge the segments (first timestamp, type id, segment) of an experiment, given
+in order of their first timestamp, into chunks of MeasurementStorage.read.
+When a segment starts, the samples buffered before it are final and can be
+sorted and returned.
+"""
+def merge_segments(experiment_id, segments, decode, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    buffer = Samples()
+    output = Samples()
+    for segment_start, type_id, segment in segments:
+        output.extend(*buffer.pop_before(segment_start))
+        dates, values = decode(segment)
+        window = np.ones(len(dates), dtype=bool)
+        if start is not None:
+            window &= dates >= start
+        if end is not None:
+            window &= dates < end
+        buffer.extend(dates[window], np.full(window.sum(), type_id, dtype=np.int64), values[window])
+        while len(output) >= chunk_size:
+            yield output.pop_chunk(experiment_id, chunk_size)
+
+    output.extend(*buffer.pop_before(None))
+    while len(output):
+        yield output.pop_chunk(experiment_id, chunk_size)
+
+
+# Growable set of samples (timestamps, type ids, values) used to merge segments
+class Samples:
+
+    def __init__(self):
+        self.dates = np.empty(0, dtype=np.int64)
+        self.type_ids = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def extend(self, dates, type_ids, values):
+        if len(dates):
+            self.dates = np.concatenate((self.dates, dates))
+            self.type_ids = np.concatenate((self.type_ids, type_ids))
+            self.values = np.concatenate((self.values, values))
+
+    # Remove and return, sorted by timestamp and type, the samples before
+    # "date" (all of them when None)
+    def pop_before(self, date):
+        order = np.lexsort((self.type_ids, self.dates))
+        dates, type_ids, values = self.dates[order], self.type_ids[order], self.values[order]
+        split = len(dates) if date is None else int(np.searchsorted(dates, date, side="left"))
+        self.dates, self.type_ids, self.values = dates[split:], type_ids[split:], values[split:]
+        return dates[:split], type_ids[:split], values[:split]
+
+    # Remove and return the first samples as a chunk of MeasurementStorage.read
+    def pop_chunk(self, experiment_id, size):
+        chunk = (
+            np.full(min(size, len(self)), experiment_id, dtype=np.int64),
+            self.dates[:size],
+            self.type_ids[:size],
+            self.values[:size],
+        )
+        self.dates, self.type_ids, self.values = self.dates[size:], self.type_ids[size:], self.values[size:]
+        return chunk
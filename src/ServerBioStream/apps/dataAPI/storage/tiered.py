@@ -0,0 +1,120 @@
+from itertools import groupby
+
+from django.db import transaction
+
+from ..models import Experiment
+from .archive import ArchiveError
+from .base import DEFAULT_CHUNK_SIZE, MeasurementStorage
+
+
+# Storage returned by get_storage: the samples of each experiment are either in
+# the live backend (MEASUREMENTS_STORAGE) or, when Experiment.archived is set, in
+# its archive file. Reads, counts and deletes are routed per experiment, so the
+# archived experiments are served transparently. Samples sent to an archived
+# experiment move it back to the live backend first.
+class TieredStorage(MeasurementStorage):
+
+    def __init__(self, live, archive):
+        self.live = live
+        self.archive = archive
+
+    @property
+    def name(self):
+        return self.live.name
+
+    def archived(self, experiment_ids):
+        return set(
+            Experiment.objects.filter(id__in=list(experiment_ids), archived=True).values_list("id", flat=True)
+        )
+
+    # Split experiment ids into (backend, ids) groups, in order of id
+    def route(self, experiment_ids):
+        archived = self.archived(experiment_ids)
+        for in_archive, group in groupby(sorted(experiment_ids), key=lambda experiment_id: experiment_id in archived):
+            yield (self.archive if in_archive else self.live), list(group)
+
+    # The experiment is locked as archive_experiment does, so a data send that
+    # arrives while it is archived waits and restores it, instead of having its
+    # samples deleted with the live ones or written after them
+    def write(self, experiment_id, dates, type_ids, values):
+        with transaction.atomic(savepoint=False):
+            archived = (
+                Experiment.objects.select_for_update()
+                .filter(id=experiment_id)
+                .values_list("archived", flat=True)
+                .first()
+            )
+            if archived:
+                self.restore_experiment(experiment_id)
+            self.live.write(experiment_id, dates, type_ids, values)
+
+    def read(self, experiment_ids, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        for backend, group in self.route(experiment_ids):
+            yield from backend.read(group, type_ids, start, end, chunk_size)
+
+    def count(self, experiment_ids, type_ids=None, start=None, end=None):
+        return sum(backend.count(group, type_ids, start, end) for backend, group in self.route(experiment_ids))
+
+    def type_statistics(self, experiment_id):
+        for backend, _ in self.route([experiment_id]):
+            return backend.type_statistics(experiment_id)
+        return {}
+
+    def delete(self, experiment_ids):
+        self.live.delete(experiment_ids)
+        self.archive.delete(experiment_ids)
+
+    def deduplicate(self, experiment_id, dry_run=False, chunk_size=400):
+        for backend, _ in self.route([experiment_id]):
+            return backend.deduplicate(experiment_id, dry_run, chunk_size)
+        return 0
+
+    # Only the live backend can run database queries over the samples
+    def queryset(self, experiment_ids):
+        if self.archived(experiment_ids):
+            return None
+        return self.live.queryset(experiment_ids)
+
+    """
+    Move the samples of an experiment from the live backend to its archive file.
+    The file is checked to hold every sample before the live samples are deleted,
+    and removed if the transaction fails.
+    Return the number of samples archived.
+    """
+    def archive_experiment(self, experiment_id, chunk_size=DEFAULT_CHUNK_SIZE):
+        try:
+            with transaction.atomic():
+                experiment = Experiment.objects.select_for_update().get(id=experiment_id)
+                if experiment.archived:
+                    return 0
+                samples = self.live.count([experiment_id])
+                archived = self.archive.create(experiment_id, self.live.read([experiment_id], chunk_size=chunk_size))
+                if archived != samples:
+                    raise ArchiveError(f"Archived {archived} of {samples} samples of experiment {experiment_id}")
+                self.live.delete([experiment_id])
+                experiment.archived = True
+                experiment.save(update_fields=["archived"])
+        except Exception:
+            # The samples are still live, so the file is not needed
+            self.archive.path(experiment_id).unlink(missing_ok=True)
+            raise
+        return samples
+
+    """
+    Move the samples of an archived experiment back to the live backend.
+    The file is removed when the transaction commits. Return the number of
+    samples restored.
+    """
+    def restore_experiment(self, experiment_id, chunk_size=DEFAULT_CHUNK_SIZE):
+        with transaction.atomic():
+            experiment = Experiment.objects.select_for_update().get(id=experiment_id)
+            if not experiment.archived:
+                return 0
+            samples = 0
+            for _, dates, type_ids, values in self.archive.read([experiment_id], chunk_size=chunk_size):
+                self.live.write(experiment_id, dates, type_ids, values)
+                samples += len(dates)
+            self.archive.delete([experiment_id])
+            experiment.archived = False
+            experiment.save(update_fields=["archived"])
+        return samples
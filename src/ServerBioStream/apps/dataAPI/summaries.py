@@ -0,0 +1,62 @@
+from collections import Counter
+
+from django.utils.timezone import now
+
+from .models import ExperimentSummary, SensorType
+from .storage import get_storage
+from .storage.base import from_millis
+
+
+"""
+Add the samples of a stored batch to the summary of its experiment.
+"type_counts" is a dict {type name: samples}.
+"""
+def add_to_summary(experiment_id, start_date, end_date, type_counts):
+    summary, created = ExperimentSummary.objects.select_for_update().get_or_create(
+        experiment_id=experiment_id,
+        defaults={
+            "start_date": start_date,
+            "end_date": end_date,
+            "samples": sum(type_counts.values()),
+            "type_counts": dict(type_counts),
+            "last_ingested": now(),
+        },
+    )
+    if created:
+        return summary
+
+    counts = Counter(summary.type_counts)
+    counts.update(type_counts)
+    summary.type_counts = dict(counts)
+    summary.samples += sum(type_counts.values())
+    summary.start_date = start_date if summary.start_date is None else min(summary.start_date, start_date)
+    summary.end_date = end_date if summary.end_date is None else max(summary.end_date, end_date)
+    summary.last_ingested = now()
+    summary.save()
+    return summary
+
+
+"""
+Recompute the summary of an experiment from its stored samples (with one
+grouped query for the database backends)
+"""
+def rebuild_summary(experiment):
+    type_names = dict(SensorType.objects.values_list("id", "name"))
+    statistics = get_storage().type_statistics(experiment.id)
+
+    type_counts = {type_names[type_id]: samples for type_id, (samples, _, _) in statistics.items()}
+    start_date = end_date = None
+    if statistics:
+        start_date = from_millis(min(first for _, first, _ in statistics.values()))
+        end_date = from_millis(max(last for _, _, last in statistics.values()))
+
+    summary, _ = ExperimentSummary.objects.update_or_create(
+        experiment=experiment,
+        defaults={
+            "start_date": start_date,
+            "end_date": end_date,
+            "samples": sum(type_counts.values()),
+            "type_counts": type_counts,
+        },
+    )
+    return summary
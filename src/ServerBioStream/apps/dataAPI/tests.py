@@ -1,3 +1,987 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max, Min
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apps.monitoring import metrics
+
+from . import pool
+from .database import configure_sqlite, get_sqlite_pragmas
+from .deletion import delete_chunk_sql, delete_rows, start_deletion
+from .dimensions import clear_cache, get_sensor_type_ids
+from .ingestion import MeasurementBatch, ingest_batch
+from .models import (
+    Experiment,
+    ExperimentDeletion,
+    ExperimentSummary,
+    IngestedBatch,
+    Measurement,
+    MeasurementRollup,
+    MeasurementSegment,
+    SensorType,
+)
+from .postgres import copy_rows, is_partitioned, month_ranges
+from .rollups import query_rollups, rebuild_rollups
+from .serializer import MeasurementsSerializer
+from .spool import get_spool
+from .storage import codec, get_backend, get_storage
+from .storage.archive import ArchiveStorage
+from .storage.codec import DOD_XOR, ZLIB
+from .storage.orm import ORMStorage
+from .validation import validate_data_send
+from .views import DataSendHandler, Measurements_append_async
+from .wire import MEDIA_TYPE, decode, encode, zstandard
+
+
+def build_payload(identifier="exp-1", samples=10, sample_type="heart_rate", start=1700000000000):
+    return {
+        "identifier": identifier,
+        "measurements": [
+            {"date": start + i * 20, "type": sample_type, "value": float(i)}
+            for i in range(samples)
+        ],
+    }
+
+
+class IngestionTests(TestCase):
+
+    def test_ingest_batch_writes_every_chunk(self):
+        payload = build_payload(samples=25)
+        batch = MeasurementBatch.from_measurements(payload["identifier"], payload["measurements"])
+
+        report = ingest_batch(batch, chunk_size=10)
+
+        self.assertTrue(report.ok)
+        self.assertEqual(report.inserted, 25)
+        self.assertEqual(Measurement.objects.filter(experiment__identifier="exp-1").count(), 25)
+        first = Measurement.objects.order_by("timestamp").first()
+        self.assertEqual(int(first.timestamp.timestamp() * 1000), 1700000000000)
+
+    def test_ingestion_updates_summary(self):
+        for sample_type, start in (("heart_rate", 1700000000000), ("acc-x", 1600000000000), ("heart_rate", 1800000000000)):
+            payload = build_payload(samples=4, sample_type=sample_type, start=start)
+            ingest_batch(MeasurementBatch.from_measurements(payload["identifier"], payload["measurements"]))
+
+        summary = ExperimentSummary.objects.get(experiment__identifier="exp-1")
+        self.assertEqual(summary.samples, 12)
+        self.assertEqual(summary.type_counts, {"heart_rate": 8, "acc-x": 4})
+        self.assertEqual(int(summary.start_date.timestamp() * 1000), 1600000000000)
+        self.assertEqual(int(summary.end_date.timestamp() * 1000), 1800000000060)
+
+        ExperimentSummary.objects.all().delete()
+        call_command("rebuild_experiment_summaries", stdout=open(os.devnull, "w"))
+        rebuilt = ExperimentSummary.objects.get(experiment__identifier="exp-1")
+        self.assertEqual(
+            (rebuilt.samples, rebuilt.type_counts, rebuilt.start_date, rebuilt.end_date),
+            (summary.samples, summary.type_counts, summary.start_date, summary.end_date),
+        )
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        # 150 s of samples every 500 ms with values 0..299, sent in two batches
+        # that share the periods around t=75 s
+        dates = [1700000000000 + i * 500 for i in range(300)]
+        for start, end in ((0, 151), (151, 300)):
+            ingest_batch(MeasurementBatch(
+                "exp-1", dates[start:end], ["heart_rate"] * (end - start), [float(i) for i in range(start, end)]
+            ))
+        self.experiment = Experiment.objects.get(identifier="exp-1")
+
+    def rollups(self, resolution):
+        return list(
+            MeasurementRollup.objects.filter(resolution=resolution)
+            .order_by("bucket")
+            .values_list("bucket", "samples", "minimum", "maximum", "total", "total_squares")
+        )
+
+    def test_ingestion_maintains_every_resolution(self):
+        minutes = self.rollups(60)
+        self.assertEqual(sum(row[1] for row in minutes), 300)
+        self.assertEqual(len(self.rollups(1)), 150)
+        self.assertEqual(len(self.rollups(3600)), 1)
+        self.assertEqual(self.rollups(3600)[0][1:5], (300, 0.0, 299.0, sum(range(300))))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = {resolution: self.rollups(resolution) for resolution in (1, 60, 3600)}
+
+        rebuild_rollups(self.experiment, chunk_size=7)
+
+        for resolution, rows in incremental.items():
+            self.assertEqual(self.rollups(resolution), rows)
+
+    def test_query_uses_coarsest_rollup(self):
+        start = 1700000000000 // 3600000 * 3600000
+        tier, buckets = query_rollups(self.experiment.id, Measurement.objects.first().type_id, start, start + 7200000, 300)
+
+        self.assertEqual(tier, 60)
+        self.assertEqual(sum(bucket["samples"] for bucket in buckets), 300)
+        self.assertEqual(min(bucket["min"] for bucket in buckets), 0.0)
+        self.assertEqual(max(bucket["max"] for bucket in buckets), 299.0)
+
+    @override_settings(MEASUREMENTS_ROLLUP_RESOLUTIONS=[])
+    def test_query_without_rollups_reads_samples(self):
+        type_id = Measurement.objects.first().type_id
+        tier, buckets = query_rollups(self.experiment.id, type_id, 1700000000000, 1700000010000, 5)
+
+        self.assertIsNone(tier)
+        self.assertEqual([bucket["samples"] for bucket in buckets], [10, 10])
+        self.assertEqual(buckets[0]["mean"], 4.5)
+
+
+@override_settings(MEASUREMENTS_STORAGE="segments", MEASUREMENTS_SEGMENT_SAMPLES=4)
+class SegmentStorageTests(TestCase):
+
+    def setUp(self):
+        self.storage = get_backend("segments")
+        # Two types sent in three batches; the last one goes back in time
+        ingest_batch(MeasurementBatch("exp-1", [1000, 2000, 3000, 1500, 2500], ["x", "x", "x", "y", "y"], [1, 2, 3, 10, 20]))
+        ingest_batch(MeasurementBatch("exp-1", [4000, 5000, 6000], ["x", "x", "x"], [4, 5, 6]))
+        ingest_batch(MeasurementBatch("exp-1", [500, 2000], ["x", "y"], [0, 15]))
+        self.experiment = Experiment.objects.get(identifier="exp-1")
+
+    def read(self, **kwargs):
+        chunks = list(self.storage.read([self.experiment.id], **kwargs))
+        return [np.concatenate(column).tolist() for column in zip(*chunks)][1:] if chunks else [[], [], []]
+
+    def test_samples_are_stored_in_segments(self):
+        self.assertEqual(Measurement.objects.count(), 0)
+        self.assertLessEqual(max(MeasurementSegment.objects.values_list("samples", flat=True)), 4)
+        self.assertEqual(self.storage.count([self.experiment.id]), 10)
+        self.assertEqual(ExperimentSummary.objects.get().samples, 10)
+        # Full segments use the compact codec, the ones being filled zlib
+        self.assertEqual(
+            set(MeasurementSegment.objects.filter(samples=4).values_list("codec", flat=True)), {DOD_XOR}
+        )
+        self.assertEqual(
+            set(MeasurementSegment.objects.filter(samples__lt=4).values_list("codec", flat=True)), {ZLIB}
+        )
+
+    def test_read_merges_segments_in_time_order(self):
+        dates, _, values = self.read(chunk_size=3)
+
+        self.assertEqual(dates, [500, 1000, 1500, 2000, 2000, 2500, 3000, 4000, 5000, 6000])
+        self.assertEqual(values[:3], [0, 1, 10])
+        # Samples of the same time are ordered by type
+        self.assertEqual(sorted(values[3:5]), [2, 15])
+
+    def test_read_window_and_types(self):
+        x = get_sensor_type_ids(["x"])["x"]
+        dates, type_ids, values = self.read(type_ids=[x], start=2000, end=5000)
+
+        self.assertEqual(dates, [2000, 3000, 4000])
+        self.assertEqual(set(type_ids), {x})
+        self.assertEqual(self.storage.count([self.experiment.id], [x], 2000, 5000), 3)
+
+    def test_type_statistics(self):
+        statistics = self.storage.type_statistics(self.experiment.id)
+
+        self.assertEqual(statistics[get_sensor_type_ids(["y"])["y"]], (3, 1500, 2500))
+
+    def test_deduplicate_keeps_first_sample(self):
+        ingest_batch(MeasurementBatch("exp-1", [4000, 7000], ["x", "x"], [40, 7]))
+
+        self.assertEqual(self.storage.deduplicate(self.experiment.id, dry_run=True), 1)
+        self.assertEqual(self.storage.deduplicate(self.experiment.id), 1)
+        dates, _, values = self.read(type_ids=[get_sensor_type_ids(["x"])["x"]])
+        self.assertEqual(dates, [500, 1000, 2000, 3000, 4000, 5000, 6000, 7000])
+        self.assertEqual(values[4], 4)
+
+    def test_migrate_back_to_orm(self):
+        call_command("migrate_measurement_storage", "segments", "orm", stdout=io.StringIO())
+
+        self.assertEqual(MeasurementSegment.objects.count(), 0)
+        self.assertEqual(
+            list(Measurement.objects.order_by("timestamp", "id").values_list("value", flat=True))[:3],
+            [0, 1, 10],
+        )
+
+
+# Two data sends of the same type extending the last segment at once; SQLite
+# serializes whole write transactions instead
+@skipUnless(connection.features.has_select_for_update, "Needs row locks")
+@override_settings(MEASUREMENTS_STORAGE="segments", MEASUREMENTS_SEGMENT_SAMPLES=100)
+class SegmentConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_appends_keep_every_sample(self):
+        self.addCleanup(clear_cache)
+        storage = get_backend("segments")
+        experiment = Experiment.objects.create(identifier="exp-1")
+        sensor_type = SensorType.objects.create(name="x")
+        storage.append(experiment.id, sensor_type.id, np.array([0]), np.array([0.0]))
+        appended = threading.Event()
+        errors = []
+
+        def append(dates, wait=None):
+            try:
+                if wait is not None:
+                    wait.wait(5)
+                with transaction.atomic():
+                    storage.append(experiment.id, sensor_type.id, np.array(dates), np.array(dates, dtype=float))
+                    if wait is None:
+                        appended.set()
+                        # The other append starts meanwhile and has to wait for this commit
+                        time.sleep(0.5)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=append, args=([1000, 2000],)),
+            threading.Thread(target=append, args=([3000], appended)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        dates = np.concatenate([chunk[1] for chunk in storage.read([experiment.id])]).tolist()
+        self.assertEqual(dates, [0, 1000, 2000, 3000])
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archive_settings = override_settings(MEASUREMENTS_ARCHIVE_PATH=Path(directory.name), MEASUREMENTS_SEGMENT_SAMPLES=4)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+
+        ingest_batch(MeasurementBatch("exp-1", [1000, 2000, 3000, 1500, 2500], ["x", "x", "x", "y", "y"], [1, 2, 3, 10, 20]))
+        ingest_batch(MeasurementBatch("exp-1", [4000, 5000, 6000, 500], ["x", "x", "x", "x"], [4, 5, 6, 0]))
+        ingest_batch(MeasurementBatch("exp-2", [1000], ["x"], [7]))
+        self.experiment = Experiment.objects.get(identifier="exp-1")
+        self.before = self.read()
+
+    def read(self, **kwargs):
+        chunks = list(get_storage().read([self.experiment.id], **kwargs))
+        return [np.concatenate(column).tolist() for column in zip(*chunks)][1:]
+
+    def archive(self):
+        call_command("archive_experiments", experiment=["exp-1"], stdout=io.StringIO())
+        self.experiment.refresh_from_db()
+
+    def test_archive_moves_samples_to_file(self):
+        self.archive()
+
+        self.assertTrue(self.experiment.archived)
+        self.assertTrue(ArchiveStorage().exists(self.experiment.id))
+        self.assertEqual(Measurement.objects.filter(experiment=self.experiment).count(), 0)
+        self.assertEqual(Measurement.objects.count(), 1)
+        # Read transparently, in the same order as before
+        self.assertEqual(self.read(), self.before)
+        self.assertEqual(get_storage().count([self.experiment.id]), 9)
+        x = get_sensor_type_ids(["x"])["x"]
+        self.assertEqual(self.read(type_ids=[x], start=2000, end=5000)[0], [2000, 3000, 4000])
+        self.assertEqual(get_storage().type_statistics(self.experiment.id)[x], (7, 500, 6000))
+        self.assertIsNone(get_storage().queryset([self.experiment.id]))
+        # The summary stays in the experiments list
+        self.assertEqual(ExperimentSummary.objects.get(experiment=self.experiment).samples, 9)
+
+    def test_idle_experiments_are_archived(self):
+        ExperimentSummary.objects.filter(experiment=self.experiment).update(last_ingested="2020-01-01T00:00:00Z")
+
+        call_command("archive_experiments", days=30, stdout=io.StringIO())
+
+        self.assertEqual(list(Experiment.objects.filter(archived=True).values_list("identifier", flat=True)), ["exp-1"])
+
+    def test_new_samples_restore_experiment(self):
+        self.archive()
+
+        # Also caches the ids of the rolled back test rows
+        self.addCleanup(clear_cache)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_batch(MeasurementBatch("exp-1", [7000], ["x"], [8]))
+
+        self.experiment.refresh_from_db()
+        self.assertFalse(self.experiment.archived)
+        self.assertFalse(ArchiveStorage().exists(self.experiment.id))
+        self.assertEqual(Measurement.objects.filter(experiment=self.experiment).count(), 10)
+
+    def test_deduplicate_archived_experiment(self):
+        ingest_batch(MeasurementBatch("exp-1", [3000], ["x"], [30]))
+        self.archive()
+
+        self.assertEqual(get_storage().deduplicate(self.experiment.id), 1)
+        self.assertEqual(self.read(), self.before)
+
+    def test_failed_archive_keeps_samples(self):
+        storage = get_storage()
+        with mock.patch.object(storage.live, "delete", side_effect=DatabaseError("locked")):
+            call_command("archive_experiments", experiment=["exp-1"], stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.experiment.refresh_from_db()
+        self.assertFalse(self.experiment.archived)
+        self.assertFalse(ArchiveStorage().exists(self.experiment.id))
+        self.assertEqual(Measurement.objects.filter(experiment=self.experiment).count(), 9)
+
+
+# A data send arriving while its experiment is being archived
+@skipUnless(connection.features.has_select_for_update, "Needs row locks")
+class ArchiveConcurrencyTests(TransactionTestCase):
+
+    def test_send_during_archive_is_kept(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(clear_cache)
+        archive_settings = override_settings(MEASUREMENTS_ARCHIVE_PATH=Path(directory.name))
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        ingest_batch(MeasurementBatch("exp-1", [1000, 2000], ["x", "x"], [1, 2]))
+        experiment = Experiment.objects.get(identifier="exp-1")
+        storage = get_storage()
+        create = storage.archive.create
+        archiving = threading.Event()
+        errors = []
+
+        def slow_create(*args):
+            archived = create(*args)
+            archiving.set()
+            # The data send starts meanwhile and has to wait for this commit
+            time.sleep(0.5)
+            return archived
+
+        def archive():
+            try:
+                with mock.patch.object(storage.archive, "create", side_effect=slow_create):
+                    storage.archive_experiment(experiment.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def send():
+            try:
+                archiving.wait(5)
+                ingest_batch(MeasurementBatch("exp-1", [3000], ["x"], [3]))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=archive), threading.Thread(target=send)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        experiment.refresh_from_db()
+        self.assertFalse(experiment.archived)
+        dates = np.concatenate([chunk[1] for chunk in storage.read([experiment.id])]).tolist()
+        self.assertEqual(dates, [1000, 2000, 3000])
+
+
+@override_settings(MEASUREMENTS_DELETE_IN_BACKGROUND=False, MEASUREMENTS_DELETE_CHUNK_SIZE=3, MEASUREMENTS_DELETE_PAUSE=0)
+class DeletionTests(TestCase):
+
+    def setUp(self):
+        ingest_batch(MeasurementBatch("exp-1", [1000 * i for i in range(10)], ["x"] * 10, list(range(10))))
+        ingest_batch(MeasurementBatch("exp-2", [1000], ["x"], [7]))
+        ingest_batch(MeasurementBatch("exp-1", [20000, 21000], ["y", "y"], [1, 2]))
+
+    def test_deletion_runs_in_chunks(self):
+        experiment = Experiment.objects.get(identifier="exp-1")
+        measurements = Measurement.objects.filter(experiment=experiment)
+        rows = measurements.count() + MeasurementRollup.objects.filter(experiment=experiment).count()
+        ids = measurements.aggregate(first=Min("id"), last=Max("id"))
+
+        with CaptureQueriesContext(connection) as queries:
+            deletion = start_deletion("exp-1")
+
+        self.assertEqual(deletion.status, ExperimentDeletion.DONE)
+        self.assertEqual((deletion.deleted, deletion.total, deletion.progress), (rows, rows, 100))
+        # One DELETE per range of MEASUREMENTS_DELETE_CHUNK_SIZE ids
+        chunks = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('DELETE FROM "dataAPI_measurement"') and '"id" >=' in query["sql"]
+        ]
+        self.assertEqual(len(chunks), len(range(ids["first"], ids["last"] + 1, 3)))
+        self.assertGreaterEqual(len(chunks), 4)
+        self.assertFalse(Experiment.objects.filter(identifier="exp-1").exists())
+        self.assertEqual(Measurement.objects.count(), 1)
+        self.assertEqual(MeasurementRollup.objects.exclude(experiment__identifier="exp-2").count(), 0)
+        self.assertIsNone(start_deletion("exp-1"))
+
+    @skipUnless(connection.vendor == "sqlite", "Query plan of SQLite")
+    def test_chunks_search_the_primary_key_range(self):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + delete_chunk_sql(Measurement), [1, 1, 4])
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+
+        self.assertIn("USING INTEGER PRIMARY KEY (rowid>? AND rowid<?)", plan)
+
+    def test_empty_ranges_are_skipped(self):
+        experiment = Experiment.objects.get(identifier="exp-1")
+
+        with mock.patch("apps.dataAPI.deletion.time.sleep") as sleep:
+            deleted = list(delete_rows(Measurement, experiment.id, 1))
+
+        # No pause for the id of exp-2 between them
+        self.assertEqual(deleted, [1] * 12)
+        self.assertEqual(sleep.call_count, 12)
+
+    def test_delete_rows_by_primary_key_range(self):
+        experiment = Experiment.objects.get(identifier="exp-1")
+
+        deleted = list(delete_rows(Measurement, experiment.id, 4))
+
+        # 13 consecutive ids, one of them from exp-2
+        self.assertEqual((len(deleted), sum(deleted)), (4, 12))
+        self.assertEqual(Measurement.objects.count(), 1)
+
+    def test_failed_deletion_rebuilds_summary(self):
+        def fail_after_first_chunk(model, experiment_id, chunk_size):
+            chunks = delete_rows(model, experiment_id, chunk_size)
+            yield next(chunks)
+            raise DatabaseError("disk I/O error")
+
+        with mock.patch("apps.dataAPI.deletion.delete_rows", fail_after_first_chunk), self.assertLogs("apps.dataAPI.deletion"):
+            deletion = start_deletion("exp-1")
+
+        self.assertEqual((deletion.status, deletion.error), (ExperimentDeletion.FAILED, "disk I/O error"))
+        summary = ExperimentSummary.objects.get(experiment__identifier="exp-1")
+        self.assertEqual(summary.samples, 9)
+        self.assertEqual(summary.samples, Measurement.objects.filter(experiment__identifier="exp-1").count())
+        # It can be started again
+        self.assertEqual(start_deletion("exp-1").status, ExperimentDeletion.DONE)
+
+    def test_interrupted_deletion_is_resumed(self):
+        with override_settings(MEASUREMENTS_DELETE_IN_BACKGROUND=True):
+            deletion = start_deletion("exp-1")
+        ExperimentDeletion.objects.filter(id=deletion.id).update(status=ExperimentDeletion.RUNNING, updated="2020-01-01T00:00:00Z")
+
+        call_command("delete_experiments", stdout=io.StringIO())
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, ExperimentDeletion.DONE)
+        self.assertFalse(Experiment.objects.filter(identifier="exp-1").exists())
+
+
+class SegmentCodecTests(TestCase):
+
+    def setUp(self):
+        random = np.random.default_rng(7)
+        self.dates = 1700000000000 + np.cumsum(random.integers(18, 23, 5000))
+        self.signal = np.sin(np.arange(5000) / 50) * 9.81 + random.normal(0, 0.05, 5000)
+
+    def assertRoundTrip(self, values, name=DOD_XOR):
+        name, data = codec.encode(self.dates[:len(values)], values, name)
+        dates, decoded = codec.decode(name, data, len(values), int(self.dates[0]))
+        self.assertEqual(dates.tolist(), self.dates[:len(values)].tolist())
+        # Bit by bit, so -0.0 and NaN are checked too
+        self.assertEqual(decoded.view(np.uint64).tolist(), np.asarray(values).view(np.uint64).tolist())
+        return len(data)
+
+    def test_decimals(self):
+        size = self.assertRoundTrip(np.round(self.signal, 4))
+        self.assertLess(size, 3 * 5000)
+
+    def test_float32_decimals(self):
+        # As SmartBioStream sends the float32 sensor readings
+        values = self.signal.astype(np.float32).astype(str).astype(np.float64)
+        size = self.assertRoundTrip(values)
+        self.assertLess(size, 4 * 5000)
+        self.assertRoundTrip(values * 1e-6)
+        self.assertRoundTrip((self.signal * 1e12).astype(np.float32).astype(str).astype(np.float64))
+
+    def test_any_float(self):
+        self.assertRoundTrip(self.signal)
+        self.assertRoundTrip(np.array([np.nan, -0.0, np.inf, 1e-300, -1.5]))
+        self.assertRoundTrip(np.array([2.5]))
+
+    def test_zlib(self):
+        self.assertRoundTrip(self.signal, ZLIB)
+
+
+class SQLitePragmaTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={"cache_size": -1234, "temp_store": "memory"})
+    def test_pragmas_are_applied(self):
+        configure_sqlite(None, connection)
+
+        self.assertEqual(self.pragma("cache_size"), -1234)
+        self.assertEqual(self.pragma("temp_store"), 2)
+
+    @override_settings(SQLITE_PRAGMAS={"cache_size": "1; DROP TABLE x"})
+    def test_invalid_pragma_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            configure_sqlite(None, connection)
+
+    def test_sqlite_defaults_without_setting(self):
+        with self.settings():
+            del settings.SQLITE_PRAGMAS
+            self.assertEqual(get_sqlite_pragmas(), {})
+
+
+class PostgresTests(TestCase):
+
+    def test_copy_rows(self):
+        rows = copy_rows(7, np.array([1700000000000, 1700000000020]), np.array([3, 4]), np.array([0.1, -np.inf]))
+
+        self.assertEqual(rows, "7\t2023-11-14T22:13:20.000+00\t3\t0.1\n7\t2023-11-14T22:13:20.020+00\t4\t-Infinity\n")
+
+    def test_month_ranges(self):
+        months = month_ranges(datetime(2025, 11, 20, tzinfo=timezone.utc), datetime(2026, 1, 5, tzinfo=timezone.utc))
+
+        self.assertEqual([start.month for start, _ in months], [11, 12, 1])
+        self.assertEqual(months[1][1], datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    @skipIf(connection.vendor == "postgresql", "Fallback of the other databases")
+    def test_other_databases_use_bulk_insert(self):
+        out = io.StringIO()
+        call_command("create_measurement_partitions", stdout=out)
+        ingest_batch(MeasurementBatch("exp-1", [1700000000000, 1700000000020], ["hr", "hr"], [1.0, 2.0]))
+
+        self.assertIn("nothing to do", out.getvalue())
+        self.assertEqual(Measurement.objects.count(), 2)
+
+    @skipUnless(connection.vendor == "postgresql", "Needs PostgreSQL")
+    def test_copy_into_partitioned_table(self):
+        self.assertTrue(is_partitioned(connection))
+        # 2001 has no monthly partition, so it goes to the default one
+        ingest_batch(MeasurementBatch("exp-1", [1700000000000, 1000000000000], ["hr", "hr"], [1.5, np.nan]))
+
+        values = list(Measurement.objects.order_by("timestamp").values_list("value", flat=True))
+        self.assertTrue(np.isnan(values[0]))
+        self.assertEqual(values[1], 1.5)
+
+
+class FastValidationTests(TestCase):
+
+    def assertSameErrors(self, data):
+        serializer = MeasurementsSerializer(data=data)
+        serializer.is_valid()
+        batch, errors = validate_data_send(data)
+        self.assertIsNone(batch)
+        self.assertEqual(json.loads(json.dumps(errors)), json.loads(json.dumps(serializer.errors)))
+
+    def test_valid_send_builds_batch(self):
+        payload = build_payload(samples=5)
+        payload["measurements"][0]["date"] = "1700000000000"
+
+        batch, errors = validate_data_send(payload)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(batch.identifier, "exp-1")
+        self.assertEqual(batch.dates[0], 1700000000000)
+        self.assertEqual(batch.values, [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_errors_match_serializer(self):
+        self.assertSameErrors({})
+        self.assertSameErrors({"identifier": "", "measurements": "x"})
+        self.assertSameErrors(
+            {"identifier": None, "measurements": [{"date": "a", "type": True, "value": "x"}, {}, 5]}
+        )
+        self.assertSameErrors({"identifier": "a", "measurements": [{"date": 1.5, "type": " ", "value": None}]})
+        self.assertSameErrors(
+            {"identifier": "a", "measurements": [{"date": 10**17, "type": "a", "value": 1}, {"date": -10**17, "type": "a", "value": 1}]}
+        )
+
+
+class MeasurementsAppendTests(TestCase):
+
+    def post(self, payload):
+        return self.client.post(
+            "/measurements-api/send/", json.dumps(payload), content_type="application/json"
+        )
+
+    def test_send_stores_measurements(self):
+        response = self.post(build_payload(samples=30))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Measurement.objects.count(), 30)
+
+    def test_send_rejects_invalid_payload(self):
+        payload = build_payload(samples=3)
+        payload["measurements"][1]["value"] = "not-a-number"
+
+        response = self.post(payload)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("measurements", response.json())
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    @override_settings(MEASUREMENTS_VALIDATION="fast")
+    def test_send_with_fast_validation(self):
+        self.assertEqual(self.post(build_payload(samples=30)).status_code, 201)
+        self.assertEqual(Measurement.objects.count(), 30)
+
+        payload = build_payload(samples=3)
+        payload["measurements"][1]["value"] = "not-a-number"
+        response = self.post(payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"measurements": {"1": {"value": ["A valid number is required."]}}})
+
+
+# Database work in Django's sync thread, where the test transaction is
+@override_settings(MEASUREMENTS_ASYNC_WORKERS=0)
+class AsyncMeasurementsAppendTests(TestCase):
+
+    async def post(self, payload, **headers):
+        return await self.async_client.post(
+            "/measurements-api/send-async/", json.dumps(payload), content_type="application/json", headers=headers
+        )
+
+    async def test_send_stores_measurements(self):
+        response = await self.post(build_payload(samples=30))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Measurement.objects.acount(), 30)
+
+    async def test_send_rejects_invalid_payload(self):
+        payload = build_payload(samples=3)
+        payload["measurements"][1]["value"] = "not-a-number"
+
+        response = await self.post(payload)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("measurements", response.json())
+
+    async def test_retried_send_is_acknowledged(self):
+        payload = {**build_payload(samples=5), "batch_id": "send-1"}
+
+        self.assertEqual((await self.post(payload)).status_code, 201)
+        retry = await self.post({**payload, "measurements": payload["measurements"][:2]})
+
+        self.assertEqual(retry.json(), {"duplicate": True})
+        self.assertEqual(await Measurement.objects.acount(), 5)
+
+    @override_settings(MEASUREMENTS_ASYNC_MAX_PENDING=0)
+    async def test_busy_pool_asks_to_retry(self):
+        response = await self.post(build_payload(samples=5))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+
+# Database work in the ingest thread pool, which commits on its own connections
+@override_settings(MEASUREMENTS_ASYNC_WORKERS=2, METRICS_ENABLED=True)
+class AsyncPoolTests(TransactionTestCase):
+
+    def setUp(self):
+        self.addCleanup(clear_cache)
+        self.addCleanup(metrics.clear)
+        self.addCleanup(self.shutdown_pool)
+
+    def shutdown_pool(self):
+        if pool.executor is not None:
+            pool.executor.shutdown()
+            pool.executor = None
+
+    async def post(self, payload):
+        return await self.async_client.post(
+            "/measurements-api/send-async/", json.dumps(payload), content_type="application/json"
+        )
+
+    async def test_send_is_stored_by_the_pool(self):
+        threads = []
+
+        def store(handler, batch):
+            threads.append(threading.current_thread().name)
+            return DataSendHandler.store(handler, batch)
+
+        with mock.patch.object(Measurements_append_async, "store", store):
+            response = await self.post(build_payload(samples=30))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(threads[0].startswith("ingest"), threads)
+        self.assertEqual(await Measurement.objects.acount(), 30)
+        # The queries of the pool thread are counted for the request
+        _, queries = metrics.request_queries.values[("measurements-api/send-async/",)]
+        self.assertGreater(queries, 0)
+
+    @override_settings(MEASUREMENTS_ASYNC_MAX_PENDING=1)
+    async def test_full_pool_asks_to_retry(self):
+        release = threading.Event()
+
+        def blocked_is_duplicate(key):
+            release.wait(5)
+            return False
+
+        with mock.patch("apps.dataAPI.views.is_duplicate", blocked_is_duplicate):
+            first = asyncio.ensure_future(self.post(build_payload(samples=5)))
+            while pool.pending < 1:
+                await asyncio.sleep(0.01)
+            second = await self.post(build_payload(identifier="exp-2", samples=5))
+            release.set()
+            first = await first
+
+        self.assertEqual(second.status_code, 429)
+        self.assertIn("Retry-After", second)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(await Measurement.objects.acount(), 5)
+
+
+class DeduplicationTests(TestCase):
+
+    def post(self, payload, **headers):
+        return self.client.post(
+            "/measurements-api/send/", json.dumps(payload), content_type="application/json", headers=headers
+        )
+
+    def test_retried_send_is_acknowledged_once(self):
+        payload = build_payload(samples=20)
+
+        self.assertEqual(self.post(payload).status_code, 201)
+        response = self.post(payload)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"duplicate": True})
+        self.assertEqual(Measurement.objects.count(), 20)
+
+    def test_batch_id_identifies_send(self):
+        self.assertEqual(self.post(build_payload(samples=5), x_batch_id="b-1").status_code, 201)
+        self.assertEqual(self.post(build_payload(samples=6), x_batch_id="b-1").status_code, 200)
+
+        payload = build_payload(samples=7)
+        payload["batch_id"] = "b-2"
+        self.assertEqual(self.post(payload).status_code, 201)
+        payload["measurements"].pop()
+        self.assertEqual(self.post(payload).status_code, 200)
+
+        self.assertEqual(Measurement.objects.count(), 12)
+        self.assertEqual(IngestedBatch.objects.count(), 2)
+
+    @override_settings(MEASUREMENTS_BULK_CHUNK_SIZE=5)
+    def test_partly_stored_send_is_stored_on_retry(self):
+        payload = build_payload(samples=12)
+        write = ORMStorage.write
+        chunks = []
+
+        def locked_second_chunk(storage, *args):
+            chunks.append(args)
+            if len(chunks) == 2:
+                raise DatabaseError("database is locked")
+            return write(storage, *args)
+
+        with mock.patch.object(ORMStorage, "write", autospec=True, side_effect=locked_second_chunk):
+            response = self.post(payload, x_batch_id="b-1")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()["inserted"], 0)
+        self.assertEqual(Measurement.objects.count(), 0)
+
+        self.assertEqual(self.post(payload, x_batch_id="b-1").status_code, 201)
+        self.assertEqual(Measurement.objects.count(), 12)
+        self.assertEqual(ExperimentSummary.objects.get(experiment__identifier="exp-1").samples, 12)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1000)
+    def test_sends_over_upload_memory_size_are_stored(self):
+        self.assertEqual(self.post(build_payload(samples=100)).status_code, 201)
+        self.assertEqual(self.post(build_payload(samples=100)).status_code, 200)
+        self.assertEqual(Measurement.objects.count(), 100)
+
+    @override_settings(MEASUREMENTS_MAX_BODY_SIZE=1000)
+    def test_sends_over_max_body_size_are_rejected(self):
+        self.assertEqual(self.post(build_payload(samples=100)).status_code, 413)
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_dedupe_command_prunes_old_keys(self):
+        IngestedBatch.objects.create(key="id:old", created=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.post(build_payload(samples=5), x_batch_id="new").status_code, 201)
+
+        call_command("dedupe_measurements", "--keys-only", stdout=open(os.devnull, "w"))
+
+        self.assertEqual(list(IngestedBatch.objects.values_list("key", flat=True)), ["id:new"])
+
+    def test_dedupe_command_keeps_first_copy(self):
+        payload = build_payload(samples=10)
+        for _ in range(3):
+            ingest_batch(MeasurementBatch.from_measurements(payload["identifier"], payload["measurements"]))
+        first_ids = list(Measurement.objects.order_by("id").values_list("id", flat=True)[:10])
+
+        call_command("dedupe_measurements", "--chunk-size", "3", stdout=open(os.devnull, "w"))
+
+        self.assertEqual(list(Measurement.objects.order_by("id").values_list("id", flat=True)), first_ids)
+
+
+class ColumnarWireFormatTests(TestCase):
+
+    def post(self, body, **headers):
+        return self.client.post("/measurements-api/send/", body, content_type=MEDIA_TYPE, headers=headers)
+
+    def test_columnar_send_is_stored(self):
+        dates = [1700000000000 + i * 20 for i in range(50)]
+        body = encode(
+            "exp-1",
+            [("acc-x", dates, [0.5] * 50), ("heart_rate", dates[:3], [60.0, 61.0, 62.0])],
+            compression="gzip",
+        )
+
+        response = self.post(body, content_encoding="gzip")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Measurement.objects.filter(type__name="acc-x").count(), 50)
+        last = Measurement.objects.filter(type__name="heart_rate").order_by("timestamp").last()
+        self.assertEqual(last.value, 62.0)
+        self.assertEqual(int(last.timestamp.timestamp() * 1000), dates[2])
+
+    def test_decoded_batch_keeps_arrays(self):
+        batch = decode(encode("exp-1", [("acc-x", [1, 2], [0.5, 1.5]), ("hr", [3], [60.0]), ("acc-x", [4], [2.0])]))
+
+        self.assertIsInstance(batch.dates, np.ndarray)
+        self.assertIsInstance(batch.values, np.ndarray)
+        self.assertEqual(batch.to_lists(), ([1, 2, 3, 4], ["acc-x", "acc-x", "hr", "acc-x"], [0.5, 1.5, 60.0, 2.0]))
+        ingest_batch(batch)
+        self.assertEqual(
+            list(Measurement.objects.order_by("timestamp").values_list("type__name", "value")),
+            [("acc-x", 0.5), ("acc-x", 1.5), ("hr", 60.0), ("acc-x", 2.0)],
+        )
+
+    @override_settings(MEASUREMENTS_MAX_BODY_SIZE=100000)
+    def test_decompression_is_bounded(self):
+        for compression in ("gzip", "zstd") if zstandard else ("gzip",):
+            body = encode("exp-1", [("acc-x", range(20000), [0.0] * 20000)], compression=compression)
+            self.assertLess(len(body), 10000)
+
+            response = self.post(body, content_encoding=compression)
+
+            self.assertEqual(response.status_code, 413)
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_non_finite_values_are_rejected(self):
+        for value in (float("nan"), float("inf")):
+            body = encode("exp-1", [("acc-x", [1, 2, 3], [0.1, value, 0.3])])
+
+            response = self.post(body)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("finite", response.json()["detail"])
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_out_of_range_dates_are_rejected(self):
+        body = encode("exp-1", [("acc-x", [1, 10**17], [0.1, 0.2])])
+
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Dates of acc-x must be between", response.json()["detail"])
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_truncated_send_is_rejected(self):
+        body = encode("exp-1", [("acc-x", [1, 2, 3], [0.1, 0.2, 0.3])])
+
+        response = self.post(body[:-2])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Measurement.objects.count(), 0)
+
+
+class IngestSpoolTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spool_settings = override_settings(
+            MEASUREMENTS_INGEST_MODE="spool",
+            MEASUREMENTS_SPOOL_PATH=Path(directory.name) / "spool.sqlite3",
+            MEASUREMENTS_SPOOL_MAX_DEPTH=2,
+            MEASUREMENTS_SPOOL_RETRY_AFTER=7,
+        )
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+        self.addCleanup(lambda: get_spool().close())
+
+    def post(self, payload):
+        return self.client.post(
+            "/measurements-api/send/", json.dumps(payload), content_type="application/json"
+        )
+
+    def test_send_is_queued_and_drained(self):
+        self.assertEqual(self.post(build_payload(samples=10)).status_code, 202)
+        self.assertEqual(self.post(build_payload(samples=5)).status_code, 202)
+        self.assertEqual(Measurement.objects.count(), 0)
+        self.assertEqual(get_spool().depth(), 2)
+
+        call_command("drain_ingest_spool", "--once", stdout=open(os.devnull, "w"))
+
+        self.assertEqual(Measurement.objects.count(), 15)
+        self.assertEqual(get_spool().depth(), 0)
+
+    def test_columnar_send_is_queued(self):
+        body = encode("exp-1", [("acc-x", [1700000000000, 1700000000020], [0.5, 1.5])])
+        response = self.client.post("/measurements-api/send/", body, content_type=MEDIA_TYPE)
+        self.assertEqual(response.status_code, 202)
+
+        call_command("drain_ingest_spool", "--once", stdout=open(os.devnull, "w"))
+
+        self.assertEqual(list(Measurement.objects.order_by("timestamp").values_list("value", flat=True)), [0.5, 1.5])
+
+    def test_locked_chunk_is_retried(self):
+        self.post(build_payload(samples=10))
+        self.post(build_payload(identifier="exp-2", samples=5))
+        write = ORMStorage.write
+        chunks = []
+
+        def locked_first_chunk(storage, *args):
+            chunks.append(args)
+            if len(chunks) == 1:
+                raise DatabaseError("database is locked")
+            return write(storage, *args)
+
+        stderr = io.StringIO()
+        with mock.patch.object(ORMStorage, "write", autospec=True, side_effect=locked_first_chunk):
+            call_command("drain_ingest_spool", "--once", "--interval", "0", stdout=open(os.devnull, "w"), stderr=stderr)
+
+        self.assertIn("database is locked", stderr.getvalue())
+        self.assertEqual(Measurement.objects.filter(experiment__identifier="exp-1").count(), 10)
+        self.assertEqual(Measurement.objects.filter(experiment__identifier="exp-2").count(), 5)
+        self.assertEqual(get_spool().depth(), 0)
+
+    def test_failing_batch_does_not_block_the_spool(self):
+        spool = get_spool()
+        spool.append(MeasurementBatch("exp-1", [10**17], ["heart_rate"], [1.0]))
+        self.post(build_payload(identifier="exp-2", samples=5))
+
+        stderr = io.StringIO()
+        call_command("drain_ingest_spool", "--once", "--interval", "0", stdout=open(os.devnull, "w"), stderr=stderr)
+
+        self.assertIn("Moved data send 1 of experiment exp-1 to the failed batches", stderr.getvalue())
+        self.assertEqual(Measurement.objects.filter(experiment__identifier="exp-2").count(), 5)
+        self.assertEqual(spool.depth(), 0)
+        self.assertEqual(spool.failed(), 1)
+
+    def test_out_of_range_date_is_not_queued(self):
+        payload = build_payload(samples=3)
+        payload["measurements"][1]["date"] = 10**17
+
+        response = self.post(payload)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("measurements", response.json())
+        self.assertEqual(get_spool().depth(), 0)
+
+    def test_full_spool_asks_to_retry(self):
+        self.post(build_payload())
+        self.post(build_payload())
+
+        response = self.post(build_payload())
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(get_spool().depth(), 2)
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path("measurements-api/send/", views.Measurements_append.as_view()),
+    path("measurements-api/send-async/", views.Measurements_append_async.as_view()),
 ]
\ No newline at end of file
@@ -0,0 +1,177 @@
+import re
+
+from .ingestion import MeasurementBatch
+from .storage.base import MAX_MILLIS, MIN_MILLIS
+
+# Error messages of the DRF fields used by MeasurementsSerializer, so both
+# validation paths answer a bad data send with the same 400 body
+REQUIRED = "This field is required."
+NULL = "This field may not be null."
+BLANK = "This field may not be blank."
+INVALID_STRING = "Not a valid string."
+INVALID_INTEGER = "A valid integer is required."
+INVALID_NUMBER = "A valid number is required."
+MIN_VALUE = "Ensure this value is greater than or equal to {}."
+MAX_VALUE = "Ensure this value is less than or equal to {}."
+NOT_A_DICT = "Invalid data. Expected a dictionary, but got {}."
+NOT_A_LIST = 'Expected a list of items but got type "{}".'
+
+VALIDATION_SERIALIZER = "serializer"
+VALIDATION_FAST = "fast"
+VALIDATION_MODES = (VALIDATION_SERIALIZER, VALIDATION_FAST)
+
+DECIMAL_ZEROS = re.compile(r"\.0*\s*$")
+
+
+# Per-field coercions replicating CharField, IntegerField and FloatField.
+# They return the coerced value or raise ValueError with the DRF message.
+def coerce_string(value):
+    if value is None:
+        raise ValueError(NULL)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(INVALID_STRING)
+    value = str(value).strip()
+    if not value:
+        raise ValueError(BLANK)
+    return value
+
+
+def coerce_integer(value):
+    if value is None:
+        raise ValueError(NULL)
+    if isinstance(value, bool):
+        raise ValueError(INVALID_INTEGER)
+    try:
+        return int(DECIMAL_ZEROS.sub("", str(value)))
+    except (ValueError, TypeError):
+        raise ValueError(INVALID_INTEGER)
+
+
+# Dates are integers within the range of the stored timestamps
+def coerce_date(value):
+    date = coerce_integer(value)
+    if date < MIN_MILLIS:
+        raise ValueError(MIN_VALUE.format(MIN_MILLIS))
+    if date > MAX_MILLIS:
+        raise ValueError(MAX_VALUE.format(MAX_MILLIS))
+    return date
+
+
+def coerce_number(value):
+    if value is None:
+        raise ValueError(NULL)
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(INVALID_NUMBER)
+
+
+"""
+Validate a single sample with the per-field coercions, collecting its errors
+"""
+def validate_sample(element):
+    if not isinstance(element, dict):
+        return None, {"non_field_errors": [NOT_A_DICT.format(type(element).__name__)]}
+
+    sample = {}
+    errors = {}
+    for field, coerce in (("date", coerce_date), ("type", coerce_string), ("value", coerce_number)):
+        if field not in element:
+            errors[field] = [REQUIRED]
+            continue
+        try:
+            sample[field] = coerce(element[field])
+        except ValueError as e:
+            errors[field] = [str(e)]
+    return sample, errors
+
+
+"""
+Validate the "measurements" list column by column. The common case (int dates,
+str types and numeric values, as SmartBioStream sends them) is checked over the
+whole list at once; only when a column fails are its samples coerced one by one.
+"""
+def validate_columns(measurements):
+    try:
+        dates = [element["date"] for element in measurements]
+        types = [element["type"] for element in measurements]
+        values = [element["value"] for element in measurements]
+    except (KeyError, TypeError):
+        return None, validate_samples(measurements)
+
+    dates_ok = all(type(date) is int and MIN_MILLIS <= date <= MAX_MILLIS for date in dates)
+    types_ok = all(type(sample_type) is str for sample_type in types) and all(
+        sample_type and not sample_type[0].isspace() and not sample_type[-1].isspace()
+        for sample_type in types
+    )
+    values_ok = all(type(value) is float or type(value) is int for value in values)
+
+    if dates_ok and types_ok and values_ok:
+        return (dates, types, [float(value) for value in values]), {}
+    return None, validate_samples(measurements)
+
+
+"""
+Slow path: validate every sample and return the errors indexed by position
+"""
+def validate_samples(measurements):
+    errors = {}
+    for index, element in enumerate(measurements):
+        _, sample_errors = validate_sample(element)
+        if sample_errors:
+            errors[index] = sample_errors
+    return errors
+
+
+"""
+Coerce every sample of a list that failed the columnar checks but may still be valid
+"""
+def coerce_samples(measurements):
+    samples = [validate_sample(element)[0] for element in measurements]
+    return (
+        [sample["date"] for sample in samples],
+        [sample["type"] for sample in samples],
+        [sample["value"] for sample in samples],
+    )
+
+
+"""
+Fast-path validation of a data send. Returns a MeasurementBatch and an empty
+dict, or None and the errors in the same format as MeasurementsSerializer.errors.
+"""
+def validate_data_send(data):
+    if not isinstance(data, dict):
+        return None, {"non_field_errors": [NOT_A_DICT.format(type(data).__name__)]}
+
+    errors = {}
+    identifier = None
+    if "identifier" not in data:
+        errors["identifier"] = [REQUIRED]
+    else:
+        try:
+            identifier = coerce_string(data["identifier"])
+        except ValueError as e:
+            errors["identifier"] = [str(e)]
+
+    columns = None
+    if "measurements" not in data:
+        errors["measurements"] = [REQUIRED]
+    elif data["measurements"] is None:
+        errors["measurements"] = [NULL]
+    elif isinstance(data["measurements"], (str, dict)) or not hasattr(data["measurements"], "__iter__"):
+        errors["measurements"] = [NOT_A_LIST.format(type(data["measurements"]).__name__)]
+    else:
+        measurements = list(data["measurements"])
+        columns, sample_errors = validate_columns(measurements)
+        if sample_errors:
+            errors["measurements"] = sample_errors
+        elif columns is None:
+            columns = coerce_samples(measurements)
+
+    if errors:
+        return None, errors
+
+    dates, types, values = columns
+    return MeasurementBatch(identifier, dates, types, values), {}
@@ -1,18 +1,144 @@
+import io
 import json
+import logging
 from django.shortcuts import render
 from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 from django.db import IntegrityError
 from django.http import JsonResponse
 from django.db.models import Min, Max, Count
-from venv import logger
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
+from apps.monitoring.budget import query_budget
+from apps.monitoring.metrics import span
+
+from .dedupe import batch_key_from_body, batch_key_from_id, is_duplicate
+from .ingestion import MeasurementBatch, ingest_batch
 from .models import Measurement
+from .pool import PoolFull, run_in_pool
 from .serializer import MeasurementsSerializer
+from .spool import INGEST_SPOOL, get_ingest_mode, get_max_depth, get_retry_after, get_spool
+from .validation import VALIDATION_FAST, VALIDATION_SERIALIZER, validate_data_send
+from .wire import BodyTooLarge, WireFormatError, decode_request, is_columnar, read_body
+
+logger = logging.getLogger(__name__)
+
+
+# Validation, queueing and storage of the data sends, shared by the synchronous
+# and the asynchronous endpoints
+class DataSendHandler:
+    # Validation of the data sends: "serializer" (MeasurementsSerializer) or "fast"
+    # (columnar checks). None uses MEASUREMENTS_VALIDATION; can be set per endpoint
+    # with Measurements_append.as_view(validation="fast")
+    validation = None
+
+    def get_validation(self):
+        return self.validation or getattr(settings, "MEASUREMENTS_VALIDATION", VALIDATION_SERIALIZER)
+
+    # Validate a data send, returning the batch to store or the errors
+    def validate(self, data):
+        if self.get_validation() == VALIDATION_FAST:
+            return validate_data_send(data)
+
+        serializer = MeasurementsSerializer(data=data)
+        if not serializer.is_valid():
+            return None, serializer.errors
+        batch = MeasurementBatch.from_measurements(
+            serializer.validated_data["identifier"], serializer.validated_data["measurements"]
+        )
+        return batch, {}
+
+    # Decode and validate the body of a data send. Return the batch, keyed by
+    # the "batch_id" field of a JSON data send sent without X-Batch-Id or by
+    # "key" otherwise, and the errors.
+    def parse(self, request, body, key, batch_id):
+        # Columnar data sends are decoded directly into a batch; any
+        # other content type is handled as the original JSON format
+        if is_columnar(request):
+            with span("ingest.decode"):
+                batch, errors = decode_request(request, body), {}
+        else:
+            with span("ingest.parse"):
+                data = JSONParser().parse(io.BytesIO(body))
+            if not batch_id and isinstance(data, dict) and data.get("batch_id"):
+                key = batch_key_from_id(data["batch_id"])
+            with span("ingest.validate"):
+                batch, errors = self.validate(data)
+        if errors:
+            return None, errors
+        batch.key = key
+        return batch, errors
+
+    # Queue a validated batch for the background writer, or ask the watch
+    # to retry later when the spool is full
+    def enqueue(self, batch):
+        spool = get_spool()
+        if spool.depth() >= get_max_depth():
+            return self.retry_later("Ingest queue is full, retry later")
+        with span("ingest.enqueue"):
+            spool.append(batch)
+        return JsonResponse({}, status=202)
+
+    # Store a validated batch, or queue it in spool mode
+    def store(self, batch):
+        if get_ingest_mode() == INGEST_SPOOL:
+            return self.enqueue(batch)
+
+        with span("ingest.store"):
+            report = ingest_batch(batch)
+        if report.duplicate:
+            return self.duplicate()
+        if not report.ok:
+            return JsonResponse(
+                {"detail": "Some measurements could not be stored", **report.as_dict()},
+                status=500,
+            )
+        return JsonResponse({}, status=201)
+
+    # The data send was already stored: acknowledge it so the watch stops retrying
+    def duplicate(self):
+        return JsonResponse({"duplicate": True}, status=200)
+
+    def retry_later(self, detail):
+        response = JsonResponse({"detail": detail}, status=429)
+        response["Retry-After"] = str(get_retry_after())
+        return response
+
+    # Answer a data send that could not be parsed or stored
+    def error(self, e):
+        if isinstance(e, BodyTooLarge):
+            logger.error(f"BodyTooLarge: {e}")
+            return JsonResponse({"detail": str(e)}, status=413)
+        if isinstance(e, WireFormatError):
+            logger.error(f"WireFormatError: {e}")
+            return JsonResponse({"detail": str(e)}, status=400)
+        if isinstance(e, KeyError):
+            logger.error(f"KeyError: Missing key {e}")
+            return JsonResponse({"detail": f"Missing key: {str(e)}"}, status=400)
+        if isinstance(e, ValueError):
+            logger.error(f"ValueError: {e}")
+            return JsonResponse({"detail": "Invalid value provided"}, status=400)
+        if isinstance(e, IntegrityError):
+            logger.error(f"IntegrityError: {e}")
+            return JsonResponse({"detail": "Database integrity error"}, status=400)
+        if isinstance(e, TypeError):
+            logger.error(f"TypeError: {e}")
+            return JsonResponse(
+                {"detail": "Invalid data type provided"}, status=400
+            )
+        logger.error(f"Invalid JSON, possible connection verification: ")
+        return JsonResponse(
+            {"detail": "An unexpected error occurred", "error": str(e)},
+            status=400,
+        )
 
 
 # API to receive and store external data
-class Measurements_append(APIView):
+@query_budget(40)
+class Measurements_append(DataSendHandler, APIView):
 
     def get(self, request):
         return JsonResponse({"detail": "Get not allowed"}, status=405)
@@ -21,35 +147,51 @@ class Measurements_append(APIView):
     def post(self, request):
         if request.method == "POST":
             try:
-                data = JSONParser().parse(request)
-                serializer = MeasurementsSerializer(data=data)
-                if serializer.is_valid():
-                    serializer.create(serializer.validated_data)
-                    return JsonResponse({}, status=201)
-                else:
-                    return JsonResponse(serializer.errors, status=400)
-            except KeyError as e:
-                logger.error(f"KeyError: Missing key {e}")
-                return JsonResponse({"detail": f"Missing key: {str(e)}"}, status=400)
-            except ValueError as e:
-                logger.error(f"ValueError: {e}")
-                return JsonResponse({"detail": "Invalid value provided"}, status=400)
-
-            except IntegrityError as e:
-                logger.error(f"IntegrityError: {e}")
-                return JsonResponse({"detail": "Database integrity error"}, status=400)
-
-            except TypeError as e:
-                logger.error(f"TypeError: {e}")
-                return JsonResponse(
-                    {"detail": "Invalid data type provided"}, status=400
-                )
+                # Retried data sends are acknowledged without parsing them again
+                batch_id = request.META.get("HTTP_X_BATCH_ID")
+                body = read_body(request)
+                key = batch_key_from_id(batch_id) if batch_id else batch_key_from_body(body)
+                if is_duplicate(key):
+                    return self.duplicate()
 
+                batch, errors = self.parse(request, body, key, batch_id)
+                if errors:
+                    return JsonResponse(errors, status=400)
+                if batch.key != key and is_duplicate(batch.key):
+                    return self.duplicate()
+                return self.store(batch)
             except Exception as e:
-                logger.error(f"Invalid JSON, possible connection verification: ")
-                return JsonResponse(
-                    {"detail": "An unexpected error occurred", "error": str(e)},
-                    status=400,
-                )
+                return self.error(e)
         else:
             return JsonResponse({"detail": "Only post available"}, status=400)
+
+
+# Asynchronous version of Measurements_append, for ASGI servers (e.g. uvicorn).
+# The data sends are parsed and validated on the event loop and only the database
+# work runs in the bounded thread pool of apps.dataAPI.pool, so thousands of
+# watches can keep their connections open without holding a thread each.
+@query_budget(40)
+@method_decorator(csrf_exempt, name="dispatch")
+class Measurements_append_async(DataSendHandler, View):
+
+    async def get(self, request):
+        return JsonResponse({"detail": "Get not allowed"}, status=405)
+
+    async def post(self, request):
+        try:
+            batch_id = request.META.get("HTTP_X_BATCH_ID")
+            body = read_body(request)
+            key = batch_key_from_id(batch_id) if batch_id else batch_key_from_body(body)
+            if await run_in_pool(is_duplicate, key):
+                return self.duplicate()
+
+            batch, errors = self.parse(request, body, key, batch_id)
+            if errors:
+                return JsonResponse(errors, status=400)
+            if batch.key != key and await run_in_pool(is_duplicate, batch.key):
+                return self.duplicate()
+            return await run_in_pool(self.store, batch)
+        except PoolFull:
+            return self.retry_later("Server busy, retry later")
+        except Exception as e:
+            return self.error(e)
@@ -0,0 +1,279 @@
+"""
+Compact columnar wire format for the data sends of SmartBioStream.
+
+Instead of repeating {"date", "type", "value"} for every sample, a columnar data
+send carries one column per measurement type. All integers are little-endian:
+
+    magic            4 bytes   b"BSC1"
+    identifier       u16 length + UTF-8 bytes
+    columns          u16
+    for each column:
+        type         u16 length + UTF-8 bytes
+        value size   u8        4 (float32) or 8 (float64)
+        samples      u32       n
+        base         i64       timestamp of reference (UNIX ms)
+        offsets      n x i64   delta-encoded: each sample's date minus the previous
+                               one (the first one minus the base)
+        values       n x f4/f8
+
+The body may be compressed, announced with Content-Encoding: gzip or zstd
+(zstd requires the optional zstandard package).
+"""
+import gzip
+import struct
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .ingestion import MeasurementBatch
+from .storage.base import MAX_MILLIS, MIN_MILLIS
+
+MEDIA_TYPE = "application/vnd.biostream.columnar"
+MAGIC = b"BSC1"
+
+DEFAULT_MAX_BODY_SIZE = 64 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+VALUE_DTYPES = {4: np.dtype("<f4"), 8: np.dtype("<f8")}
+OFFSET_DTYPE = np.dtype("<i8")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Error raised for malformed or unsupported columnar data sends
+class WireFormatError(ValueError):
+    pass
+
+
+# Error raised for data sends over MEASUREMENTS_MAX_BODY_SIZE
+class BodyTooLarge(WireFormatError):
+    pass
+
+
+def get_max_body_size():
+    return getattr(settings, "MEASUREMENTS_MAX_BODY_SIZE", DEFAULT_MAX_BODY_SIZE)
+
+
+"""
+Read the body of a data send. It is read from the stream rather than with
+request.body, which rejects bodies over DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB by
+default), less than the backlog of a watch that was offline for a while.
+MEASUREMENTS_MAX_BODY_SIZE bounds it instead.
+"""
+def read_body(request):
+    limit = get_max_body_size()
+    chunks = []
+    size = 0
+    while True:
+        chunk = request.read(READ_SIZE)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge(f"Data sends are limited to {limit} bytes")
+        chunks.append(chunk)
+
+
+"""
+Return True when a request carries a columnar data send
+"""
+def is_columnar(request):
+    content_type = request.META.get("CONTENT_TYPE", "")
+    return content_type.split(";")[0].strip().lower() == MEDIA_TYPE
+
+
+"""
+Undo the Content-Encoding of a request body. The body is decompressed
+incrementally and rejected once it grows over MEASUREMENTS_MAX_BODY_SIZE, so
+a small compressed body cannot expand to gigabytes in memory.
+"""
+def decompress(body, encoding):
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    limit = get_max_body_size()
+    if encoding == "gzip":
+        try:
+            return gunzip(body, limit)
+        except zlib.error as e:
+            raise WireFormatError(f"Invalid gzip body: {e}")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise WireFormatError("zstd bodies require the zstandard package")
+        try:
+            return unzstd(body, limit)
+        except zstandard.ZstdError as e:
+            raise WireFormatError(f"Invalid zstd body: {e}")
+    raise WireFormatError(f"Unsupported Content-Encoding: {encoding}")
+
+
+def too_large(limit):
+    return BodyTooLarge(f"Decompressed data sends are limited to {limit} bytes")
+
+
+# Decompress every gzip member of a body, at most "limit" bytes in total
+def gunzip(body, limit):
+    chunks = []
+    size = 0
+    while body:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunk = decompressor.decompress(body, limit - size + 1)
+        while True:
+            size += len(chunk)
+            if size > limit:
+                raise too_large(limit)
+            chunks.append(chunk)
+            if decompressor.eof or not decompressor.unconsumed_tail:
+                break
+            chunk = decompressor.decompress(decompressor.unconsumed_tail, limit - size + 1)
+        if not decompressor.eof:
+            raise WireFormatError("Invalid gzip body: truncated")
+        body = decompressor.unused_data
+    return b"".join(chunks)
+
+
+def unzstd(body, limit):
+    reader = zstandard.ZstdDecompressor().stream_reader(body)
+    chunks = []
+    size = 0
+    while True:
+        chunk = reader.read(READ_SIZE)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise too_large(limit)
+        chunks.append(chunk)
+
+
+# Sequential reader over the bytes of a data send
+class Reader:
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        if self.position + size > len(self.data):
+            raise WireFormatError("Truncated columnar data send")
+        values = struct.unpack_from(fmt, self.data, self.position)
+        self.position += size
+        return values
+
+    def string(self):
+        (length,) = self.unpack("<H")
+        raw = self.bytes(length)
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError:
+            raise WireFormatError("Strings must be UTF-8")
+
+    def bytes(self, size):
+        if self.position + size > len(self.data):
+            raise WireFormatError("Truncated columnar data send")
+        raw = self.data[self.position:self.position + size]
+        self.position += size
+        return raw
+
+    def array(self, dtype, count):
+        size = dtype.itemsize * count
+        if self.position + size > len(self.data):
+            raise WireFormatError("Truncated columnar data send")
+        array = np.frombuffer(self.data, dtype=dtype, count=count, offset=self.position)
+        self.position += size
+        return array
+
+
+"""
+Decode a columnar data send into a MeasurementBatch
+"""
+def decode(data):
+    reader = Reader(data)
+    if reader.bytes(len(MAGIC)) != MAGIC:
+        raise WireFormatError("Not a columnar data send")
+
+    identifier = reader.string().strip()
+    if not identifier:
+        raise WireFormatError("The identifier may not be blank")
+
+    (column_count,) = reader.unpack("<H")
+    dates, values, column_types, counts = [], [], [], []
+    for _ in range(column_count):
+        sample_type = reader.string().strip()
+        if not sample_type:
+            raise WireFormatError("The measurement type may not be blank")
+        value_size, count, base = reader.unpack("<BIq")
+        if value_size not in VALUE_DTYPES:
+            raise WireFormatError(f"Unsupported value size: {value_size}")
+
+        offsets = reader.array(OFFSET_DTYPE, count)
+        column_values = reader.array(VALUE_DTYPES[value_size], count)
+        # As the JSON parser, which rejects NaN and Infinity
+        if not np.isfinite(column_values).all():
+            raise WireFormatError(f"Values of {sample_type} must be finite numbers")
+
+        column_dates = base + np.cumsum(offsets, dtype=np.int64)
+        if count and (column_dates.min() < MIN_MILLIS or column_dates.max() > MAX_MILLIS):
+            raise WireFormatError(f"Dates of {sample_type} must be between {MIN_MILLIS} and {MAX_MILLIS}")
+
+        dates.append(column_dates)
+        values.append(column_values.astype(np.float64, copy=False))
+        column_types.append(sample_type)
+        counts.append(count)
+
+    if reader.position != len(data):
+        raise WireFormatError("Unexpected bytes after the last column")
+
+    if not dates:
+        return MeasurementBatch(identifier, [], [], [])
+    # The samples stay in arrays; their types are indexes into column_types
+    return MeasurementBatch(
+        identifier,
+        np.concatenate(dates),
+        np.repeat(np.arange(len(column_types)), counts),
+        np.concatenate(values),
+        column_types=column_types,
+    )
+
+
+"""
+Decode the body (read with read_body) of a request whose content type is MEDIA_TYPE
+"""
+def decode_request(request, body):
+    return decode(decompress(body, request.META.get("HTTP_CONTENT_ENCODING")))
+
+
+"""
+Encode a data send. "columns" is a list of (type, dates, values) with the dates
+in UNIX ms; used by clients, tests and benchmarks.
+"""
+def encode(identifier, columns, value_size=4, compression=None):
+    value_dtype = VALUE_DTYPES[value_size]
+    parts = [MAGIC, encode_string(identifier), struct.pack("<H", len(columns))]
+    for sample_type, dates, values in columns:
+        dates = np.asarray(dates, dtype=np.int64)
+        base = int(dates[0]) if len(dates) else 0
+        offsets = np.diff(dates, prepend=base).astype(OFFSET_DTYPE)
+        parts.append(encode_string(sample_type))
+        parts.append(struct.pack("<BIq", value_size, len(dates), base))
+        parts.append(offsets.tobytes())
+        parts.append(np.asarray(values, dtype=value_dtype).tobytes())
+    body = b"".join(parts)
+
+    if compression == "gzip":
+        return gzip.compress(body)
+    if compression == "zstd":
+        if zstandard is None:
+            raise WireFormatError("zstd bodies require the zstandard package")
+        return zstandard.ZstdCompressor().compress(body)
+    return body
+
+
+def encode_string(value):
+    raw = value.encode("utf-8")
+    return struct.pack("<H", len(raw)) + raw
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.monitoring"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .metrics import install_query_counter
+
+        # Queries of the requests counted by MetricsMiddleware
+        connection_created.connect(install_query_counter, dispatch_uid="apps.monitoring.install_query_counter")
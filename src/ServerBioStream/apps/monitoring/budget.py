@@ -0,0 +1,119 @@
+"""
+Query budgets of the views: the most SQL queries, and optionally seconds in the
+database, that a request to a view may take. A view declares its budget with
+@query_budget and QueryBudgetMiddleware checks it as QUERY_BUDGET_MODE says:
+    "raise"  every request is checked and fails with QueryBudgetExceeded when
+             over its budget of queries (the test runner sets this mode, so a
+             view that grows an N+1 query fails the tests that call it)
+    "log"    QUERY_BUDGET_SAMPLE_RATE of the requests are checked and the ones
+             over budget, in queries or seconds, are logged with the most
+             repeated query
+    "off"    nothing is checked
+The queries run by a streamed answer after the view returns are not counted.
+"""
+import logging
+import random
+from collections import Counter
+
+from django.conf import settings
+
+from .metrics import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+BUDGET_OFF = "off"
+BUDGET_LOG = "log"
+BUDGET_RAISE = "raise"
+BUDGET_MODES = (BUDGET_OFF, BUDGET_LOG, BUDGET_RAISE)
+
+DEFAULT_BUDGET_SAMPLE_RATE = 0.01
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+
+    def __init__(self, queries, seconds=None):
+        self.queries = queries
+        self.seconds = seconds
+
+    def __str__(self):
+        if self.seconds is None:
+            return f"{self.queries} queries"
+        return f"{self.queries} queries / {self.seconds * 1000:.0f} ms"
+
+
+"""
+Declare the budget of a view, function or class, e.g.
+    @query_budget(8)
+    @login_required
+    def get_data(request):
+"""
+def query_budget(queries, seconds=None):
+    def decorator(view):
+        view.query_budget = Budget(queries, seconds)
+        return view
+    return decorator
+
+
+def get_budget_mode():
+    return getattr(settings, "QUERY_BUDGET_MODE", BUDGET_OFF)
+
+
+def get_budget_sample_rate():
+    return getattr(settings, "QUERY_BUDGET_SAMPLE_RATE", DEFAULT_BUDGET_SAMPLE_RATE)
+
+
+"""
+Return the budget of a resolved view (request.resolver_match.func), or None
+"""
+def get_budget(view):
+    budget = getattr(view, "query_budget", None)
+    if budget is None:
+        budget = getattr(getattr(view, "view_class", None), "query_budget", None)
+    return budget
+
+
+"""
+Whether the queries of a request are counted: always in "raise" mode and for a
+sample of the requests in "log" mode
+"""
+def should_check(mode):
+    if mode == BUDGET_RAISE:
+        return True
+    return mode == BUDGET_LOG and random.random() < get_budget_sample_rate()
+
+
+# Queries of a request, keeping their SQL to show the repeated ones
+class BudgetQueries(QueryCounter):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.statements = Counter()
+
+    def executed(self, sql, seconds):
+        self.statements[sql] += 1
+
+
+"""
+Compare the queries of a request with the budget of its view: raise
+QueryBudgetExceeded or log a warning, depending on "mode"
+"""
+def check_budget(name, budget, queries, mode):
+    over = queries.queries > budget.queries
+    # Database time depends too much on the machine to fail the tests
+    if mode == BUDGET_LOG and budget.seconds is not None:
+        over = over or queries.seconds > budget.seconds
+    if not over:
+        return
+
+    message = f"{name} ran {queries.queries} queries in {queries.seconds * 1000:.1f} ms, over its budget of {budget}"
+    if queries.statements:
+        sql, times = queries.statements.most_common(1)[0]
+        if times > 1:
+            message += f". Ran {times} times: {sql[:300]}"
+    if mode == BUDGET_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,312 @@
+"""
+In-process counters and histograms of the hot paths (data sends and reads of
+the measurements), exposed in the Prometheus text format by the metrics view.
+Everything is a no-op while METRICS_ENABLED is off. Each server process keeps
+its own values, so with several workers every one of them has to be scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Samples per data send
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+# Database queries per request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+NULL_SPAN = nullcontext()
+
+
+def metrics_enabled():
+    return getattr(settings, "METRICS_ENABLED", False)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Base of the metrics: a name, a help text and one value per combination of labels
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def render_value(self, key, value):
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    # Values are [samples per bucket (the last one above every bound), sum]
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def count(self, **labels):
+        counts = self.values.get(self.key(labels))
+        return sum(counts[0]) if counts else 0
+
+    def render_value(self, key, value):
+        buckets, total = value
+        lines = []
+        cumulative = 0
+        for bound, samples in zip(self.buckets + (float("inf"),), buckets):
+            cumulative += samples
+            labels = format_labels(self.labels, key, f'le="{format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+request_seconds = Histogram(
+    "biostream_request_duration_seconds",
+    "Time to answer a request, until the headers of streamed answers",
+    ("route", "method", "status"),
+)
+request_queries = Histogram(
+    "biostream_request_db_queries",
+    "Database queries run by a request",
+    ("route",),
+    QUERY_COUNT_BUCKETS,
+)
+query_seconds = Histogram(
+    "biostream_db_query_duration_seconds",
+    "Time of the database queries of the requests by statement; BEGIN includes the wait for the SQLite write lock",
+    ("statement",),
+)
+span_seconds = Histogram(
+    "biostream_span_duration_seconds",
+    "Time of each step of the data sends and of the reads of the measurements",
+    ("span",),
+)
+samples_ingested = Counter(
+    "biostream_samples_ingested_total",
+    "Samples stored by the data sends, by type",
+    ("type",),
+)
+batch_samples = Histogram(
+    "biostream_batch_size_samples",
+    "Samples per stored data send",
+    buckets=BATCH_BUCKETS,
+)
+sqlite_busy = Counter(
+    "biostream_sqlite_busy_total",
+    'Database operations that failed with "database is locked" after the SQLite busy timeout',
+    ("source",),
+)
+
+REGISTRY = (
+    request_seconds,
+    request_queries,
+    query_seconds,
+    span_seconds,
+    samples_ingested,
+    batch_samples,
+    sqlite_busy,
+)
+
+
+"""
+Return every metric in the Prometheus text exposition format
+"""
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+@contextmanager
+def timed_span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_seconds.observe(time.perf_counter() - started, span=name)
+
+
+"""
+Context manager that times a step of a hot path, e.g.
+    with span("ingest.parse"):
+        data = JSONParser().parse(request)
+"""
+def span(name):
+    if not metrics_enabled():
+        return NULL_SPAN
+    return timed_span(name)
+
+
+"""
+Count the samples of a stored data send. "type_counts" is a dict
+{type name: samples}.
+"""
+def record_ingested(type_counts):
+    if not metrics_enabled():
+        return
+    batch_samples.observe(sum(type_counts.values()))
+    for name, samples in type_counts.items():
+        samples_ingested.inc(samples, type=name)
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+"""
+Count a database error if SQLite gave up waiting for a lock
+"""
+def record_busy(error, source):
+    if metrics_enabled() and is_busy_error(error):
+        sqlite_busy.inc(source=source)
+
+
+def statement_kind(sql):
+    kind = sql.lstrip()[:6].lower()
+    if kind.startswith("begin"):
+        return "begin"
+    if kind in ("select", "insert", "update", "delete"):
+        return kind
+    return "other"
+
+
+# Counts and times the queries run while it is the current counter (see
+# counting_queries). "parent" is the counter it replaced, which still sees them.
+class QueryCounter:
+
+    def __init__(self, parent=None):
+        self.queries = 0
+        self.seconds = 0
+        self.parent = parent
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.parent is not None:
+            execute = partial(self.parent, execute)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            self.failed(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.seconds += elapsed
+            self.executed(sql, elapsed)
+
+    def executed(self, sql, seconds):
+        pass
+
+    def failed(self, error):
+        pass
+
+
+# Queries of a request, for the metrics
+class RequestQueries(QueryCounter):
+
+    def executed(self, sql, seconds):
+        query_seconds.observe(seconds, statement=statement_kind(sql))
+
+    def failed(self, error):
+        record_busy(error, "request")
+
+
+# QueryCounter of the request being answered. Context variables follow the
+# request into the threads of its database work (sync_to_async and the ingest pool).
+current_queries = ContextVar("current_queries", default=None)
+
+
+@contextmanager
+def counting_queries(counter):
+    token = current_queries.set(counter)
+    try:
+        yield counter
+    finally:
+        current_queries.reset(token)
+
+
+"""
+Database execute wrapper of every connection (see MonitoringConfig.ready):
+hands the queries to the QueryCounter of the current request, if any
+"""
+def count_query(execute, sql, params, many, context):
+    counter = current_queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+"""
+Receiver of the connection_created signal: add count_query to the connection
+"""
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
@@ -0,0 +1,91 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .budget import BUDGET_OFF, BudgetQueries, check_budget, get_budget, get_budget_mode, should_check
+from .metrics import RequestQueries, counting_queries, current_queries, metrics_enabled, request_queries, request_seconds
+
+
+def get_route(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+# Time and database queries of every request, by route. Not loaded at all while
+# METRICS_ENABLED is off.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with counting_queries(RequestQueries(current_queries.get())) as queries:
+            response = self.get_response(request)
+        self.record(request, response, started, queries)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with counting_queries(RequestQueries(current_queries.get())) as queries:
+            response = await self.get_response(request)
+        self.record(request, response, started, queries)
+        return response
+
+    def record(self, request, response, started, queries):
+        route = get_route(request)
+        request_seconds.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=response.status_code
+        )
+        request_queries.observe(queries.queries, route=route)
+
+
+# Checks the queries of the requests against the budget of their view (see
+# apps.monitoring.budget). Not loaded at all while QUERY_BUDGET_MODE is "off".
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if get_budget_mode() == BUDGET_OFF:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = get_budget_mode()
+        if not should_check(mode):
+            return self.get_response(request)
+        with counting_queries(BudgetQueries(current_queries.get())) as queries:
+            response = self.get_response(request)
+        self.check(request, queries, mode)
+        return response
+
+    async def __acall__(self, request):
+        mode = get_budget_mode()
+        if not should_check(mode):
+            return await self.get_response(request)
+        with counting_queries(BudgetQueries(current_queries.get())) as queries:
+            response = await self.get_response(request)
+        self.check(request, queries, mode)
+        return response
+
+    def check(self, request, queries, mode):
+        match = getattr(request, "resolver_match", None)
+        budget = get_budget(match.func) if match is not None else None
+        if budget is not None:
+            check_budget(match.view_name or match.route, budget, queries, mode)
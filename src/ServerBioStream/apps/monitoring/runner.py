@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from .budget import BUDGET_RAISE
+
+
+# Test runner (TEST_RUNNER) that fails every request over the query budget of its view
+class QueryBudgetTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_MODE = BUDGET_RAISE
@@ -0,0 +1,200 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, get_resolver
+
+from apps.authentication.models import UserRoles
+from apps.dataAPI.dimensions import clear_cache
+from apps.users.models import Profile
+
+from . import metrics
+from .budget import Budget, QueryBudgetExceeded, get_budget
+from .metrics import Histogram, RequestQueries, record_busy, span
+
+
+def build_payload(samples=10):
+    return {
+        "identifier": "exp-1",
+        "measurements": [
+            {"date": 1700000000000 + i * 20, "type": "heart_rate" if i % 2 else "acc-x", "value": float(i)}
+            for i in range(samples)
+        ],
+    }
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+        self.addCleanup(clear_cache)
+
+    def send(self, samples):
+        return self.client.post(
+            "/measurements-api/send/", json.dumps(build_payload(samples)), content_type="application/json"
+        )
+
+    def test_disabled_by_default(self):
+        self.assertIs(span("ingest.parse"), metrics.NULL_SPAN)
+        self.assertEqual(self.send(10).status_code, 201)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertEqual(metrics.span_seconds.values, {})
+        self.assertEqual(metrics.request_seconds.values, {})
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_data_send_metrics(self):
+        self.assertEqual(self.send(10).status_code, 201)
+        self.assertEqual(self.send(300).status_code, 201)
+
+        self.assertEqual(metrics.samples_ingested.get(type="heart_rate"), 155)
+        self.assertEqual(metrics.samples_ingested.get(type="acc-x"), 155)
+        self.assertEqual(metrics.batch_samples.count(), 2)
+        for name in ("ingest.parse", "ingest.validate", "ingest.store", "ingest.write", "ingest.aggregates"):
+            self.assertEqual(metrics.span_seconds.count(span=name), 2, name)
+        self.assertEqual(
+            metrics.request_seconds.count(route="measurements-api/send/", method="POST", status=201), 2
+        )
+        self.assertEqual(metrics.request_queries.count(route="measurements-api/send/"), 2)
+        self.assertGreater(metrics.query_seconds.count(statement="insert"), 0)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn('biostream_samples_ingested_total{type="heart_rate"} 155', text)
+        self.assertIn('biostream_batch_size_samples_bucket{le="250"} 1', text)
+        self.assertIn('biostream_batch_size_samples_bucket{le="500"} 2', text)
+        self.assertIn('biostream_batch_size_samples_sum 310', text)
+        self.assertIn(
+            'biostream_request_duration_seconds_count{route="measurements-api/send/",method="POST",status="201"} 2',
+            text,
+        )
+
+    @override_settings(METRICS_ENABLED=True, MEASUREMENTS_ASYNC_WORKERS=0)
+    async def test_async_send_queries(self):
+        response = await self.async_client.post(
+            "/measurements-api/send-async/", json.dumps(build_payload(10)), content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        _, queries = metrics.request_queries.values[("measurements-api/send-async/",)]
+        self.assertGreater(queries, 0)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN="secret")
+    def test_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_busy_errors(self):
+        counter = RequestQueries()
+
+        def locked(sql, params, many, context):
+            raise OperationalError("database is locked")
+
+        with self.assertRaises(OperationalError):
+            counter(locked, "BEGIN IMMEDIATE", None, False, {})
+        record_busy(OperationalError("no such table: x"), "request")
+
+        self.assertEqual(counter.queries, 1)
+        self.assertEqual(metrics.sqlite_busy.get(source="request"), 1)
+        self.assertEqual(metrics.query_seconds.count(statement="begin"), 1)
+
+    def test_histogram_format(self):
+        histogram = Histogram("test_seconds", "Test", ("path",), buckets=(0.1, 1))
+        histogram.observe(0.05, path='a"b')
+        histogram.observe(2, path='a"b')
+
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP test_seconds Test",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{path="a\\"b",le="0.1"} 1',
+                'test_seconds_bucket{path="a\\"b",le="1"} 1',
+                'test_seconds_bucket{path="a\\"b",le="+Inf"} 2',
+                'test_seconds_sum{path="a\\"b"} 2.05',
+                'test_seconds_count{path="a\\"b"} 2',
+            ],
+        )
+
+
+def project_patterns(patterns=None):
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.callback.__module__.startswith("apps."):
+                yield pattern
+        else:
+            yield from project_patterns(pattern.url_patterns)
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin, _ = Group.objects.get_or_create(name=UserRoles.ADMIN)
+        researcher, _ = Group.objects.get_or_create(name=UserRoles.RESEARCHER)
+        for n in range(6):
+            user = User.objects.create_user(username=f"user-{n}", password="password", email=f"user-{n}@example.com")
+            user.groups.add(admin if n == 0 else researcher)
+            Profile.objects.create(user=user)
+
+    def setUp(self):
+        self.addCleanup(clear_cache)
+        self.client.post("/", {"username": "user-0", "password": "password"})
+
+    def send(self, identifier):
+        payload = {**build_payload(10), "identifier": identifier}
+        return self.client.post("/measurements-api/send/", json.dumps(payload), content_type="application/json")
+
+    def test_every_view_has_a_budget(self):
+        patterns = list(project_patterns())
+
+        self.assertGreater(len(patterns), 10)
+        for pattern in patterns:
+            self.assertIsNotNone(get_budget(pattern.callback), str(pattern.pattern))
+
+    def test_views_within_budget(self):
+        for n in range(6):
+            self.assertEqual(self.send(f"exp-{n}").status_code, 201)
+        experiments = {"experiments[]": ["exp-0", "exp-1"]}
+
+        for url, params in [
+            ("/get-data", {}),
+            ("/fetch-measurements/", experiments),
+            ("/export-measurements/", experiments),
+            ("/downsample-measurements/", {"experiment": "exp-0", "type": "heart_rate"}),
+            ("/profile", {}),
+            ("/new-user", {}),
+            ("/users-list", {}),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_over_budget_raises(self):
+        self.client.get("/get-data")
+        with mock.patch("apps.viewData.views.get_data.query_budget", Budget(2)):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "get-data ran 3 queries"):
+                self.client.get("/get-data")
+
+    @override_settings(QUERY_BUDGET_MODE="log", QUERY_BUDGET_SAMPLE_RATE=1)
+    def test_over_budget_logged(self):
+        self.client.get("/get-data")
+        with mock.patch("apps.viewData.views.get_data.query_budget", Budget(2)):
+            with self.assertLogs("apps.monitoring.budget", "WARNING") as logs:
+                response = self.client.get("/get-data")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("get-data ran 3 queries", logs.output[0])
+        self.assertIn("over its budget of 2 queries", logs.output[0])
+
+    @override_settings(QUERY_BUDGET_MODE="log", QUERY_BUDGET_SAMPLE_RATE=0)
+    def test_unsampled_requests_not_checked(self):
+        with mock.patch("apps.viewData.views.get_data.query_budget", Budget(2)):
+            with self.assertNoLogs("apps.monitoring.budget"):
+                self.assertEqual(self.client.get("/get-data").status_code, 200)
@@ -0,0 +1,24 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from .budget import query_budget
+from .metrics import metrics_enabled, render
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+"""
+Metrics of this server process for Prometheus. Not found while METRICS_ENABLED
+is off; when METRICS_TOKEN is set, the scraper has to send it as
+"Authorization: Bearer <token>".
+"""
+@query_budget(0)
+def metrics(request):
+    if not metrics_enabled():
+        raise Http404
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"):
+        return HttpResponse("Invalid metrics token", status=401, content_type="text/plain")
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.users"
+
+    def ready(self):
+        from django.contrib.auth.models import Group, User
+        from django.db.models.signals import m2m_changed, post_delete, post_save
+
+        from .roles import group_changed, groups_changed, user_deleted
+
+        # Cached roles (apps.users.roles) are dropped when the groups of a user change
+        m2m_changed.connect(groups_changed, sender=User.groups.through, dispatch_uid="apps.users.groups_changed")
+        post_delete.connect(user_deleted, sender=User, dispatch_uid="apps.users.user_deleted")
+        post_save.connect(group_changed, sender=Group, dispatch_uid="apps.users.group_saved")
+        post_delete.connect(group_changed, sender=Group, dispatch_uid="apps.users.group_deleted")
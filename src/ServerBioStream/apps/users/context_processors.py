@@ -1,8 +1,9 @@
-from django.contrib.auth.models import User
+from apps.authentication.models import UserRoles
+
+from .roles import get_roles
 
-def is_researcher_context(request):
-    if not request.user.is_authenticated:
-        return {"is_researcher": False}
 
-    is_researcher = request.user.groups.filter(name="researcher").exists()
-    return {"is_researcher": is_researcher}
\ No newline at end of file
+def is_researcher_context(request):
+    # Roles are cached for the request and the session (apps.users.roles)
+    roles = get_roles(request)
+    return {"is_researcher": UserRoles.RESEARCHER in roles, "is_admin": UserRoles.ADMIN in roles}
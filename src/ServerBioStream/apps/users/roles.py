@@ -0,0 +1,108 @@
+"""
+Roles (group names) of the logged in user, looked up once per request and kept
+in the session between requests, so the layout and the views do not query the
+groups on every page. The session copy is dropped after USER_ROLES_CACHE_SECONDS
+and whenever the groups of the user change: the signals below change a version
+stamp in the Django cache, which every session copy is compared with. With
+several server processes, the stamps only reach the other processes if CACHES
+is shared (e.g. Redis); otherwise a change takes up to USER_ROLES_CACHE_SECONDS.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.authentication.models import UserRoles
+
+SESSION_KEY = "user_roles"
+DEFAULT_ROLES_CACHE_SECONDS = 300
+
+# Stamp of every user, changed when a group is renamed or deleted, or its users changed
+ALL_USERS_VERSION = "user-roles:all"
+
+
+def user_version_key(user_id):
+    return f"user-roles:{user_id}"
+
+
+def get_roles_cache_seconds():
+    return getattr(settings, "USER_ROLES_CACHE_SECONDS", DEFAULT_ROLES_CACHE_SECONDS)
+
+
+def get_versions(user_id):
+    versions = cache.get_many([ALL_USERS_VERSION, user_version_key(user_id)])
+    return [versions.get(ALL_USERS_VERSION), versions.get(user_version_key(user_id))]
+
+
+"""
+Return the roles of the user of a request as a frozenset of group names
+(empty for anonymous users)
+"""
+def get_roles(request):
+    roles = getattr(request, "_user_roles", None)
+    if roles is not None:
+        return roles
+
+    user = request.user
+    if not user.is_authenticated:
+        roles = frozenset()
+    else:
+        versions = get_versions(user.pk)
+        cached = request.session.get(SESSION_KEY)
+        if (
+            cached
+            and cached["user"] == user.pk
+            and cached["versions"] == versions
+            and cached["expires"] > time.time()
+        ):
+            roles = frozenset(cached["roles"])
+        else:
+            roles = frozenset(user.groups.values_list("name", flat=True))
+            request.session[SESSION_KEY] = {
+                "user": user.pk,
+                "roles": sorted(roles),
+                "versions": versions,
+                "expires": time.time() + get_roles_cache_seconds(),
+            }
+    request._user_roles = roles
+    return roles
+
+
+"""
+Role shown for the user of a request: Administrator or else Researcher
+"""
+def get_role(request):
+    if UserRoles.ADMIN in get_roles(request):
+        return UserRoles.ADMIN
+    return UserRoles.RESEARCHER
+
+
+"""
+Drop the cached roles of some users, or of every user when "user_ids" is None
+"""
+def invalidate_roles(user_ids=None):
+    if user_ids is None:
+        cache.set(ALL_USERS_VERSION, uuid.uuid4().hex, None)
+    else:
+        cache.set_many({user_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+# Signal receivers, connected in UsersConfig.ready
+
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # The users of a group changed (group.user_set)
+        invalidate_roles(pk_set if action != "post_clear" else None)
+    else:
+        invalidate_roles([instance.pk])
+
+
+def user_deleted(sender, instance, **kwargs):
+    invalidate_roles([instance.pk])
+
+
+def group_changed(sender, instance, **kwargs):
+    invalidate_roles()
@@ -1,3 +1,62 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from apps.authentication.models import UserRoles
+
+from .models import Profile
+
+
+def create_user(username, role):
+    user = User.objects.create_user(username=username, password="password", email=f"{username}@example.com")
+    user.groups.add(Group.objects.get_or_create(name=role)[0])
+    Profile.objects.create(user=user)
+    return user
+
+
+class RolesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = create_user("researcher", UserRoles.RESEARCHER)
+        self.client.post("/", {"username": "researcher", "password": "password"})
+
+    def test_roles_cached_in_session(self):
+        response = self.client.get("/get-data")
+        self.assertTrue(response.context["is_researcher"])
+        self.assertFalse(response.context["is_admin"])
+
+        # Session, user and the summaries, not the groups
+        with self.assertNumQueries(3):
+            response = self.client.get("/get-data")
+        self.assertTrue(response.context["is_researcher"])
+
+    def test_membership_changes_invalidate(self):
+        self.client.get("/get-data")
+        admin = Group.objects.get(name=UserRoles.ADMIN)
+
+        self.user.groups.add(admin)
+        self.assertTrue(self.client.get("/get-data").context["is_admin"])
+        self.assertEqual(self.client.get("/profile").context["role"], UserRoles.ADMIN)
+
+        admin.user_set.remove(self.user)
+        self.assertFalse(self.client.get("/get-data").context["is_admin"])
+
+        self.user.groups.clear()
+        self.assertFalse(self.client.get("/get-data").context["is_researcher"])
+
+    def test_users_list_queries_do_not_grow(self):
+        self.client.get("/users-list")
+        with self.assertNumQueries(4):
+            self.client.get("/users-list")
+
+        for n in range(10):
+            create_user(f"user-{n}", UserRoles.ADMIN if n % 2 else UserRoles.RESEARCHER)
+        with self.assertNumQueries(4):
+            response = self.client.get("/users-list")
+
+        groups = {user["user"].username: user["group"] for user in response.context["users"]}
+        self.assertEqual(groups["researcher"], UserRoles.RESEARCHER)
+        self.assertEqual(groups["user-1"], UserRoles.ADMIN)
+        self.assertEqual(len(groups), 11)
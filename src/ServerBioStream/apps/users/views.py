@@ -4,19 +4,22 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import Group, User
-from django.db.models import Min, Max, Count
+from django.db.models import Min, Max, Count, Prefetch
 
 from django.http import HttpResponseRedirect, JsonResponse
 
 from apps.dataAPI.models import Measurement
 import json
 from django.views.decorators.csrf import csrf_exempt
+from apps.monitoring.budget import query_budget
 from .models import Profile
+from .roles import get_role
 
 
 """
 Method used to get or update the user's profile.
 """
+@query_budget(12)
 @login_required
 def profile(request):
     # Get the user profile
@@ -24,11 +27,8 @@ def profile(request):
         username = request.session.get("user_username", None)
         user = User.objects.get(username=username)
 
-        # Get the user role 
-        if user.groups.filter(name=UserRoles.ADMIN).exists():
-            role = UserRoles.ADMIN
-        else: 
-            role = UserRoles.RESEARCHER
+        # Get the user role (cached, see apps.users.roles)
+        role = get_role(request)
 
         # Get or create profile
         profile, created = Profile.objects.get_or_create(user=user)
@@ -61,11 +61,8 @@ def profile(request):
         user.first_name = name
         user.last_name = surname
 
-        # Get the user role 
-        if user.groups.filter(name=UserRoles.ADMIN).exists():
-            role = UserRoles.ADMIN
-        else: 
-            role = UserRoles.RESEARCHER
+        # Get the user role (cached, see apps.users.roles)
+        role = get_role(request)
 
         # If there is a new password
         if newpassword:
@@ -133,6 +130,7 @@ def profile(request):
 """
 Ajax method used to update the user avatar
 """
+@query_budget(10)
 @login_required
 def update_avatar(request):
     user = User.objects.get(username=request.user)
@@ -156,6 +154,7 @@ def update_avatar(request):
 """
 Method used to get, create or update a the user profile
 """
+@query_budget(16)
 @login_required
 def create_user(request):
 
@@ -228,16 +227,20 @@ def create_user(request):
 """
 Method used to get all users
 """
+@query_budget(8)
 @login_required
 def get_users_list(request):
     if request.method == "GET":
-        users = User.objects.all()
+        # Users with their profile and groups in a fixed number of queries
+        users = User.objects.select_related("profile").prefetch_related(
+            Prefetch("groups", queryset=Group.objects.order_by("id"))
+        )
         users_with_groups = []
 
         # Building the user lists
         for user in users:
-            group = user.groups.first()
-            group_name = group.name if group else "No Group"
+            groups = user.groups.all()
+            group_name = groups[0].name if groups else "No Group"
             users_with_groups.append({"user": user, "group": group_name})
 
         email = request.session.get("user_email")
@@ -254,6 +257,7 @@ def get_users_list(request):
 """
 Method used to delete a user.
 """
+@query_budget(16)
 @login_required
 def delete_user(request):
 
@@ -0,0 +1,194 @@
+"""
+Reduction of long measurement series to a few points for plotting.
+
+Both methods read the samples of one experiment and type in timestamp order,
+chunk by chunk (as returned by MeasurementStorage.read), so memory depends on the number of points requested and not on
+the length of the series:
+
+    lttb     Largest-Triangle-Three-Buckets: splits the samples in buckets with
+             the same number of samples and keeps the one forming the largest
+             triangle with the point kept before it and the average of the next
+             bucket. Preserves the shape of the trace.
+    minmax   Splits the time window in equal periods and keeps the minimum and
+             the maximum of each one. Preserves peaks and gaps.
+"""
+import numpy as np
+
+LTTB = "lttb"
+MINMAX = "minmax"
+METHODS = (LTTB, MINMAX)
+
+DEFAULT_POINTS = 2000
+MIN_POINTS = 3
+MAX_POINTS = 20000
+
+
+# Error raised for invalid downsampling parameters
+class DownsamplingError(ValueError):
+    pass
+
+
+"""
+Return the number of points requested, bounded to [MIN_POINTS, MAX_POINTS]
+"""
+def get_points(value):
+    if value in (None, ""):
+        return DEFAULT_POINTS
+    try:
+        return min(max(int(value), MIN_POINTS), MAX_POINTS)
+    except ValueError:
+        raise DownsamplingError("points must be an integer")
+
+
+# Window over a stream of chunks, addressed by row number: rows are read
+# when needed and discarded once processed
+class RowBuffer:
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+        self.offset = 0
+        self.exhausted = False
+
+    def end(self):
+        return self.offset + len(self.timestamps)
+
+    # Read chunks until the rows before "stop" are buffered, and return the
+    # end of the rows available (smaller than "stop" if the stream ended)
+    def fill(self, stop):
+        while self.end() < stop and not self.exhausted:
+            try:
+                _, timestamps, _, values = next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self.timestamps = np.concatenate((self.timestamps, timestamps))
+            self.values = np.concatenate((self.values, values))
+        return min(stop, self.end())
+
+    def rows(self, start, stop):
+        return self.timestamps[start - self.offset:stop - self.offset], self.values[start - self.offset:stop - self.offset]
+
+    def discard(self, stop):
+        self.timestamps = self.timestamps[stop - self.offset:]
+        self.values = self.values[stop - self.offset:]
+        self.offset = stop
+
+
+"""
+Largest-Triangle-Three-Buckets over a stream of chunks of samples
+holding "count" samples. Returns the timestamps and values of the points kept,
+at most "threshold" (the first and last samples are always kept).
+"""
+def lttb(chunks, count, threshold):
+    buffer = RowBuffer(chunks)
+    if count <= threshold:
+        buffer.fill(count)
+        return buffer.timestamps, buffer.values
+
+    buffer.fill(1)
+    if buffer.end() == 0:
+        return buffer.timestamps, buffer.values
+    # Times relative to the first sample keep the areas precise in float64
+    origin = buffer.timestamps[0]
+    kept_timestamps = [int(buffer.timestamps[0])]
+    kept_values = [float(buffer.values[0])]
+    buffer.discard(1)
+
+    every = (count - 2) / (threshold - 2)
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        stop = buffer.fill(int((i + 1) * every) + 1)
+        next_stop = buffer.fill(min(int((i + 2) * every) + 1, count))
+        if start >= stop:
+            break
+
+        timestamps, values = buffer.rows(start, stop)
+        next_timestamps, next_values = buffer.rows(stop, next_stop)
+        if len(next_timestamps):
+            next_x = (next_timestamps - origin).mean()
+            next_y = next_values.mean()
+        else:
+            next_x = float(timestamps[-1] - origin)
+            next_y = float(values[-1])
+
+        previous_x = kept_timestamps[-1] - origin
+        previous_y = kept_values[-1]
+        areas = np.abs(
+            (previous_x - next_x) * (values - previous_y)
+            - (previous_x - (timestamps - origin)) * (next_y - previous_y)
+        )
+        selected = int(np.argmax(areas))
+        kept_timestamps.append(int(timestamps[selected]))
+        kept_values.append(float(values[selected]))
+        buffer.discard(stop)
+
+    buffer.fill(count)
+    if buffer.end() > buffer.offset:
+        kept_timestamps.append(int(buffer.timestamps[-1]))
+        kept_values.append(float(buffer.values[-1]))
+    return np.array(kept_timestamps, dtype=np.int64), np.array(kept_values, dtype=np.float64)
+
+
+"""
+Minimum and maximum of each of "buckets" equal periods of [start, end] (UNIX
+ms) over a stream of chunks of samples. Returns the timestamps and
+values of the points kept, in time order: two per period with samples, or one
+when both are the same sample.
+"""
+def minmax(chunks, start, end, buckets):
+    span = max(end - start, 1)
+    counts = np.zeros(buckets, dtype=np.int64)
+    min_values = np.full(buckets, np.inf)
+    max_values = np.full(buckets, -np.inf)
+    min_timestamps = np.zeros(buckets, dtype=np.int64)
+    max_timestamps = np.zeros(buckets, dtype=np.int64)
+
+    for _, timestamps, _, values in chunks:
+        bucket = np.clip((timestamps - start) * buckets // span, 0, buckets - 1)
+        # Sorted by bucket and value: the first row of each bucket is its
+        # minimum and the last one its maximum
+        order = np.lexsort((values, bucket))
+        sorted_buckets = bucket[order]
+        firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+        lasts = np.r_[firsts[1:], len(order)] - 1
+        indexes = sorted_buckets[firsts]
+        counts[indexes] += lasts - firsts + 1
+
+        lowest = order[firsts]
+        lower = values[lowest] < min_values[indexes]
+        min_values[indexes[lower]] = values[lowest[lower]]
+        min_timestamps[indexes[lower]] = timestamps[lowest[lower]]
+
+        highest = order[lasts]
+        higher = values[highest] > max_values[indexes]
+        max_values[indexes[higher]] = values[highest[higher]]
+        max_timestamps[indexes[higher]] = timestamps[highest[higher]]
+
+    filled = counts > 0
+    pairs_timestamps = np.stack((min_timestamps[filled], max_timestamps[filled]), axis=1)
+    pairs_values = np.stack((min_values[filled], max_values[filled]), axis=1)
+
+    # Each pair in time order, dropping the second point when it is the first one
+    swap = pairs_timestamps[:, 0] > pairs_timestamps[:, 1]
+    pairs_timestamps[swap] = pairs_timestamps[swap][:, ::-1]
+    pairs_values[swap] = pairs_values[swap][:, ::-1]
+    keep = np.ones(pairs_timestamps.shape, dtype=bool)
+    keep[:, 1] = (pairs_timestamps[:, 0] != pairs_timestamps[:, 1]) | (pairs_values[:, 0] != pairs_values[:, 1])
+    return pairs_timestamps[keep], pairs_values[keep]
+
+
+"""
+Reduce a series held in memory (e.g. the new samples of a live view) to at most
+"points" points with "method". The samples are sorted by timestamp first.
+"""
+def downsample(timestamps, values, points, method=LTTB):
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, values = timestamps[order], values[order]
+    if len(timestamps) <= points:
+        return timestamps, values
+    chunks = [(None, timestamps, None, values)]
+    if method == LTTB:
+        return lttb(chunks, len(timestamps), points)
+    return minmax(chunks, int(timestamps[0]), int(timestamps[-1]), max(points // 2, 1))
@@ -0,0 +1,256 @@
+import csv
+import json
+import zipfile
+from datetime import datetime, timezone
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+from apps.dataAPI.storage.base import DEFAULT_CHUNK_SIZE, from_millis, to_millis
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Content type and file extension of each export format
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "npz": ("application/octet-stream", "npz"),
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+# Record of the "measurements" array of NPZ exports; experiment and type are
+# indexes into the "experiments" and "types" arrays of the same file
+NPZ_DTYPE = np.dtype([("experiment", "<i4"), ("timestamp", "<i8"), ("type", "<i4"), ("value", "<f8")])
+
+
+# Error raised for invalid export parameters
+class ExportError(ValueError):
+    pass
+
+
+"""
+Return the export format to use: "columnar" is Parquet when pyarrow is
+installed and compressed NPZ otherwise
+"""
+def resolve_format(name):
+    name = (name or "csv").lower()
+    if name == "columnar":
+        return "parquet" if pyarrow is not None else "npz"
+    if name not in FORMATS:
+        raise ExportError(f"format must be one of: columnar, {', '.join(FORMATS)}")
+    if name in ARROW_FORMATS and pyarrow is None:
+        raise ExportError(f"The {name} format requires the pyarrow package")
+    return name
+
+
+"""
+Parse a time range bound, UNIX milliseconds or ISO 8601 (UTC when naive), into
+UNIX milliseconds. Milliseconds out of the range of dates are rejected too.
+"""
+def parse_time(value):
+    if value in (None, ""):
+        return None
+    try:
+        millis = int(value)
+    except ValueError:
+        pass
+    else:
+        try:
+            from_millis(millis)
+        except (OverflowError, OSError):
+            raise ExportError(f"Invalid date: {value}")
+        return millis
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid date: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return to_millis(moment)
+
+
+"""
+Format a timestamp in ms as ISO 8601 in UTC with millisecond precision
+"""
+def isoformat(millis):
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc).isoformat(timespec="milliseconds")
+
+
+# File-like object collecting what a writer produces, so a generator can yield
+# it piece by piece to a StreamingHttpResponse
+class StreamSink:
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Pseudo-buffer for csv.writer that returns each line instead of storing it
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(chunks, identifiers, type_names):
+    writer = csv.writer(Echo())
+    yield writer.writerow(["experiment", "timestamp", "type", "value"])
+    for experiment_ids, millis, type_ids, values in chunks:
+        yield "".join(
+            writer.writerow([identifiers[experiment_id], isoformat(ms), type_names[type_id], value])
+            for experiment_id, ms, type_id, value in zip(
+                experiment_ids.tolist(), millis.tolist(), type_ids.tolist(), values.tolist()
+            )
+        )
+
+
+def stream_ndjson(chunks, identifiers, type_names):
+    for experiment_ids, millis, type_ids, values in chunks:
+        yield "".join(
+            json.dumps(
+                {
+                    "experiment": identifiers[experiment_id],
+                    "timestamp": isoformat(ms),
+                    "type": type_names[type_id],
+                    "value": value,
+                }
+            )
+            + "\n"
+            for experiment_id, ms, type_id, value in zip(
+                experiment_ids.tolist(), millis.tolist(), type_ids.tolist(), values.tolist()
+            )
+        )
+
+
+def arrow_schema():
+    return pyarrow.schema(
+        [
+            ("experiment", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ("timestamp", pyarrow.timestamp("ms", tz="UTC")),
+            ("type", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ("value", pyarrow.float64()),
+        ]
+    )
+
+
+"""
+Parquet row groups and Arrow IPC record batches, one per chunk. The experiment
+and type columns are dictionary-encoded against the names of the whole export.
+"""
+def stream_arrow(chunks, identifiers, type_names, file_format):
+    schema = arrow_schema()
+    experiment_ids = list(identifiers)
+    type_ids = list(type_names)
+    experiment_positions = {experiment_id: i for i, experiment_id in enumerate(experiment_ids)}
+    type_positions = {type_id: i for i, type_id in enumerate(type_ids)}
+    experiment_dictionary = pyarrow.array([identifiers[i] for i in experiment_ids], pyarrow.string())
+    type_dictionary = pyarrow.array([type_names[i] for i in type_ids], pyarrow.string())
+
+    sink = StreamSink()
+    if file_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+
+    for chunk_experiments, millis, chunk_types, values in chunks:
+        table = pyarrow.Table.from_arrays(
+            [
+                pyarrow.DictionaryArray.from_arrays(
+                    pyarrow.array([experiment_positions[i] for i in chunk_experiments.tolist()], pyarrow.int32()),
+                    experiment_dictionary,
+                ),
+                pyarrow.array(millis, pyarrow.timestamp("ms", tz="UTC")),
+                pyarrow.DictionaryArray.from_arrays(
+                    pyarrow.array([type_positions[i] for i in chunk_types.tolist()], pyarrow.int32()),
+                    type_dictionary,
+                ),
+                pyarrow.array(values, pyarrow.float64()),
+            ],
+            schema=schema,
+        )
+        writer.write_table(table)
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+"""
+Compressed NPZ with a structured "measurements" array (NPZ_DTYPE) streamed into
+the archive chunk by chunk, plus the "experiments" and "types" names it indexes
+"""
+def stream_npz(chunks, count, identifiers, type_names):
+    experiment_ids = list(identifiers)
+    type_ids = list(type_names)
+    experiment_positions = np.zeros(max(experiment_ids, default=0) + 1, dtype=np.int32)
+    experiment_positions[experiment_ids] = np.arange(len(experiment_ids))
+    type_positions = np.zeros(max(type_ids, default=0) + 1, dtype=np.int32)
+    type_positions[type_ids] = np.arange(len(type_ids))
+
+    sink = StreamSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    with archive.open("measurements.npy", "w", force_zip64=True) as entry:
+        npy_format.write_array_header_1_0(
+            entry, {"descr": npy_format.dtype_to_descr(NPZ_DTYPE), "fortran_order": False, "shape": (count,)}
+        )
+        written = 0
+        for chunk_experiments, millis, chunk_types, values in chunks:
+            records = np.empty(len(values), dtype=NPZ_DTYPE)
+            records["experiment"] = experiment_positions[chunk_experiments]
+            records["timestamp"] = millis
+            records["type"] = type_positions[chunk_types]
+            records["value"] = values
+            records = records[:count - written]
+            entry.write(records.tobytes())
+            written += len(records)
+            yield sink.drain()
+        if written < count:
+            # Rows deleted while exporting: keep the announced shape valid
+            entry.write(np.zeros(count - written, dtype=NPZ_DTYPE).tobytes())
+
+    for name, names in (("experiments", [identifiers[i] for i in experiment_ids]), ("types", [type_names[i] for i in type_ids])):
+        with archive.open(name + ".npy", "w") as entry:
+            npy_format.write_array(entry, np.array(names, dtype=str))
+
+    archive.close()
+    yield sink.drain()
+
+
+"""
+Return a generator with the content of an export in the given format, reading
+the samples from a storage backend
+"""
+def stream_export(
+    file_format, storage, identifiers, type_names, type_ids=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    chunks = storage.read(list(identifiers), type_ids, start, end, chunk_size)
+    if file_format == "csv":
+        return stream_csv(chunks, identifiers, type_names)
+    if file_format == "ndjson":
+        return stream_ndjson(chunks, identifiers, type_names)
+    if file_format in ARROW_FORMATS:
+        return stream_arrow(chunks, identifiers, type_names, file_format)
+    return stream_npz(chunks, storage.count(list(identifiers), type_ids, start, end), identifiers, type_names)
@@ -0,0 +1,423 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.db.models import Q
+
+from apps.dataAPI.storage.base import from_millis, to_millis
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Shortest time window read by scan_page when sorting by timestamp (ms)
+MIN_WINDOW = 1000
+
+# Columns of the measurements table that can be sorted, as Measurement lookups
+SORT_FIELDS = {
+    "experiment": "experiment__identifier",
+    "timestamp": "timestamp",
+    "type": "type__name",
+    "value": "value",
+}
+
+# Formats of the timestamps shown in the measurements table, from the most to
+# the least precise, with the length of the period each one designates
+SEARCH_DATE_FORMATS = [
+    ("%d/%m/%Y %H:%M:%S", timedelta(seconds=1)),
+    ("%d/%m/%Y %H:%M", timedelta(minutes=1)),
+    ("%d/%m/%Y %H", timedelta(hours=1)),
+    ("%d/%m/%Y", timedelta(days=1)),
+]
+
+
+# Error raised for invalid pagination parameters
+class PaginationError(ValueError):
+    pass
+
+
+"""
+Return the page size requested, bounded to MAX_PAGE_SIZE
+"""
+def get_page_size(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise PaginationError("page_size must be an integer")
+
+
+"""
+Opaque cursor with the sort value and id of a row
+"""
+def encode_cursor(sort, value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(sort, cursor):
+    try:
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if cursor_sort != sort:
+            raise PaginationError("The cursor belongs to another sort order")
+        if sort == "timestamp":
+            value = datetime.fromisoformat(value)
+        elif sort == "value":
+            value = float(value)
+        return value, int(row_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+
+
+"""
+Rows strictly after (or before) the row of a cursor in the order (field, id)
+"""
+def keyset_filter(field, value, row_id, descending, before):
+    greater = descending == before
+    lookup = "gt" if greater else "lt"
+    return Q(**{f"{field}__{lookup}": value}) | Q(**{field: value, f"id__{lookup}": row_id})
+
+
+"""
+Return one page of a queryset ordered by a sortable column and the id, without
+OFFSET: pages are addressed by cursors pointing to the first or last row of the
+neighbouring page. "columns" are the fields projected with values_list; the
+sort value is appended to each row to build the cursors and then dropped.
+
+Returns the rows and the cursors of the next and previous pages (None at the ends).
+"""
+def keyset_page(queryset, columns, sort, descending, page_size, after=None, before=None, last=False):
+    if sort not in SORT_FIELDS:
+        raise PaginationError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    field = SORT_FIELDS[sort]
+
+    # Pages before a cursor and the last page are read in reverse order
+    backwards = before is not None or last
+    reverse = descending != backwards
+    ordering = ("-" if reverse else "") + field, ("-" if reverse else "") + "id"
+
+    if after is not None:
+        value, row_id = decode_cursor(sort, after)
+        queryset = queryset.filter(keyset_filter(field, value, row_id, descending, before=False))
+    elif before is not None:
+        value, row_id = decode_cursor(sort, before)
+        queryset = queryset.filter(keyset_filter(field, value, row_id, descending, before=True))
+
+    rows = list(queryset.order_by(*ordering).values_list("id", *columns, field)[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        has_next = not last
+        has_previous = more
+    else:
+        has_next = more
+        has_previous = after is not None
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(sort, rows[-1][-1], rows[-1][0])
+    if rows and has_previous:
+        previous_cursor = encode_cursor(sort, rows[0][-1], rows[0][0])
+
+    return [row[1:-1] for row in rows], next_cursor, previous_cursor
+
+
+"""
+Parse the search box of the measurements table: experiments and types containing
+the text, samples whose value equals it when it is a number, and samples within
+the period of a date typed as in the table (dd/mm/yyyy hh:mm:ss).
+
+Returns the experiment ids, type ids, value (or None) and period [start, end)
+(or None) matched.
+"""
+def parse_search(search, identifiers, type_names):
+    term = search.lower()
+    experiment_ids = [i for i, identifier in identifiers.items() if term in identifier.lower()]
+    type_ids = [i for i, name in type_names.items() if term in name.lower()]
+
+    try:
+        value = float(search)
+    except ValueError:
+        value = None
+
+    period = None
+    for date_format, length in SEARCH_DATE_FORMATS:
+        try:
+            start = datetime.strptime(search, date_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        period = (start, start + length)
+        break
+
+    return experiment_ids, type_ids, value, period
+
+
+"""
+Filter of Measurement rows matching the search box of the measurements table
+"""
+def search_filter(search, identifiers, type_names):
+    experiment_ids, type_ids, value, period = parse_search(search, identifiers, type_names)
+    query = Q(experiment_id__in=experiment_ids) | Q(type_id__in=type_ids)
+    if value is not None:
+        query |= Q(value=value)
+    if period is not None:
+        query |= Q(timestamp__gte=period[0], timestamp__lt=period[1])
+    return query
+
+
+"""
+Same as search_filter for chunks of samples (experiment ids, timestamps in ms,
+type ids, values): returns a function computing the mask of a chunk
+"""
+def search_mask(search, identifiers, type_names):
+    experiment_ids, type_ids, value, period = parse_search(search, identifiers, type_names)
+    if period is not None:
+        period = (to_millis(period[0]), to_millis(period[1]))
+
+    def mask(chunk_experiments, dates, chunk_types, values):
+        matches = np.isin(chunk_experiments, experiment_ids) | np.isin(chunk_types, type_ids)
+        if value is not None:
+            matches |= values == value
+        if period is not None:
+            matches |= (dates >= period[0]) & (dates < period[1])
+        return matches
+
+    return mask
+
+
+"""
+Return True when the matches of a search can be counted from the experiment
+summaries (it only matches experiments and types)
+"""
+def search_counts_from_summaries(search):
+    try:
+        float(search)
+        return False
+    except ValueError:
+        pass
+    for date_format, _ in SEARCH_DATE_FORMATS:
+        try:
+            datetime.strptime(search, date_format)
+            return False
+        except ValueError:
+            continue
+    return True
+
+
+"""
+Cursor of scan_page: the values of the whole sort key of a row and its position
+among the rows with the same values (how many of them come before it)
+"""
+def encode_scan_cursor(sort, identifier, date, type_name, value, position):
+    raw = json.dumps([sort, identifier, date, type_name, value, position], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_scan_cursor(sort, cursor):
+    try:
+        cursor_sort, identifier, date, type_name, value, position = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii"))
+        )
+        if cursor_sort != sort:
+            raise PaginationError("The cursor belongs to another sort order")
+        return str(identifier), int(date), str(type_name), float(value), max(int(position), 0)
+    except (ValueError, TypeError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+
+
+# Position of each id when sorted by name, as an array indexed by id
+def ranks(names):
+    ordered = sorted(names, key=lambda i: names[i])
+    positions = np.zeros(max(names, default=0) + 1, dtype=np.int64)
+    positions[ordered] = np.arange(len(ordered))
+    return positions
+
+
+def lexicographic_greater_equal(keys, cursor):
+    greater = np.zeros(len(keys[0]), dtype=bool)
+    equal = np.ones(len(keys[0]), dtype=bool)
+    for key, value in zip(keys, cursor):
+        greater |= equal & (key > value)
+        equal &= key == value
+    return greater | equal
+
+
+# The first distinct rows of a scan, in the order of their keys, with the number
+# of samples equal to each of them. Samples equal in every column are counted
+# rather than kept, so a page can start in the middle of them.
+class ScanRows:
+
+    def __init__(self, keys, cursor, size):
+        self.keys = keys
+        self.cursor = cursor
+        self.size = size
+        self.columns = None
+        self.counts = None
+
+    def add(self, chunk, selected):
+        if self.cursor is not None:
+            selected &= lexicographic_greater_equal(self.keys(*chunk), self.cursor)
+        columns = [column[selected] for column in chunk]
+        counts = np.ones(len(columns[0]), dtype=np.int64)
+        if self.columns is not None:
+            columns = [np.concatenate(pair) for pair in zip(self.columns, columns)]
+            counts = np.concatenate((self.counts, counts))
+        if not len(counts):
+            return
+
+        keys = self.keys(*columns)
+        order = np.lexsort(keys[::-1])
+        keys = [key[order] for key in keys]
+        changed = np.zeros(len(order) - 1, dtype=bool)
+        for key in keys:
+            changed |= key[1:] != key[:-1]
+        firsts = np.flatnonzero(np.r_[True, changed])
+        # The row of the cursor is one of them, and may have no samples left
+        kept = firsts[:self.size + 2]
+        self.columns = [column[order][kept] for column in columns]
+        self.counts = np.add.reduceat(counts[order], firsts)[:self.size + 2]
+
+    # Whether the rows hold more than a page
+    def full(self):
+        return self.counts is not None and len(self.counts) > self.size + 1
+
+    # Timestamp of the last row kept
+    def last_date(self):
+        return int(self.columns[1][-1])
+
+
+"""
+Return one page of samples of a storage backend that cannot run the query in the
+database (see MeasurementStorage.queryset). "read" is MeasurementStorage.read.
+The samples are scanned keeping only the page_size + 1 first ones after the
+cursor, so memory does not depend on the number of samples. Only the samples
+that can follow the cursor are read: the types or experiments after it, or,
+sorting by timestamp, a time window after it, sized from "span" (first and last
+timestamp and number of samples of the experiments) to hold about four pages, and
+the rest of the samples only when the window was too short. With a search,
+every sample is read to count the matches. Rows are ordered by the sort column
+and then by experiment, timestamp, type and value; identical rows by their
+position among them.
+
+Returns the rows (experiment id, timestamp, type id, value), the cursors of the
+next and previous pages and the number of samples matching the search.
+"""
+def scan_page(read, identifiers, type_names, search, sort, descending, page_size, after=None, before=None, last=False, span=None):
+    if sort not in SORT_FIELDS:
+        raise PaginationError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    experiment_ranks = ranks(identifiers)
+    type_ranks = ranks(type_names)
+    mask = search_mask(search, identifiers, type_names) if search else None
+
+    backwards = before is not None or last
+    sign = -1 if descending != backwards else 1
+    primary = list(SORT_FIELDS).index(sort)
+
+    def keys(experiment_ids, dates, type_ids, values):
+        columns = [experiment_ranks[experiment_ids], dates, type_ranks[type_ids], values]
+        return [sign * column for column in [columns[primary]] + columns]
+
+    def row_key(experiment_id, date, type_id, value):
+        return [key[0] for key in keys(np.array([experiment_id]), np.array([date]), np.array([type_id]), np.array([value]))]
+
+    cursor = None
+    position = 0
+    experiment_ids = sorted(identifiers)
+    type_ids = None
+    if after is not None or before is not None:
+        identifier, date, type_name, value, position = decode_scan_cursor(sort, after if after is not None else before)
+        experiment_id = next((i for i, name in identifiers.items() if name == identifier), None)
+        type_id = next((i for i, name in type_names.items() if name == type_name), None)
+        if experiment_id is None or type_id is None:
+            raise PaginationError("Invalid cursor")
+        cursor = row_key(experiment_id, date, type_id, value)
+        if mask is None and sort == "experiment":
+            experiment_ids = [i for i in experiment_ids if sign * experiment_ranks[i] >= cursor[0]]
+        elif mask is None and sort == "type":
+            type_ids = [i for i in type_names if sign * type_ranks[i] >= cursor[0]]
+
+    # Time windows [start, end) read in turn, stopping once the page is known
+    windows = [(None, None)]
+    if mask is None and sort == "timestamp":
+        if cursor is not None:
+            edge = date
+        elif span is not None:
+            edge = span[0] if sign > 0 else span[1]
+        else:
+            edge = None
+        if edge is not None:
+            length = window_length(span, page_size)
+            if sign > 0:
+                windows = [(edge, edge + length), (edge + length, None)]
+            else:
+                windows = [(edge - length + 1, edge + 1), (None, edge - length + 1)]
+
+    rows = ScanRows(keys, cursor, page_size)
+    matches = 0
+    for start, end in windows:
+        for chunk in read(experiment_ids, type_ids, start, end):
+            selected = np.ones(len(chunk[0]), dtype=bool) if mask is None else mask(*chunk)
+            matches += int(selected.sum())
+            rows.add(chunk, selected)
+        if rows.full():
+            # The samples left to read all come after the rows kept, which hold the page
+            edge = end if sign > 0 else start
+            if edge is None or (rows.last_date() < edge if sign > 0 else rows.last_date() >= edge):
+                break
+
+    # Expand the distinct rows into the samples of the page, with the position
+    # of each among the identical ones in the order of the page
+    page = []
+    if rows.columns is not None:
+        groups = zip(*(column.tolist() for column in rows.columns), rows.counts.tolist())
+        for index, (experiment_id, date, type_id, value, count) in enumerate(groups):
+            first = 0
+            if index == 0 and cursor is not None and row_key(experiment_id, date, type_id, value) == cursor:
+                # Identical to the cursor row: only those after it (before it when
+                # going backwards) belong to the page
+                if backwards:
+                    count = min(count, position)
+                else:
+                    first, count = position + 1, count - position - 1
+            for number in range(min(max(count, 0), page_size + 1 - len(page))):
+                # Positions count from the first row in the order of the pages
+                page.append((experiment_id, date, type_id, value, first + number if not backwards else count - 1 - number))
+            if len(page) > page_size:
+                break
+
+    more = len(page) > page_size
+    page = page[:page_size]
+    if backwards:
+        page.reverse()
+
+    if backwards:
+        has_next = not last
+        has_previous = more
+    else:
+        has_next = more
+        has_previous = after is not None
+
+    def row_cursor(row):
+        return encode_scan_cursor(sort, identifiers[row[0]], row[1], type_names[row[2]], row[3], row[4])
+
+    next_cursor = row_cursor(page[-1]) if page and has_next else None
+    previous_cursor = row_cursor(page[0]) if page and has_previous else None
+    rows = [(experiment_id, from_millis(date), type_id, value) for experiment_id, date, type_id, value, _ in page]
+    return rows, next_cursor, previous_cursor, matches
+
+
+"""
+Length in ms of a time window holding about four pages of samples, at the
+average rate of the experiments of "span"
+"""
+def window_length(span, page_size):
+    if span is None or span[2] <= 0:
+        return MIN_WINDOW
+    first, last, samples = span
+    return max(MIN_WINDOW, (last - first + 1) * 4 * (page_size + 1) // samples)
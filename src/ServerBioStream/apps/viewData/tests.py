@@ -1,3 +1,536 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, Max, Min
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from apps.dataAPI.deletion import run_deletion
+from apps.dataAPI.dimensions import clear_cache
+from apps.dataAPI.ingestion import MeasurementBatch, ingest_batch
+from apps.dataAPI.live import broker
+from apps.dataAPI.models import Experiment, ExperimentSummary, Measurement
+from apps.dataAPI.storage import get_storage
+from apps.dataAPI.storage.archive import ArchiveStorage
+
+from . import downsampling, export, pagination
+
+
+def ingest(identifier, sample_type, samples, start=1700000000000):
+    dates = [start + i * 1000 for i in range(samples)]
+    ingest_batch(MeasurementBatch(identifier, dates, [sample_type] * samples, [float(i) for i in range(samples)]))
+
+
+class ViewDataTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="researcher", password="password")
+        self.client.force_login(user)
+        ingest("exp-1", "heart_rate", 5)
+        ingest("exp-1", "temperature", 3)
+        ingest("exp-2", "acc-x", 4)
+
+    def test_get_data_lists_experiments(self):
+        response = self.client.get("/get-data")
+
+        self.assertEqual(response.status_code, 200)
+        experiments = {experiment["experiment"]: experiment for experiment in response.context["experiments"]}
+        self.assertEqual(set(experiments), {"exp-1", "exp-2"})
+        self.assertEqual(experiments["exp-1"]["types"], "heart_rate, temperature")
+
+    def test_get_data_reads_summaries_only(self):
+        # The first page looks up the roles of the user and keeps them in the session
+        self.client.get("/get-data")
+
+        # Session, user and the summaries; nothing per experiment
+        with self.assertNumQueries(3):
+            self.client.get("/get-data")
+
+    def test_fetch_measurements_of_selected_experiments(self):
+        response = self.client.get("/fetch-measurements/", {"experiments[]": ["exp-2"]})
+
+        measurements = response.json()["measurements"]
+        self.assertEqual(len(measurements), 4)
+        self.assertEqual(measurements[0]["type"], "acc-x")
+        self.assertEqual(measurements[0]["experiment"], "exp-2")
+
+    def fetch(self, **params):
+        response = self.client.get("/fetch-measurements/", {"experiments[]": ["exp-1", "exp-2"], **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fetch_measurements_pages_with_cursors(self):
+        seen = []
+        page = self.fetch(page_size=5, sort="value", order="desc")
+        self.assertEqual(page["count"], 12)
+        self.assertIsNone(page["previous"])
+        while True:
+            seen.extend((m["experiment"], m["type"], m["value"]) for m in page["measurements"])
+            if page["next"] is None:
+                break
+            page = self.fetch(page_size=5, sort="value", order="desc", after=page["next"])
+
+        self.assertEqual(len(seen), 12)
+        self.assertEqual([value for _, _, value in seen], sorted((value for _, _, value in seen), reverse=True))
+
+        # The last page holds the last rows; paging back from it walks the same order
+        last = self.fetch(page_size=5, sort="value", order="desc", last=1)
+        self.assertEqual([(m["experiment"], m["type"], m["value"]) for m in last["measurements"]], seen[7:])
+        self.assertIsNone(last["next"])
+        previous = self.fetch(page_size=5, sort="value", order="desc", before=last["previous"])
+        self.assertEqual([(m["experiment"], m["type"], m["value"]) for m in previous["measurements"]], seen[2:7])
+
+    def test_fetch_measurements_search(self):
+        page = self.fetch(search="TEMP")
+        self.assertEqual(page["count"], 3)
+        self.assertEqual({m["type"] for m in page["measurements"]}, {"temperature"})
+
+        page = self.fetch(search="4")
+        self.assertEqual(page["count"], 1)
+        self.assertEqual(page["measurements"][0]["type"], "heart_rate")
+
+    def test_fetch_measurements_rejects_bad_cursor(self):
+        response = self.client.get("/fetch-measurements/", {"after": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(MEASUREMENTS_DELETE_IN_BACKGROUND=False)
+    def test_delete_experiment(self):
+        response = self.client.post(
+            "/delete-experiment/", json.dumps({"experimentId": "exp-1"}), content_type="application/json"
+        )
+
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(response.json()["state"], "done")
+        self.assertEqual(Measurement.objects.count(), 4)
+        self.assertFalse(Experiment.objects.filter(identifier="exp-1").exists())
+
+    def test_delete_experiment_in_background(self):
+        with override_settings(MEASUREMENTS_DELETE_IN_BACKGROUND=True):
+            response = self.client.post(
+                "/delete-experiment/", json.dumps({"experimentId": "exp-1"}), content_type="application/json"
+            )
+        deletion = response.json()
+
+        self.assertEqual((deletion["status"], deletion["state"], deletion["progress"]), ("success", "pending", 0))
+        # The experiment leaves the list while its rows are deleted
+        self.assertNotContains(self.client.get("/get-data"), "exp-1")
+
+        run_deletion(deletion["deletion"])
+        status = self.client.get("/delete-experiment-status/", {"deletion": deletion["deletion"]}).json()
+        self.assertEqual((status["state"], status["progress"]), ("done", 100))
+        self.assertEqual(status["deleted"], status["total"])
+        self.assertEqual(self.client.get("/delete-experiment-status/", {"deletion": "x"}).status_code, 400)
+
+
+@override_settings(MEASUREMENTS_LIVE_INTERVAL=0)
+class LiveMeasurementsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="researcher", password="password")
+        # Ids cached on commit belong to rows rolled back after the test
+        self.addCleanup(clear_cache)
+
+    def ingest(self, identifier, sample_type, samples):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest(identifier, sample_type, samples)
+
+    async def test_new_samples_are_pushed(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            "/live-measurements/", {"experiments[]": ["exp-1"], "types[]": ["heart_rate"], "points": 10}
+        )
+        events = aiter(response.streaming_content)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(await anext(events), b"retry: 5000\n\n")
+
+        await sync_to_async(self.ingest)("exp-1", "heart_rate", 100)
+        await sync_to_async(self.ingest)("exp-1", "temperature", 5)
+        await sync_to_async(self.ingest)("exp-2", "heart_rate", 5)
+        event = json.loads((await anext(events)).decode().removeprefix("data: "))
+
+        series, = event["measurements"]
+        self.assertEqual((series["experiment"], series["type"], series["samples"]), ("exp-1", "heart_rate", 100))
+        self.assertEqual(len(series["points"]), 10)
+        self.assertEqual(series["points"][0], [1700000000000, 0.0])
+        self.assertTrue(broker.has_subscribers("exp-1"))
+
+        # The ASGI handler cancels the response when the client disconnects,
+        # which ends the subscription
+        waiting = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertFalse(broker.has_subscribers("exp-1"))
+
+    def test_wsgi_requests_are_rejected(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get("/live-measurements/", {"experiments[]": ["exp-1"]})
+
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(broker.has_subscribers("exp-1"))
+        self.assertNotContains(self.client.get("/get-data"), "liveMeasurementsButton")
+
+    async def test_live_button_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/get-data")
+        self.assertContains(response, "liveMeasurementsButton")
+
+    async def test_experiments_are_required(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/live-measurements/")
+        self.assertEqual(response.status_code, 400)
+
+
+class SegmentStorageFetchTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="researcher", password="password")
+        self.client.force_login(user)
+        ingest("exp-1", "heart_rate", 5)
+        ingest("exp-1", "temperature", 3)
+        ingest("exp-2", "acc-x", 4)
+        ingest("exp-2", "acc-y", 4, start=1700000001500)
+
+    def walk(self, **params):
+        rows = []
+        page = self.client.get("/fetch-measurements/", {"experiments[]": ["exp-1", "exp-2"], **params}).json()
+        count = page["count"]
+        while True:
+            rows.extend((m["experiment"], m["timestamp"], m["type"], m["value"]) for m in page["measurements"])
+            if page["next"] is None:
+                return rows, count
+            page = self.client.get(
+                "/fetch-measurements/", {"experiments[]": ["exp-1", "exp-2"], "after": page["next"], **params}
+            ).json()
+
+    def test_scanned_pages_match_database_pages(self):
+        queries = [
+            {"page_size": 4, "sort": "timestamp"},
+            {"page_size": 3, "sort": "type", "order": "desc"},
+            {"page_size": 5, "sort": "experiment", "search": "acc"},
+            {"page_size": 2, "sort": "value", "search": "2"},
+        ]
+        expected = [self.walk(**query) for query in queries]
+
+        call_command("migrate_measurement_storage", "orm", "segments", stdout=io.StringIO())
+        self.assertEqual(Measurement.objects.count(), 0)
+        with override_settings(MEASUREMENTS_STORAGE="segments"):
+            for query, (rows, count) in zip(queries, expected):
+                scanned, scanned_count = self.walk(**query)
+                self.assertEqual(scanned_count, count)
+                # Rows with the same sort value may come in another order
+                self.assertEqual(sorted(scanned), sorted(rows))
+                if query["sort"] == "timestamp":
+                    self.assertEqual(scanned, rows)
+
+            last = self.client.get(
+                "/fetch-measurements/", {"experiments[]": ["exp-2"], "page_size": 3, "last": 1}
+            ).json()
+            self.assertEqual([m["value"] for m in last["measurements"]], [3.0, 2.0, 3.0])
+            previous = self.client.get(
+                "/fetch-measurements/", {"experiments[]": ["exp-2"], "page_size": 3, "before": last["previous"]}
+            ).json()
+            self.assertEqual(len(previous["measurements"]), 3)
+
+    def test_archived_experiments_are_served_from_archive(self):
+        queries = [{"page_size": 4, "sort": "timestamp"}, {"page_size": 3, "sort": "value", "order": "desc"}]
+        expected = [self.walk(**query) for query in queries]
+        export = b"".join(self.client.get("/export-measurements/", {"experiments[]": ["exp-2"]}).streaming_content)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(MEASUREMENTS_ARCHIVE_PATH=Path(directory.name)):
+            call_command("archive_experiments", experiment=["exp-2"], stdout=io.StringIO())
+            experiment = Experiment.objects.get(identifier="exp-2")
+            self.assertTrue(experiment.archived)
+            self.assertEqual(Measurement.objects.filter(experiment=experiment).count(), 0)
+
+            for query, (rows, count) in zip(queries, expected):
+                archived, archived_count = self.walk(**query)
+                self.assertEqual(archived_count, count)
+                self.assertEqual(sorted(archived), sorted(rows))
+            response = self.client.get("/export-measurements/", {"experiments[]": ["exp-2"]})
+            self.assertEqual(b"".join(response.streaming_content), export)
+
+            with self.captureOnCommitCallbacks(execute=True), override_settings(MEASUREMENTS_DELETE_IN_BACKGROUND=False):
+                self.client.post(
+                    "/delete-experiment/", json.dumps({"experimentId": "exp-2"}), content_type="application/json"
+                )
+            self.assertFalse(ArchiveStorage().exists(experiment.id))
+
+
+class ScanPageTests(TestCase):
+
+    def setUp(self):
+        self.windows = []
+
+    # MeasurementStorage.read over one experiment held in arrays
+    def reader(self, dates, values):
+        dates = np.array(dates, dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+
+        def read(experiment_ids, type_ids=None, start=None, end=None):
+            self.windows.append((start, end))
+            selected = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                selected &= dates >= start
+            if end is not None:
+                selected &= dates < end
+            if 1 in experiment_ids and selected.any():
+                yield np.ones(selected.sum(), dtype=np.int64), dates[selected], np.ones(selected.sum(), dtype=np.int64), values[selected]
+
+        return read
+
+    def page(self, read, **options):
+        options = {"sort": "timestamp", "descending": False, "page_size": 2, **options}
+        return pagination.scan_page(read, {1: "exp-1"}, {1: "hr"}, "", **options)
+
+    def test_identical_rows_are_paged(self):
+        read = self.reader([1000, 2000, 2000, 2000, 2000, 3000], [1.0, 5.0, 5.0, 5.0, 5.0, 2.0])
+        for sort in ("timestamp", "value"):
+            rows, cursor = [], None
+            while True:
+                page, cursor, _, _ = self.page(read, sort=sort, after=cursor)
+                rows.extend(page)
+                if cursor is None:
+                    break
+            self.assertEqual(len(rows), 6, sort)
+            self.assertEqual([value for _, _, _, value in rows].count(5.0), 4)
+
+            backwards, cursor = [], None
+            page, _, cursor, _ = self.page(read, sort=sort, last=True)
+            backwards = page + backwards
+            while cursor is not None:
+                page, _, cursor, _ = self.page(read, sort=sort, before=cursor)
+                backwards = page + backwards
+            self.assertEqual(backwards, rows)
+
+    def test_timestamp_pages_read_a_window(self):
+        dates = [1700000000000 + i * 1000 for i in range(1000)]
+        read = self.reader(dates, [float(i) for i in range(1000)])
+        span = (dates[0], dates[-1], 1000)
+
+        page, cursor, _, _ = self.page(read, span=span)
+        self.assertEqual(len(self.windows), 1)
+        self.assertLess(self.windows[0][1], dates[100])
+
+        self.windows.clear()
+        page, _, _, _ = self.page(read, span=span, after=cursor)
+        self.assertEqual([row[3] for row in page], [2.0, 3.0])
+        self.assertEqual(self.windows[0][0], dates[1])
+        self.assertEqual(len(self.windows), 1)
+
+        # A window too short for the page is followed by the rest of the samples
+        for descending, values in ((False, [0.0, 1.0, 2.0]), (True, [999.0, 998.0, 997.0])):
+            self.windows.clear()
+            page, _, _, _ = self.page(read, span=(dates[0], dates[-1], 10**9), descending=descending, page_size=3)
+            self.assertEqual([row[3] for row in page], values)
+            self.assertEqual(len(self.windows), 2)
+            self.assertIsNone(self.windows[1][1] if not descending else self.windows[1][0])
+
+
+class ExportMeasurementsTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="researcher", password="password")
+        self.client.force_login(user)
+        ingest("exp-1", "heart_rate", 5)
+        ingest("exp-1", "temperature", 3)
+        ingest("exp-2", "acc-x", 4)
+
+    def download(self, **params):
+        response = self.client.get("/export-measurements/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_export_csv(self):
+        content = self.download(**{"experiments[]": ["exp-1"], "format": "csv"})
+
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8"))))
+        self.assertEqual(rows[0], ["experiment", "timestamp", "type", "value"])
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[1], ["exp-1", "2023-11-14T22:13:20.000+00:00", "heart_rate", "0.0"])
+
+    def test_export_ndjson_filtered_by_type_and_time(self):
+        content = self.download(**{
+            "experiments[]": ["exp-1"],
+            "format": "ndjson",
+            "types[]": ["heart_rate"],
+            "start": "1700000001000",
+            "end": "2023-11-14T22:13:23",
+        })
+
+        lines = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+        self.assertEqual([line["value"] for line in lines], [1.0, 2.0])
+        self.assertEqual({line["type"] for line in lines}, {"heart_rate"})
+
+    def test_export_npz(self):
+        content = self.download(**{"experiments[]": ["exp-1", "exp-2"], "format": "npz"})
+
+        with np.load(io.BytesIO(content)) as archive:
+            measurements = archive["measurements"]
+            experiments = archive["experiments"]
+            types = archive["types"]
+        self.assertEqual(len(measurements), 12)
+        self.assertEqual(sorted(experiments[measurements["experiment"]].tolist()).count("exp-2"), 4)
+        self.assertEqual(set(types[measurements["type"]].tolist()), {"heart_rate", "temperature", "acc-x"})
+        self.assertEqual(int(measurements["timestamp"][0]), 1700000000000)
+
+    @skipUnless(export.pyarrow is not None, "pyarrow is not installed")
+    def test_export_parquet(self):
+        content = self.download(**{"experiments[]": ["exp-2"], "format": "columnar"})
+
+        table = export.pyarrow.parquet.read_table(export.pyarrow.BufferReader(content))
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(table.column("value").to_pylist(), [0.0, 1.0, 2.0, 3.0])
+
+    def test_export_reads_in_chunks(self):
+        experiment_ids = list(Experiment.objects.values_list("id", flat=True))
+        chunks = list(get_storage().read(experiment_ids, chunk_size=5))
+
+        self.assertEqual([len(values) for _, _, _, values in chunks], [5, 5, 2])
+
+    @override_settings(MEASUREMENTS_STORAGE="segments")
+    def test_export_from_segments(self):
+        call_command("migrate_measurement_storage", "orm", "segments", stdout=io.StringIO())
+
+        content = self.download(**{"experiments[]": ["exp-1"], "format": "csv", "types[]": ["temperature"]})
+
+        rows = list(csv.reader(io.StringIO(content.decode("utf-8"))))
+        self.assertEqual([row[3] for row in rows[1:]], ["0.0", "1.0", "2.0"])
+
+    def test_export_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get("/export-measurements/").status_code, 400)
+        response = self.client.get("/export-measurements/", {"experiments[]": ["exp-1"], "format": "xml"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/export-measurements/", {"experiments[]": ["exp-1"], "start": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        for start in ("99999999999999999999", "-99999999999999999999"):
+            response = self.client.get("/export-measurements/", {"experiments[]": ["exp-1"], "start": start})
+            self.assertEqual(response.status_code, 400, start)
+        response = self.client.get("/export-measurements/", {"experiments[]": ["missing"]})
+        self.assertEqual(response.status_code, 404)
+
+
+def chunked(timestamps, values, size):
+    for i in range(0, len(timestamps), size):
+        yield None, timestamps[i:i + size], None, values[i:i + size]
+
+
+class DownsamplingTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username="researcher", password="password")
+        self.client.force_login(user)
+        random = np.random.default_rng(7)
+        self.timestamps = 1700000000000 + np.arange(1000, dtype=np.int64) * 20
+        self.values = np.sin(np.arange(1000) / 50) + random.normal(0, 0.1, 1000)
+        self.values[437] = 25.0
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        timestamps, values = downsampling.lttb(chunked(self.timestamps, self.values, 64), 1000, 50)
+
+        self.assertEqual(len(timestamps), 50)
+        self.assertEqual(timestamps[0], self.timestamps[0])
+        self.assertEqual(timestamps[-1], self.timestamps[-1])
+        self.assertTrue(np.all(np.diff(timestamps) > 0))
+        self.assertIn(25.0, values)
+
+    def test_lttb_does_not_depend_on_chunk_size(self):
+        small = downsampling.lttb(chunked(self.timestamps, self.values, 7), 1000, 100)
+        large = downsampling.lttb(chunked(self.timestamps, self.values, 1000), 1000, 100)
+
+        np.testing.assert_array_equal(small[0], large[0])
+
+    def test_minmax_keeps_extremes_of_each_period(self):
+        start, end = int(self.timestamps[0]), int(self.timestamps[-1])
+        timestamps, values = downsampling.minmax(chunked(self.timestamps, self.values, 64), start, end, 10)
+
+        self.assertLessEqual(len(timestamps), 20)
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+        self.assertEqual(values.max(), 25.0)
+        self.assertEqual(values.min(), self.values.min())
+
+    def test_downsample_endpoint(self):
+        ingest_batch(MeasurementBatch(
+            "exp-1", self.timestamps.tolist(), ["heart_rate"] * 1000, self.values.tolist()
+        ))
+
+        for method in downsampling.METHODS:
+            response = self.client.get(
+                "/downsample-measurements/", {"experiment": "exp-1", "type": "heart_rate", "points": 40, "method": method}
+            )
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data["samples"], 1000)
+            self.assertLessEqual(len(data["points"]), 40)
+            self.assertIn([1700000000000 + 437 * 20, 25.0], data["points"])
+
+        response = self.client.get("/downsample-measurements/", {"experiment": "exp-1", "type": "missing"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_measurement_statistics_endpoint(self):
+        ingest_batch(MeasurementBatch(
+            "exp-1", self.timestamps.tolist(), ["heart_rate"] * 1000, self.values.tolist()
+        ))
+
+        response = self.client.get(
+            "/measurement-statistics/", {"experiment": "exp-1", "type": "heart_rate", "resolution": 10}
+        )
+
+        data = response.json()
+        self.assertEqual(data["rollup"], 1)
+        self.assertEqual(sum(bucket["samples"] for bucket in data["buckets"]), 1000)
+        self.assertEqual(max(bucket["max"] for bucket in data["buckets"]), 25.0)
+
+    def test_measurement_statistics_without_dates(self):
+        ingest_batch(MeasurementBatch("exp-1", [1700000000000], ["heart_rate"], [1.0]))
+        ExperimentSummary.objects.filter(experiment__identifier="exp-1").update(start_date=None, end_date=None)
+
+        response = self.client.get("/measurement-statistics/", {"experiment": "exp-1", "type": "heart_rate"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["buckets"], [])
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is specific to SQLite")
+class MeasurementQueryPlanTests(TestCase):
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan, plan)
+        self.assertNotIn("SCAN dataAPI_measurement\n", plan + "\n", plan)
+
+    def test_summary_rebuild_uses_index(self):
+        queryset = (
+            Measurement.objects.filter(experiment_id=1)
+            .order_by()
+            .values("type_id")
+            .annotate(samples=Count("id"), start_date=Min("timestamp"), end_date=Max("timestamp"))
+        )
+        self.assertUsesIndex(queryset, "measurement_exp_type_ts")
+
+    def test_experiment_types_use_index(self):
+        queryset = Measurement.objects.filter(experiment_id=1).values_list("type_id", flat=True).distinct()
+        self.assertUsesIndex(queryset, "measurement_exp_type_ts")
+
+    def test_fetch_measurements_uses_index(self):
+        queryset = Measurement.objects.filter(experiment_id__in=[1, 2])
+        self.assertUsesIndex(queryset, "measurement_exp")
+
+    def test_delete_experiment_uses_index(self):
+        queryset = Measurement.objects.filter(experiment_id=1)
+        self.assertUsesIndex(queryset, "measurement_exp")
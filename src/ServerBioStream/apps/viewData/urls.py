@@ -4,5 +4,10 @@ from . import views
 urlpatterns = [
     path('get-data', views.get_data, name='get-data'),
     path('fetch-measurements/', views.fetch_measurements, name='fetch_measurements'),
+    path('export-measurements/', views.export_measurements, name='export_measurements'),
+    path('downsample-measurements/', views.downsample_measurements, name='downsample_measurements'),
+    path('live-measurements/', views.live_measurements, name='live_measurements'),
+    path('measurement-statistics/', views.measurement_statistics, name='measurement_statistics'),
     path('delete-experiment/', views.delete_experiment, name='delete_experiment'),
+    path('delete-experiment-status/', views.delete_experiment_status, name='delete_experiment_status'),
 ]
\ No newline at end of file
@@ -1,65 +1,350 @@
+import asyncio
 import json
+
+import numpy as np
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
-from rest_framework.parsers import JSONParser
-from rest_framework.views import APIView
-from django.db import IntegrityError
-from django.http import JsonResponse
-from django.db.models import Min, Max, Count
-from venv import logger
-
-from apps.dataAPI.models import Measurement
+from django.db.models import Max, Min, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+
+from apps.dataAPI.deletion import ACTIVE_STATUSES, start_deletion
+from apps.dataAPI.dimensions import get_sensor_type_names
+from apps.dataAPI.live import broker
+from apps.dataAPI.models import Experiment, ExperimentDeletion, ExperimentSummary
+from apps.dataAPI.rollups import RollupError, query_rollups
+from apps.dataAPI.storage import get_storage
+from apps.dataAPI.storage.base import to_millis
+from apps.monitoring.budget import query_budget
+from apps.monitoring.metrics import span
 from django.contrib.auth.decorators import login_required
 
+from .downsampling import LTTB, METHODS, DownsamplingError, downsample, get_points, lttb, minmax
+from .export import FORMATS, ExportError, parse_time, resolve_format, stream_export
+from .pagination import (
+    PaginationError,
+    get_page_size,
+    keyset_page,
+    scan_page,
+    search_counts_from_summaries,
+    search_filter,
+)
+
+DEFAULT_LIVE_INTERVAL = 1.0
+DEFAULT_LIVE_POINTS = 500
+# Seconds without samples after which a live view gets a keep-alive comment
+LIVE_KEEPALIVE = 15
+
 """
 Method used to get all the experiments for the inital load of view-data.html 
 """
+@query_budget(8)
 @login_required
 def get_data(request):
-    experiments = Measurement.objects.values('experiment').annotate(
-        start_date=Min('timestamp'),
-        end_date=Max('timestamp'),
+    # Experiments being deleted are left out
+    summaries = (
+        ExperimentSummary.objects.select_related('experiment')
+        .filter(samples__gt=0)
+        .exclude(experiment__deletions__status__in=ACTIVE_STATUSES)
     )
 
-    for experiment in experiments:
-        types = Measurement.objects.filter(experiment=experiment['experiment']).values_list('type', flat=True).distinct()
-        sorted_types = sorted(set(types))
-        
+    with span("experiments.query"):
+        summaries = list(summaries)
+
+    experiments = []
+    for summary in summaries:
+        sorted_types = summary.types
+
         # Insert a line break every 5 items
         # Split the list into sublists of 5 elements
         grouped_types = [sorted_types[i:i+5] for i in range(0, len(sorted_types), 5)]
-        
-        # Join each group of elements with a comma, and between groups add a line break
-        experiment['types'] = '\n'.join([', '.join(group) for group in grouped_types])
 
-    return render(request, 'view-data.html', {"measurements": [], "experiments": experiments})
+        experiments.append({
+            'experiment': summary.experiment.identifier,
+            'start_date': summary.start_date,
+            'end_date': summary.end_date,
+            'samples': summary.samples,
+            # Join each group of elements with a comma, and between groups add a line break
+            'types': '\n'.join([', '.join(group) for group in grouped_types]),
+        })
+
+    return render(
+        request,
+        'view-data.html',
+        {"measurements": [], "experiments": experiments, "live": isinstance(request, ASGIRequest)},
+    )
 
 """
-Method used to get all the measurements of an experiment
+Method used to get one page of the measurements of the selected experiments.
+Query parameters:
+    experiments[]   experiments to read (all of them when missing)
+    page_size       rows per page
+    sort, order     column (experiment, timestamp, type, value) and asc/desc
+    search          text filter, as the search box of the table
+    after, before   cursors of the next/previous page returned by a previous call
+    last            read the last page
 """
+# Scanned storages (segments, archives) take a few queries per time window read
+@query_budget(16)
 @login_required
 def fetch_measurements(request):
     experiment_ids = request.GET.getlist('experiments[]')
 
+    experiments = Experiment.objects.all()
     if experiment_ids:
-        measurements = Measurement.objects.filter(experiment__in=experiment_ids)
-    else:
-        measurements = Measurement.objects.all()
+        experiments = experiments.filter(identifier__in=experiment_ids)
+    identifiers = dict(experiments.values_list('id', 'identifier'))
+    type_names = get_sensor_type_names()
+
+    storage = get_storage()
+    measurements = storage.queryset(list(identifiers))
+    search = request.GET.get('search', '').strip()
+
+    try:
+        page_options = {
+            'sort': request.GET.get('sort', 'timestamp'),
+            'descending': request.GET.get('order', 'asc') == 'desc',
+            'page_size': get_page_size(request.GET.get('page_size')),
+            'after': request.GET.get('after') or None,
+            'before': request.GET.get('before') or None,
+            'last': request.GET.get('last') in ('1', 'true'),
+        }
+        with span("measurements.page"):
+            if measurements is not None:
+                if search:
+                    measurements = measurements.filter(search_filter(search, identifiers, type_names))
+                page, next_cursor, previous_cursor = keyset_page(
+                    measurements, ('experiment_id', 'timestamp', 'type_id', 'value'), **page_options
+                )
+            else:
+                # Storage without SQL rows: the page is found scanning the samples,
+                # by time windows when sorted by timestamp
+                time_span = summaries_span(identifiers) if page_options['sort'] == 'timestamp' and not search else None
+                page, next_cursor, previous_cursor, matches = scan_page(
+                    storage.read, identifiers, type_names, search, span=time_span, **page_options
+                )
+    except PaginationError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    with span("measurements.count"):
+        if search and not search_counts_from_summaries(search):
+            count = measurements.count() if measurements is not None else matches
+        else:
+            count = count_from_summaries(identifiers, search)
 
     measurements_data = [
         {
-            "experiment": m.experiment,
-            "timestamp": m.timestamp.strftime("%d/%m/%Y %H:%M:%S.%f"),
-            "type": m.type,
-            "value": m.value,
+            "experiment": identifiers[experiment_id],
+            "timestamp": timestamp.strftime("%d/%m/%Y %H:%M:%S.%f"),
+            "type": type_names[type_id],
+            "value": value,
         }
-        for m in measurements
+        for experiment_id, timestamp, type_id, value in page
     ]
 
-    return JsonResponse({"measurements": measurements_data})
+    return JsonResponse({
+        "measurements": measurements_data,
+        "count": count,
+        "next": next_cursor,
+        "previous": previous_cursor,
+    })
+
+"""
+First and last timestamps (UNIX ms) and number of samples of some experiments,
+read from their summaries, or None when they have no samples
+"""
+def summaries_span(identifiers):
+    summary = ExperimentSummary.objects.filter(experiment_id__in=list(identifiers)).aggregate(
+        first=Min('start_date'), last=Max('end_date'), samples=Sum('samples')
+    )
+    if summary['first'] is None or summary['last'] is None or not summary['samples']:
+        return None
+    return to_millis(summary['first']), to_millis(summary['last']), summary['samples']
+
+"""
+Number of measurements of some experiments matching a search by experiment or
+type, read from the experiment summaries
+"""
+def count_from_summaries(identifiers, search):
+    term = search.lower()
+    count = 0
+    summaries = ExperimentSummary.objects.filter(experiment_id__in=list(identifiers))
+    for experiment_id, type_counts in summaries.values_list('experiment_id', 'type_counts'):
+        if term in identifiers[experiment_id].lower():
+            count += sum(type_counts.values())
+        else:
+            count += sum(samples for name, samples in type_counts.items() if term in name.lower())
+    return count
+
+"""
+Method used to download the measurements of one or more experiments. The file is
+streamed while it is read from the database, so memory stays constant whatever
+the size of the experiments.
+
+Query parameters:
+    experiments[]   identifiers of the experiments (required)
+    format          csv (default), ndjson, parquet, arrow, npz or columnar
+                    (Parquet when pyarrow is installed, NPZ otherwise)
+    types[]         only these measurement types
+    start, end      time range [start, end) in UNIX ms or ISO 8601
+"""
+@query_budget(10)
+@login_required
+def export_measurements(request):
+    experiment_ids = request.GET.getlist('experiments[]')
+    if not experiment_ids:
+        return JsonResponse({"detail": "At least one experiment is required"}, status=400)
+
+    try:
+        file_format = resolve_format(request.GET.get('format'))
+        start = parse_time(request.GET.get('start'))
+        end = parse_time(request.GET.get('end'))
+    except ExportError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    identifiers = dict(
+        Experiment.objects.filter(identifier__in=experiment_ids).order_by('identifier').values_list('id', 'identifier')
+    )
+    if not identifiers:
+        return JsonResponse({"detail": "Experiment not found"}, status=404)
+    type_names = get_sensor_type_names()
+
+    type_ids = None
+    types = request.GET.getlist('types[]')
+    if types:
+        type_ids = [type_id for type_id, name in type_names.items() if name in types]
+
+    content_type, extension = FORMATS[file_format]
+    filename = next(iter(identifiers.values())).replace('"', '') if len(identifiers) == 1 else "measurements"
+
+    response = StreamingHttpResponse(
+        stream_export(file_format, get_storage(), identifiers, type_names, type_ids, start, end),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+"""
+Method used to get the trace of one measurement type of an experiment reduced
+to a few points for plotting (see downsampling.py).
+
+Query parameters:
+    experiment      identifier of the experiment
+    type            measurement type
+    start, end      time window [start, end) in UNIX ms or ISO 8601
+    points          maximum number of points returned (default 2000)
+    method          lttb (default) or minmax
+"""
+@query_budget(12)
+@login_required
+def downsample_measurements(request):
+    method = request.GET.get('method', LTTB)
+    if method not in METHODS:
+        return JsonResponse({"detail": f"method must be one of: {', '.join(METHODS)}"}, status=400)
+    try:
+        points = get_points(request.GET.get('points'))
+        start = parse_time(request.GET.get('start'))
+        end = parse_time(request.GET.get('end'))
+    except (DownsamplingError, ExportError) as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    identifier = request.GET.get('experiment', '')
+    sample_type = request.GET.get('type', '')
+    experiment_id = Experiment.objects.filter(identifier=identifier).values_list('id', flat=True).first()
+    type_id = next((i for i, name in get_sensor_type_names().items() if name == sample_type), None)
+    if experiment_id is None or type_id is None:
+        return JsonResponse({"detail": "Experiment or measurement type not found"}, status=404)
+
+    storage = get_storage()
+    samples = storage.count([experiment_id], [type_id], start, end)
+    chunks = storage.read([experiment_id], [type_id], start, end)
+    if method == LTTB:
+        timestamps, values = lttb(chunks, samples, points)
+    elif samples:
+        _, first, last = storage.type_statistics(experiment_id)[type_id]
+        timestamps, values = minmax(chunks, first if start is None else start, last if end is None else end, max(points // 2, 1))
+    else:
+        timestamps, values = [], []
+
+    return JsonResponse({
+        "experiment": identifier,
+        "type": sample_type,
+        "method": method,
+        "samples": samples,
+        "points": [[int(timestamp), float(value)] for timestamp, value in zip(timestamps, values)],
+    })
+
+"""
+Method used to get statistics (samples, min, max, mean, std, sum) of one
+measurement type of an experiment per period of time, read from the rollups.
+
+Query parameters:
+    experiment      identifier of the experiment
+    type            measurement type
+    resolution      length of the periods in seconds (default 60)
+    start, end      time window [start, end) in UNIX ms or ISO 8601 (default:
+                    the whole experiment)
+"""
+@query_budget(10)
+@login_required
+def measurement_statistics(request):
+    try:
+        resolution = int(request.GET.get('resolution') or 60)
+        start = parse_time(request.GET.get('start'))
+        end = parse_time(request.GET.get('end'))
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    identifier = request.GET.get('experiment', '')
+    sample_type = request.GET.get('type', '')
+    summary = ExperimentSummary.objects.filter(experiment__identifier=identifier).first()
+    type_id = next((i for i, name in get_sensor_type_names().items() if name == sample_type), None)
+    if summary is None or type_id is None:
+        return JsonResponse({"detail": "Experiment or measurement type not found"}, status=404)
+
+    if (start is None and summary.start_date is None) or (end is None and summary.end_date is None):
+        # No samples summarized yet, or the summary is being rebuilt
+        tier, buckets = None, []
+    else:
+        if start is None:
+            start = to_millis(summary.start_date)
+        if end is None:
+            # The last sample of the experiment is included
+            end = to_millis(summary.end_date) + 1
+        try:
+            tier, buckets = query_rollups(summary.experiment_id, type_id, start, end, resolution)
+        except RollupError as e:
+            return JsonResponse({"detail": str(e)}, status=400)
+
+    return JsonResponse({
+        "experiment": identifier,
+        "type": sample_type,
+        "resolution": resolution,
+        "rollup": tier,
+        "buckets": buckets,
+    })
+
+"""
+Return the progress of a deletion for the page. A missing deletion (the
+experiment did not exist) is reported as done.
+"""
+def deletion_state(deletion):
+    if deletion is None:
+        return {"deletion": None, "state": ExperimentDeletion.DONE, "progress": 100, "deleted": 0, "total": 0}
+    return {
+        "deletion": deletion.id,
+        "state": deletion.status,
+        "progress": deletion.progress,
+        "deleted": deletion.deleted,
+        "total": deletion.total,
+    }
 
 """
 Method used to delete an experiment
 """
+# Deleting in the request (MEASUREMENTS_DELETE_IN_BACKGROUND off) takes a few
+# queries per table and chunk, in the background only the first ones are counted
+@query_budget(50)
 @login_required
 def delete_experiment(request):
 
@@ -68,9 +353,16 @@ def delete_experiment(request):
         experimentId = body.get("experimentId", None)
 
         try:
-            experiment = Measurement.objects.filter(experiment=experimentId).delete()
+            # The rows of the experiment are deleted in chunks in the background
+            # (see apps.dataAPI.deletion); the page polls delete-experiment-status
+            deletion = start_deletion(experimentId)
+            state = deletion_state(deletion)
             return JsonResponse(
-                {"status": "success", "message": "Study case deleted."}
+                {
+                    "status": "success",
+                    "message": "Study case deleted." if state["state"] == ExperimentDeletion.DONE else "Deleting study case.",
+                    **state,
+                }
             )
         except json.JSONDecodeError:
             return JsonResponse(
@@ -85,3 +377,105 @@ def delete_experiment(request):
         )
 
     return 
+
+"""
+Method used to get the progress of the deletion of an experiment.
+Query parameters:
+    deletion        id returned by delete-experiment
+"""
+@query_budget(6)
+@login_required
+def delete_experiment_status(request):
+    try:
+        deletion = ExperimentDeletion.objects.filter(id=int(request.GET.get('deletion', ''))).first()
+    except ValueError:
+        return JsonResponse({"detail": "Invalid deletion id"}, status=400)
+    if deletion is None:
+        return JsonResponse({"detail": "Deletion not found"}, status=404)
+    return JsonResponse({**deletion_state(deletion), "error": deletion.error})
+
+"""
+Method used to follow the measurements of some experiments while they are
+stored, as Server-Sent Events (served by an ASGI server, see docs). Each event
+has the new samples of every experiment and type since the previous one,
+reduced to a few points, so following a running study only costs the new data.
+
+Query parameters:
+    experiments[]   identifiers of the experiments (required)
+    types[]         measurement types (default: all)
+    points          maximum points per experiment and type in each event
+                    (default MEASUREMENTS_LIVE_POINTS)
+    method          lttb (default) or minmax
+    interval        seconds between events, at least MEASUREMENTS_LIVE_INTERVAL
+"""
+@query_budget(6)
+@login_required
+async def live_measurements(request):
+    # A WSGI server would run the endless stream in one of its threads forever
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Live measurements require an ASGI server (e.g. uvicorn)"}, status=501)
+    identifiers = request.GET.getlist('experiments[]')
+    method = request.GET.get('method', LTTB)
+    if not identifiers:
+        return JsonResponse({"detail": "experiments[] is required"}, status=400)
+    if method not in METHODS:
+        return JsonResponse({"detail": f"method must be one of: {', '.join(METHODS)}"}, status=400)
+    min_interval = getattr(settings, 'MEASUREMENTS_LIVE_INTERVAL', DEFAULT_LIVE_INTERVAL)
+    try:
+        points = get_points(request.GET.get('points') or getattr(settings, 'MEASUREMENTS_LIVE_POINTS', DEFAULT_LIVE_POINTS))
+        interval = max(float(request.GET.get('interval') or min_interval), min_interval)
+    except (DownsamplingError, ValueError) as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    subscription = broker.subscribe(identifiers, request.GET.getlist('types[]'))
+    response = StreamingHttpResponse(
+        live_events(subscription, points, method, interval), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Proxies such as NGINX must not buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+"""
+Events of a live view: the new samples at most once per "interval" seconds, and
+a comment when there are none for LIVE_KEEPALIVE seconds so proxies keep the
+connection open. The subscription ends when the client disconnects.
+"""
+async def live_events(subscription, points, method, interval):
+    loop = asyncio.get_running_loop()
+    try:
+        yield 'retry: 5000\n\n'
+        last = loop.time()
+        while True:
+            await asyncio.sleep(max(0, last + interval - loop.time()))
+            chunks, dropped = await subscription.take(LIVE_KEEPALIVE)
+            last = loop.time()
+            if not chunks and not dropped:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'data: {json.dumps(live_event(chunks, dropped, points, method))}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+"""
+New samples of each experiment and type, reduced to "points" points
+"""
+def live_event(chunks, dropped, points, method):
+    series = {}
+    for identifier, dates, type_names, values in chunks:
+        for name in np.unique(type_names).tolist():
+            selected = type_names == name
+            series.setdefault((identifier, name), []).append((dates[selected], values[selected]))
+
+    measurements = []
+    for (identifier, name), parts in sorted(series.items()):
+        timestamps = np.concatenate([dates for dates, _ in parts])
+        values = np.concatenate([values for _, values in parts])
+        kept_timestamps, kept_values = downsample(timestamps, values, points, method)
+        measurements.append({
+            "experiment": identifier,
+            "type": name,
+            "samples": len(timestamps),
+            "points": [[int(timestamp), float(value)] for timestamp, value in zip(kept_timestamps, kept_values)],
+        })
+    return {"measurements": measurements, "dropped": dropped}
@@ -0,0 +1,20 @@
+import os
+import sys
+from pathlib import Path
+
+# Root of the Django project (where manage.py lives)
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+"""
+Configure Django so the benchmarks can import the project apps when they are
+run as scripts, e.g. python -m benchmarks.validation
+"""
+def setup_django():
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ServerBioStream.settings")
+
+    import django
+
+    django.setup()
@@ -0,0 +1,172 @@
+"""
+Load test of a running server with many watches that keep their connection open
+(HTTP/1.1 keep-alive) and post a data send every few seconds, as SmartBioStream
+does. Each watch is a coroutine of a local stand-in client, so thousands of them
+run in this process. Start the server first, e.g. the async endpoint under uvicorn:
+
+    uvicorn ServerBioStream.asgi:application --port 8000 --timeout-keep-alive 75
+    python -m benchmarks.async_ingest --watches 2000 --interval 5 --seconds 30
+
+Compare with the sync endpoint (--path /measurements-api/send/) under the same
+server, or under a WSGI server. Reports the data sends per second, the latency
+percentiles, the answers by status code and the connection errors.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+# HTTP/1.1 connection that is reused for every request until the server closes it
+class Connection:
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    """
+    Post a body and return the status code, the headers and the body of the
+    answer. The connection is opened again if the server closed it, e.g. after
+    its keep-alive timeout.
+    """
+    async def post(self, path, body, content_type="application/json", headers=None):
+        reused = self.writer is not None
+        try:
+            return await self.request(path, body, content_type, headers)
+        except (ConnectionClosed, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+        return await self.request(path, body, content_type, headers)
+
+    async def request(self, path, body, content_type, headers):
+        if self.writer is None:
+            await self.open()
+        lines = [
+            f"POST {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            *(f"{name}: {value}" for name, value in (headers or {}).items()),
+        ]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.close()
+            raise ConnectionClosed("Connection closed by the server")
+        status = int(status_line.split()[1])
+        answer_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            answer_headers[name.strip().lower()] = value.strip()
+        answer = await self.reader.readexactly(int(answer_headers.get("content-length", 0)))
+        if answer_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, answer_headers, answer
+
+
+def data_send(identifier, date, samples):
+    return {
+        "identifier": identifier,
+        "measurements": [
+            {"date": date + i * 20, "type": "acc-x", "value": round(random.gauss(0, 1), 4)} for i in range(samples)
+        ],
+    }
+
+
+async def watch(number, url, args, deadline, results):
+    connection = Connection(url.hostname, url.port or 80)
+    # Spread the connections and the first data sends
+    await asyncio.sleep(random.uniform(0, args.ramp))
+    date = int(time.time() * 1000)
+    next_send = time.monotonic() + random.uniform(0, args.interval)
+    while True:
+        await asyncio.sleep(max(0, min(next_send, deadline) - time.monotonic()))
+        if time.monotonic() >= deadline:
+            break
+        next_send += args.interval
+        body = json.dumps(data_send(f"watch-{number}", date, args.samples)).encode()
+        date += args.samples * 20
+        started = time.perf_counter()
+        try:
+            status, _, _ = await connection.post(url.path, body)
+        except (OSError, ConnectionClosed, asyncio.IncompleteReadError) as e:
+            connection.close()
+            results["errors"][type(e).__name__] += 1
+            continue
+        results["latencies"].append(time.perf_counter() - started)
+        results["statuses"][status] += 1
+    connection.close()
+
+
+# Allow as many open sockets as the hard limit
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+async def run(args):
+    url = urlsplit(args.url.rstrip("/") + args.path)
+    results = {"latencies": [], "statuses": Counter(), "errors": Counter()}
+    started = time.monotonic()
+    deadline = started + args.ramp + args.seconds
+    await asyncio.gather(*(watch(number, url, args, deadline, results) for number in range(args.watches)))
+    return results, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Address of the server")
+    parser.add_argument("--path", default="/measurements-api/send-async/", help="Data send endpoint")
+    parser.add_argument("--watches", type=int, default=1000, help="Concurrent watches, one connection each")
+    parser.add_argument("--samples", type=int, default=150, help="Samples per data send")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between the data sends of a watch")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which the watches connect")
+    parser.add_argument("--seconds", type=float, default=30, help="Duration of the test after the ramp")
+    args = parser.parse_args()
+
+    limit = raise_file_limit()
+    if args.watches > limit - 16:
+        parser.error(f"--watches needs more open files than the limit ({limit}); raise it with ulimit -n")
+
+    results, elapsed = asyncio.run(run(args))
+    latencies = np.array(results["latencies"]) * 1000
+    stored = sum(count for status, count in results["statuses"].items() if status in (200, 201, 202))
+    print(f"{args.watches} watches, {elapsed:.1f} s")
+    print(f"data sends stored: {stored} ({stored / elapsed:.1f}/s, {stored * args.samples / elapsed:.0f} samples/s)")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"latency ms: p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  max {latencies.max():.1f}")
+    print("answers: " + ", ".join(f"{status}: {count}" for status, count in sorted(results["statuses"].items())))
+    if results["errors"]:
+        print("connection errors: " + ", ".join(f"{name}: {count}" for name, count in results["errors"].items()))
+
+
+if __name__ == "__main__":
+    main()
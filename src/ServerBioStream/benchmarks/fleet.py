@@ -0,0 +1,330 @@
+"""
+Load test of a running server with a fleet of SmartBioStream watches. Every watch
+posts the data sends of its sensors (benchmarks.payloads: accelerometer,
+gyroscope, heart rate and temperature batches by default) to
+/measurements-api/send/ as the app does: each data send is posted on its own,
+without waiting for the previous ones, over at most --connections keep-alive
+connections per watch (the idle connections kept by OkHttp).
+
+When the watches connect depends on --profile:
+    linear   one after the other over --ramp seconds
+    step     in --steps groups over --ramp seconds
+    burst    all of them at once
+Each watch first flushes --backlog seconds of data sends recorded while it was
+offline, all at once, and then keeps sending until --seconds after the ramp.
+Many watches reconnecting after a network outage are, for instance:
+
+    python -m benchmarks.fleet --watches 500 --profile burst --backlog 300 --seconds 60
+
+Failed data sends are handled as --retry says:
+    none     as the app does: logged and lost (a request on a connection the
+             server closed is posted again once, as OkHttp does)
+    backoff  posted again after an exponential backoff, or after the Retry-After
+             of the answer, up to --max-retries times. The body is the same, so
+             the server acknowledges a retry of a stored data send as duplicate
+
+Reports the latency of the requests, the delay until each data send was stored
+(including the wait for a connection and the retries), the errors and the lost
+data sends, and the samples stored per second.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .async_ingest import Connection, ConnectionClosed, raise_file_limit
+from .payloads import SENSORS, SensorSpecError, generate_sends, parse_sensors
+
+PROFILES = ("linear", "step", "burst")
+RETRIES = ("none", "backoff")
+STORED = (200, 201, 202)
+# Answers worth retrying with --retry backoff; the others will fail again
+RETRIED_STATUSES = (429, 500, 502, 503, 504)
+
+
+"""
+Return the second at which each watch connects, from the start of the test
+"""
+def connect_times(watches, profile, ramp, steps):
+    if profile == "burst" or watches == 1:
+        return [0.0] * watches
+    if profile == "step":
+        steps = max(1, min(steps, watches))
+        return [ramp * (watch * steps // watches) / max(steps - 1, 1) for watch in range(watches)]
+    return [ramp * watch / (watches - 1) for watch in range(watches)]
+
+
+# Counters and latencies of the whole fleet, and the samples stored per second
+class Results:
+
+    def __init__(self, started):
+        self.started = started
+        self.latencies = []
+        self.delays = []
+        self.answers = Counter()
+        self.errors = Counter()
+        self.sends = 0
+        self.stored = 0
+        self.lost = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.connected = 0
+        self.stored_per_second = Counter()
+
+    def store(self, samples):
+        self.stored += 1
+        self.stored_per_second[int(time.monotonic() - self.started)] += samples
+
+    def samples_between(self, start, end):
+        return sum(samples for second, samples in self.stored_per_second.items() if start <= second < end)
+
+
+# A watch, with its pool of connections
+class Watch:
+
+    def __init__(self, number, fleet):
+        self.number = number
+        self.fleet = fleet
+        self.connections = asyncio.Queue()
+        for _ in range(fleet.args.connections):
+            self.connections.put_nowait(Connection(fleet.url.hostname, fleet.url.port or 80))
+        self.tasks = set()
+
+    async def run(self, connect_at, deadline):
+        fleet = self.fleet
+        await asyncio.sleep(max(0, connect_at - time.monotonic()))
+        fleet.results.connected += 1
+        # The recording started --backlog seconds before connecting
+        recording_start = time.monotonic() - fleet.args.backlog
+        sends = generate_sends(1, fleet.sensors, deadline - recording_start, fleet.args.seed, self.number)
+        for moment, _, payload in sends:
+            due = recording_start + moment
+            await asyncio.sleep(max(0, due - time.monotonic()))
+            body = json.dumps(payload).encode()
+            task = asyncio.create_task(self.send(body, len(payload["measurements"]), due))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+    """
+    Post a data send, again after a failure with --retry backoff, and count it
+    """
+    async def send(self, body, samples, due):
+        fleet = self.fleet
+        results = fleet.results
+        results.sends += 1
+        results.in_flight += 1
+        try:
+            for attempt in range(fleet.args.max_retries + 1 if fleet.args.retry == "backoff" else 1):
+                if attempt:
+                    results.retries += 1
+                retry_after = await self.post(body)
+                if retry_after is None:
+                    results.store(samples)
+                    results.delays.append(time.monotonic() - due)
+                    return
+                if retry_after is False:
+                    break
+                delay = fleet.args.retry_delay * 2 ** attempt
+                await asyncio.sleep(max(delay, retry_after) * random.uniform(1, 1.5))
+            results.lost += 1
+        finally:
+            results.in_flight -= 1
+
+    """
+    Post a body over a free connection of the watch. Return None when stored,
+    the seconds to wait (Retry-After, or 0) when it may be retried and False
+    when a retry would fail again
+    """
+    async def post(self, body):
+        fleet = self.fleet
+        results = fleet.results
+        connection = await self.connections.get()
+        started = time.perf_counter()
+        try:
+            status, headers, _ = await asyncio.wait_for(
+                connection.post(fleet.url.path, body, headers=fleet.headers), fleet.args.timeout
+            )
+        except (OSError, ConnectionClosed, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            # The state of the connection is unknown
+            connection.close()
+            results.errors[type(e).__name__] += 1
+            return 0
+        finally:
+            self.connections.put_nowait(connection)
+        results.latencies.append(time.perf_counter() - started)
+        results.answers[status] += 1
+        if status in STORED:
+            return None
+        results.errors[str(status)] += 1
+        if status not in RETRIED_STATUSES:
+            return False
+        try:
+            return float(headers.get("retry-after", 0))
+        except ValueError:
+            return 0
+
+
+class Fleet:
+
+    def __init__(self, args):
+        self.args = args
+        self.url = urlsplit(args.url.rstrip("/") + args.path)
+        self.sensors = parse_sensors(args.sensors)
+        self.headers = {"Authorization": f"Token {args.token}"} if args.token else None
+        self.results = None
+
+    async def report(self, deadline):
+        results = self.results
+        last_samples, last_time = 0, time.monotonic()
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.report_interval)
+            now = time.monotonic()
+            samples = sum(results.stored_per_second.values())
+            print(
+                f"{now - results.started:7.1f} s  watches {results.connected:>6}  in flight {results.in_flight:>6}  "
+                f"stored {results.stored:>8}  lost {results.lost:>6}  errors {sum(results.errors.values()):>6}  "
+                f"samples/s {(samples - last_samples) / (now - last_time):>10.0f}",
+                flush=True,
+            )
+            last_samples, last_time = samples, now
+
+    async def run(self):
+        args = self.args
+        started = time.monotonic()
+        self.results = Results(started)
+        ramp = 0 if args.profile == "burst" else args.ramp
+        deadline = started + ramp + args.seconds
+        times = connect_times(args.watches, args.profile, ramp, args.steps)
+        watches = [Watch(number, self) for number in range(args.watches)]
+        reporter = asyncio.create_task(self.report(deadline))
+        await asyncio.gather(*(watch.run(started + at, deadline) for watch, at in zip(watches, times)))
+        reporter.cancel()
+        return time.monotonic() - started, ramp
+
+    def summary(self, elapsed, ramp):
+        results = self.results
+        requests = sum(results.answers.values()) + sum(
+            count for name, count in results.errors.items() if not name.isdigit()
+        )
+        errors = sum(results.errors.values())
+        samples = sum(results.stored_per_second.values())
+        seconds = self.args.seconds
+        per_interval = [
+            results.samples_between(second, second + self.args.report_interval) / self.args.report_interval
+            for second in range(0, int(elapsed), max(1, int(self.args.report_interval)))
+        ]
+
+        def percentiles(values):
+            if not values:
+                return {"p50": None, "p99": None, "max": None}
+            p50, p99 = np.percentile(np.asarray(values) * 1000, [50, 99])
+            return {"p50": round(p50, 1), "p99": round(p99, 1), "max": round(max(values) * 1000, 1)}
+
+        return {
+            "options": {name: value for name, value in vars(self.args).items() if name != "output"},
+            "seconds": round(elapsed, 1),
+            "sends": results.sends,
+            "stored": results.stored,
+            "lost": results.lost,
+            "loss_rate": round(results.lost / results.sends, 5) if results.sends else 0,
+            "requests": requests,
+            "retries": results.retries,
+            "errors": dict(results.errors),
+            "error_rate": round(errors / requests, 5) if requests else 0,
+            "answers": {str(status): count for status, count in sorted(results.answers.items())},
+            "latency_ms": percentiles(results.latencies),
+            "delivery_delay_ms": percentiles(results.delays),
+            "samples_per_second": round(samples / elapsed, 1) if elapsed else 0,
+            # After the ramp and until the deadline, every watch connected
+            "sustained_samples_per_second": round(
+                results.samples_between(int(ramp), int(ramp + seconds)) / seconds, 1
+            ) if seconds else 0,
+            "peak_samples_per_second": round(max(per_interval), 1) if per_interval else 0,
+        }
+
+
+def print_summary(summary):
+    options = summary["options"]
+    ramp = "" if options["profile"] == "burst" else f", ramp {options['ramp']} s"
+    print(
+        f"\n{options['watches']} watches ({options['profile']} profile{ramp}, "
+        f"backlog {options['backlog']} s, retry {options['retry']}), {summary['seconds']} s"
+    )
+    print(
+        f"data sends: {summary['sends']} sent, {summary['stored']} stored, "
+        f"{summary['lost']} lost ({summary['loss_rate'] * 100:.2f}%)"
+    )
+    errors = ", ".join(f"{name}: {count}" for name, count in sorted(summary["errors"].items()))
+    print(
+        f"requests: {summary['requests']} ({summary['retries']} retries), "
+        f"errors {summary['error_rate'] * 100:.2f}%" + (f" ({errors})" if errors else "")
+    )
+    for name, label in (("latency_ms", "request latency ms"), ("delivery_delay_ms", "delivery delay ms")):
+        values = summary[name]
+        if values["p50"] is not None:
+            print(f"{label}: p50 {values['p50']}  p99 {values['p99']}  max {values['max']}")
+    print(
+        f"samples/s stored: {summary['samples_per_second']:.0f} overall, "
+        f"{summary['sustained_samples_per_second']:.0f} sustained after the ramp, "
+        f"{summary['peak_samples_per_second']:.0f} peak"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Address of the server")
+    parser.add_argument("--path", default="/measurements-api/send/", help="Data send endpoint")
+    parser.add_argument("--watches", type=int, default=200, help="Watches of the fleet")
+    parser.add_argument(
+        "--sensors",
+        nargs="+",
+        default=list(SENSORS),
+        help="Sensors of every watch, as name[:rate[:readings per data send]] (default: the SmartBioStream ones)",
+    )
+    parser.add_argument("--profile", choices=PROFILES, default="linear", help="How the watches connect")
+    parser.add_argument("--ramp", type=float, default=30, help="Seconds over which the watches connect")
+    parser.add_argument("--steps", type=int, default=5, help="Groups of watches of the step profile")
+    parser.add_argument("--backlog", type=float, default=0, help="Seconds of data sends each watch flushes when it connects")
+    parser.add_argument("--seconds", type=float, default=60, help="Duration of the test after the ramp")
+    parser.add_argument("--retry", choices=RETRIES, default="none", help="What a watch does with a failed data send")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries of a data send with --retry backoff")
+    parser.add_argument("--retry-delay", type=float, default=1, help="First backoff in seconds, doubled after each retry")
+    parser.add_argument("--connections", type=int, default=5, help="Keep-alive connections per watch")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds before a request is abandoned (OkHttp's default)")
+    parser.add_argument("--token", help="Token sent in the Authorization header, as the app does")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic values")
+    parser.add_argument("--report-interval", type=float, default=5, help="Seconds between progress lines")
+    parser.add_argument("--output", help="JSON file with the summary")
+    args = parser.parse_args()
+    try:
+        parse_sensors(args.sensors)
+    except SensorSpecError as e:
+        parser.error(str(e))
+
+    limit = raise_file_limit()
+    if args.watches > limit - 16:
+        parser.error(f"--watches needs more open files than the limit ({limit}); raise it with ulimit -n")
+    if args.watches * args.connections > limit - 16:
+        print(f"Warning: up to {args.watches * args.connections} connections, above the open files limit ({limit})")
+
+    fleet = Fleet(args)
+    elapsed, ramp = asyncio.run(fleet.run())
+    summary = fleet.summary(elapsed, ramp)
+    print_summary(summary)
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=2) + "\n")
+        print(f"Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
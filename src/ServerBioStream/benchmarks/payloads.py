@@ -0,0 +1,124 @@
+"""
+Synthetic data sends as SmartBioStream posts them: every sensor of a watch
+buffers its readings and sends them in its own data send, e.g. 50 accelerometer
+readings (acc-x, acc-y and acc-z of each one) or 20 heart rates. Sensors are
+given as "name[:rate[:readings]]" to change their sample rate (Hz) or the
+readings per data send, e.g. "acc:50:500" for a 50 Hz accelerometer sending
+every 10 seconds. The generated data sends only depend on the arguments and
+the seed, so every run posts the same bytes.
+"""
+import heapq
+import json
+
+import numpy as np
+
+# Types of each sensor, sample rate (Hz) and readings per data send of the app
+SENSORS = {
+    "acc": (("acc-x", "acc-y", "acc-z"), 5.0, 50),
+    "gyro": (("gyro-x", "gyro-y", "gyro-z"), 5.0, 10),
+    "heart_rate": (("heart_rate",), 1.0, 20),
+    "temperature": (("temperature",), 1.0, 20),
+}
+
+START = 1700000000000
+
+
+class SensorSpecError(ValueError):
+    pass
+
+
+# A sensor of the watches: its types, sample rate (Hz) and readings per data send
+class Sensor:
+
+    def __init__(self, name, types, rate, readings):
+        self.name = name
+        self.types = types
+        self.rate = rate
+        self.readings = readings
+
+    """
+    Build a sensor from "name[:rate[:readings]]", with the defaults of SENSORS
+    """
+    @classmethod
+    def parse(cls, spec):
+        name, *options = spec.split(":")
+        if name not in SENSORS or len(options) > 2:
+            raise SensorSpecError(f"Invalid sensor {spec!r}, expected name[:rate[:readings]] with name in {', '.join(SENSORS)}")
+        types, rate, readings = SENSORS[name]
+        try:
+            if options:
+                rate = float(options[0])
+            if len(options) > 1:
+                readings = int(options[1])
+        except ValueError:
+            raise SensorSpecError(f"Invalid sensor {spec!r}, rate and readings must be numbers")
+        if rate <= 0 or readings <= 0:
+            raise SensorSpecError(f"Invalid sensor {spec!r}, rate and readings must be positive")
+        return cls(name, types, rate, readings)
+
+    # Seconds covered by each data send
+    @property
+    def interval(self):
+        return self.readings / self.rate
+
+    def as_dict(self):
+        return {"name": self.name, "types": list(self.types), "rate": self.rate, "readings": self.readings}
+
+
+def parse_sensors(specs):
+    return [Sensor.parse(spec) for spec in specs]
+
+
+def watch_identifier(watch):
+    return f"benchmark-watch-{watch:04d}"
+
+
+"""
+Return the payload (dict) of the data send number "send" of a sensor of a watch.
+Dates are in ms from START, values a noisy signal per type rounded to 4 digits.
+"""
+def build_send(watch, sensor, send, seed=42):
+    random = np.random.default_rng([seed, watch, send, list(SENSORS).index(sensor.name)])
+    first = send * sensor.readings
+    dates = START + np.round((first + np.arange(sensor.readings)) * 1000 / sensor.rate).astype(np.int64)
+    measurements = []
+    columns = []
+    for axis, sample_type in enumerate(sensor.types):
+        signal = np.sin(dates / 1000 + axis + watch) * 5 + random.normal(0, 0.1, sensor.readings)
+        columns.append((sample_type, np.round(signal, 4).tolist()))
+    for reading, date in enumerate(dates.tolist()):
+        for sample_type, values in columns:
+            measurements.append({"date": date, "type": sample_type, "value": values[reading]})
+    return {"identifier": watch_identifier(watch), "measurements": measurements}
+
+
+"""
+Yield the (seconds from the start, watch, payload) of every data send of
+"watches" watches (numbered from "first_watch") recording for "seconds"
+seconds, in the order they are sent
+"""
+def generate_sends(watches, sensors, seconds, seed=42, first_watch=0):
+    pending = []
+    for watch in range(first_watch, first_watch + watches):
+        for index, sensor in enumerate(sensors):
+            # Sensors of different watches are not aligned
+            offset = (watch * 0.37 + index * 0.11) % sensor.interval
+            heapq.heappush(pending, (offset + sensor.interval, watch, index, 0))
+    while pending:
+        moment, watch, index, send = heapq.heappop(pending)
+        if moment > seconds:
+            continue
+        sensor = sensors[index]
+        yield moment, watch, build_send(watch, sensor, send, seed)
+        heapq.heappush(pending, (moment + sensor.interval, watch, index, send + 1))
+
+
+"""
+Return the JSON bodies of the data sends of generate_sends, encoded once so the
+time to build them is not measured
+"""
+def encode_sends(watches, sensors, seconds, seed=42, first_watch=0):
+    return [
+        (moment, watch, json.dumps(payload).encode())
+        for moment, watch, payload in generate_sends(watches, sensors, seconds, seed, first_watch)
+    ]
@@ -0,0 +1,162 @@
+"""
+Concurrency benchmark of SQLite with its default settings against the tuned
+profile of settings.py (SQLITE_PRAGMAS: WAL, synchronous=NORMAL...; and
+IMMEDIATE transactions), on throwaway database files.
+
+Writer processes post data sends through ingest_batch (one experiment each,
+like devices) while reader processes run the queries of the measurements table:
+the experiments list and the last samples of an experiment. Every profile runs
+for the same time and reports the throughput, the 95th percentile latency and
+the operations that failed (e.g. "database is locked").
+
+    python -m benchmarks.sqlite_concurrency --writers 4 --readers 4 --seconds 10
+"""
+import argparse
+import logging
+import multiprocessing
+import tempfile
+import time
+from importlib import import_module
+from pathlib import Path
+
+import numpy as np
+
+from . import setup_django
+
+PROFILES = ("default", "tuned")
+
+
+# Point the default connection at the benchmark database, with the tuned profile
+# of the settings or with the SQLite defaults
+def use_database(path, profile):
+    from django.conf import settings
+    from django.db import connections
+
+    connections.close_all()
+    settings_dict = connections["default"].settings_dict
+    settings_dict["NAME"] = str(path)
+    if profile == "tuned":
+        # Read from the settings module, as the default profile replaces the setting
+        settings.SQLITE_PRAGMAS = getattr(import_module(settings.SETTINGS_MODULE), "SQLITE_PRAGMAS", {})
+        settings_dict["OPTIONS"].setdefault("transaction_mode", "IMMEDIATE")
+    else:
+        settings.SQLITE_PRAGMAS = {}
+        settings_dict["OPTIONS"].pop("transaction_mode", None)
+    # The failed data sends are counted, not logged
+    logging.getLogger("apps.dataAPI.ingestion").setLevel(logging.CRITICAL)
+
+
+def writer(path, profile, number, samples, start, deadline, results):
+    setup_django()
+    use_database(path, profile)
+    from django.db import DatabaseError
+
+    from apps.dataAPI.ingestion import MeasurementBatch, ingest_batch
+
+    time.sleep(max(0, start - time.time()))
+    latencies, stored, failed = [], 0, 0
+    date = 1700000000000
+    while time.time() < deadline:
+        dates = [date + i * 20 for i in range(samples)]
+        date += samples * 20
+        values = np.round(np.random.normal(0, 1, samples), 4).tolist()
+        started = time.perf_counter()
+        try:
+            report = ingest_batch(MeasurementBatch(f"writer-{number}", dates, ["acc-x"] * samples, values))
+            stored += report.inserted
+            failed += not report.ok
+        except DatabaseError:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    results.put(("write", latencies, stored, failed))
+
+
+def reader(path, profile, start, deadline, results):
+    setup_django()
+    use_database(path, profile)
+    from django.db import DatabaseError
+
+    from apps.dataAPI.models import Experiment, ExperimentSummary
+    from apps.dataAPI.storage import get_storage
+
+    storage = get_storage()
+    time.sleep(max(0, start - time.time()))
+    latencies, failed = [], 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            list(ExperimentSummary.objects.select_related("experiment").filter(samples__gt=0))
+            experiment_ids = list(Experiment.objects.values_list("id", flat=True))
+            if experiment_ids:
+                end = 1700000000000 + 10 ** 9
+                for _ in storage.read(experiment_ids[:1], start=end - 10 ** 9 // 2, end=end):
+                    pass
+        except DatabaseError:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    results.put(("read", latencies, 0, failed))
+
+
+def run(directory, profile, args):
+    from django.core.management import call_command
+    from django.db import connections
+
+    path = Path(directory) / f"{profile}.sqlite3"
+    use_database(path, profile)
+    call_command("migrate", verbosity=0)
+    connections.close_all()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    # Every process starts at the same time, once Django is set up
+    start = time.time() + 3
+    deadline = start + args.seconds
+    processes = [
+        context.Process(target=writer, args=(path, profile, number, args.samples, start, deadline, results))
+        for number in range(args.writers)
+    ] + [context.Process(target=reader, args=(path, profile, start, deadline, results)) for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    # Successful operations per second, 95th percentile latency (ms), samples stored and failures
+    def summary(kind):
+        latencies = [latency for outcome in outcomes if outcome[0] == kind for latency in outcome[1]]
+        failed = sum(outcome[3] for outcome in outcomes if outcome[0] == kind)
+        return (
+            (len(latencies) - failed) / args.seconds,
+            np.percentile(latencies, 95) * 1000 if latencies else 0.0,
+            sum(outcome[2] for outcome in outcomes if outcome[0] == kind),
+            failed,
+        )
+
+    return summary("write"), summary("read")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4, help="Processes posting data sends")
+    parser.add_argument("--readers", type=int, default=4, help="Processes reading the measurements")
+    parser.add_argument("--samples", type=int, default=150, help="Samples per data send")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of each profile")
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES), help="Profiles compared")
+    args = parser.parse_args()
+
+    setup_django()
+    print(
+        f"{'profile':>8} {'sends/s':>8} {'samples/s':>10} {'send p95 ms':>12} {'failed':>7} "
+        f"{'reads/s':>8} {'read p95 ms':>12} {'failed':>7}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in args.profiles:
+            (sends, send_p95, stored, send_failed), (reads, read_p95, _, read_failed) = run(directory, profile, args)
+            print(
+                f"{profile:>8} {sends:>8.1f} {stored / args.seconds:>10.0f} {send_p95:>12.1f} {send_failed:>7} "
+                f"{reads:>8.1f} {read_p95:>12.1f} {read_failed:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
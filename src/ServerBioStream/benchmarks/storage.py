@@ -0,0 +1,140 @@
+"""
+Read and write benchmark of the measurement storage backends (see
+apps.dataAPI.storage), on a throwaway test database.
+
+Every backend ingests the same accelerometer-like data sends (acc-x, acc-y and
+acc-z at 50 Hz, with float32 values as Android reads them, or decimals rounded
+to 4 digits with --values decimal) through ingest_batch, and then reads the whole experiment, a
+one minute window of one type and the number of samples. The size is the growth
+of the database (SQLite only).
+
+    python -m benchmarks.storage --batches 200 --batch-samples 1500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from . import setup_django
+
+TYPES = ("acc-x", "acc-y", "acc-z")
+
+
+# Data sends of one experiment: "samples" per send, sampled at 50 Hz
+def build_batches(batches, samples, values="float32", start=1700000000000):
+    random = np.random.default_rng(42)
+    per_type = samples // len(TYPES)
+    sends = []
+    for batch in range(batches):
+        dates = start + (batch * per_type + np.arange(per_type)) * 20
+        all_dates, all_types, all_values = [], [], []
+        for axis, sample_type in enumerate(TYPES):
+            signal = np.sin(dates / 1000 + axis) * 9.81 + random.normal(0, 0.05, per_type)
+            all_dates.extend(dates.tolist())
+            all_types.extend([sample_type] * per_type)
+            if values == "float32":
+                # Sent as the shortest decimal of the float32 reading
+                signal = signal.astype(np.float32).astype(str).astype(np.float64)
+            else:
+                signal = np.round(signal, 4)
+            all_values.extend(signal.tolist())
+        sends.append((all_dates, all_types, all_values))
+    return sends
+
+
+# Size of the SQLite database in bytes (None for the other databases)
+def database_size():
+    from django.db import connection
+
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA page_count")
+        pages = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return pages * cursor.fetchone()[0]
+
+
+def run(backend, sends):
+    from django.conf import settings
+
+    from apps.dataAPI.ingestion import MeasurementBatch, ingest_batch
+    from apps.dataAPI.models import Experiment, SensorType
+    from apps.dataAPI.storage import get_backend
+
+    settings.MEASUREMENTS_STORAGE = backend
+    storage = get_backend(backend)
+    identifier = "benchmark-" + backend
+
+    size = database_size()
+    started = time.perf_counter()
+    for dates, types, values in sends:
+        ingest_batch(MeasurementBatch(identifier, dates, types, values))
+    write_time = time.perf_counter() - started
+    if size is not None:
+        # Includes the summary and rollups, the same for every backend
+        size = database_size() - size
+
+    experiment = Experiment.objects.get(identifier=identifier)
+    samples = sum(len(dates) for dates, _, _ in sends)
+
+    started = time.perf_counter()
+    read = sum(len(chunk[0]) for chunk in storage.read([experiment.id]))
+    read_time = time.perf_counter() - started
+    assert read == samples
+
+    type_id = SensorType.objects.get(name="acc-y").id
+    window_start = sends[len(sends) // 2][0][0]
+    started = time.perf_counter()
+    window = sum(len(chunk[0]) for chunk in storage.read([experiment.id], [type_id], window_start, window_start + 60000))
+    window_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    storage.count([experiment.id])
+    count_time = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "samples": samples,
+        "write": samples / write_time,
+        "read": samples / read_time,
+        "window": window_time * 1000,
+        "window_samples": window,
+        "count": count_time * 1000,
+        "size": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=200, help="Data sends ingested per backend")
+    parser.add_argument("--batch-samples", type=int, default=1500, help="Samples per data send")
+    parser.add_argument("--values", choices=["float32", "decimal"], default="float32", help="Values sent")
+    parser.add_argument("--backends", nargs="+", default=["orm", "segments"], help="Backends compared")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        sends = build_batches(args.batches, args.batch_samples, args.values)
+        print(
+            f"{'backend':>10} {'samples':>9} {'write/s':>10} {'read/s':>11} "
+            f"{'1 min ms':>9} {'count ms':>9} {'bytes/sample':>13}"
+        )
+        for backend in args.backends:
+            result = run(backend, sends)
+            size = f"{result['size'] / result['samples']:.1f}" if result["size"] else "-"
+            print(
+                f"{result['backend']:>10} {result['samples']:>9} {result['write']:>10.0f} {result['read']:>11.0f} "
+                f"{result['window']:>9.2f} {result['count']:>9.2f} {size:>13}"
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Benchmark suite of the data send endpoint and of the views of the measurements,
+on a throwaway test database with the settings of the project. Requests go
+through the whole Django stack (middleware, views, templates) with the test
+client, so the results include everything but the network and the HTTP server.
+
+Scenarios, run in this order (any subset with --scenarios):
+    ingest       synthetic watches post every data send to /measurements-api/send/
+    concurrent   --writers threads post data sends of new watches while
+                 --readers threads read pages of measurements and the experiments list
+    experiments  the experiments list (/get-data) with --experiments more experiments
+    fetch        pages of /fetch-measurements/: first, next ones, last, search, sorted by value
+    export       /export-measurements/ of every watch, as CSV and NDJSON
+
+The data sends come from benchmarks.payloads and only depend on the options, so
+two runs with the same options do the same work. Results are written as JSON
+with the commit, the settings and the options, to compare two commits:
+
+    python -m benchmarks.suite --output before.json
+    git checkout other-branch
+    python -m benchmarks.suite --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from . import PROJECT_DIR, setup_django
+from .payloads import SENSORS, SensorSpecError, encode_sends, parse_sensors, watch_identifier
+
+SCENARIOS = ("ingest", "concurrent", "experiments", "fetch", "export")
+RESULTS_VERSION = 1
+SEND_URL = "/measurements-api/send/"
+# Watches of the concurrent scenario are numbered from here, so their data sends
+# are not duplicates of the ones of the ingest scenario
+CONCURRENT_FIRST_WATCH = 5000
+# Settings that change the results, saved with them
+RECORDED_SETTINGS = (
+    "MEASUREMENTS_BULK_CHUNK_SIZE",
+    "MEASUREMENTS_VALIDATION",
+    "MEASUREMENTS_INGEST_MODE",
+    "MEASUREMENTS_DEDUPLICATE_CONTENT",
+    "MEASUREMENTS_ROLLUP_RESOLUTIONS",
+    "MEASUREMENTS_STORAGE",
+    "MEASUREMENTS_SEGMENT_SAMPLES",
+    "SQLITE_PRAGMAS",
+    "METRICS_ENABLED",
+)
+
+
+# Latency percentiles in ms
+def latency(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3), "max": round(max(latencies) * 1000, 3)}
+
+
+def rate(amount, seconds):
+    return round(amount / seconds, 1) if seconds else None
+
+
+def git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=PROJECT_DIR, capture_output=True, text=True, timeout=30, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Suite:
+
+    def __init__(self, args):
+        from django.contrib.auth.models import User
+
+        self.args = args
+        self.sensors = parse_sensors(args.sensors)
+        self.sends = None
+        self.ingested = False
+        self.user = User.objects.create_user(username="benchmark", password="benchmark")
+        self.client = self.new_client()
+
+    def new_client(self):
+        from django.test import Client
+
+        client = Client()
+        client.force_login(self.user)
+        return client
+
+    def get_sends(self):
+        if self.sends is None:
+            self.sends = encode_sends(self.args.watches, self.sensors, self.args.seconds, self.args.seed)
+        return self.sends
+
+    def identifiers(self):
+        return [watch_identifier(watch) for watch in range(self.args.watches)]
+
+    def post(self, client, body):
+        started = time.perf_counter()
+        response = client.post(SEND_URL, body, content_type="application/json")
+        return response.status_code, time.perf_counter() - started
+
+    # GET a view, returning the response, the seconds and the database queries
+    def get(self, url, params, client=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = (client or self.client).get(url, params)
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} answered {response.status_code}: {content[:200]!r}")
+        return response, content, elapsed, len(queries)
+
+    # Time a GET "repeat" times
+    def measure(self, url, params):
+        latencies, queries = [], 0
+        for _ in range(self.args.repeat):
+            _, content, elapsed, queries = self.get(url, params)
+            latencies.append(elapsed)
+        return {**latency(latencies), "queries": queries, "bytes": len(content)}
+
+    # The read scenarios need the data sends of the ingest scenario
+    def ensure_ingested(self):
+        if not self.ingested:
+            self.ingest()
+
+    """
+    Post every data send of the synthetic watches, one after the other
+    """
+    def ingest(self):
+        from .storage import database_size
+
+        sends = self.get_sends()
+        size = database_size()
+        statuses, latencies = Counter(), []
+        started = time.perf_counter()
+        for _, _, body in sends:
+            status, elapsed = self.post(self.client, body)
+            statuses[status] += 1
+            latencies.append(elapsed)
+        elapsed = time.perf_counter() - started
+        self.ingested = True
+
+        samples = sum(body.count(b'"date"') for _, _, body in sends)
+        return {
+            "sends": len(sends),
+            "samples": samples,
+            "seconds": round(elapsed, 3),
+            "sends_per_second": rate(len(sends), elapsed),
+            "samples_per_second": rate(samples, elapsed),
+            "latency_ms": latency(latencies),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            "database_bytes": database_size() - size if size is not None else None,
+        }
+
+    """
+    Post the data sends of other watches from --writers threads while --readers
+    threads read the last page of measurements of a watch and the experiments
+    list until the writers finish
+    """
+    def concurrent(self):
+        from django.db import connection
+
+        self.ensure_ingested()
+        sends = encode_sends(
+            self.args.watches, self.sensors, self.args.seconds, self.args.seed, CONCURRENT_FIRST_WATCH
+        )
+        identifiers = self.identifiers()
+        writing = threading.Event()
+        writing.set()
+        results = {"write": [], "read": []}
+        lock = threading.Lock()
+
+        def writer(number):
+            client = self.new_client()
+            statuses, latencies = Counter(), []
+            try:
+                for _, _, body in sends[number::self.args.writers]:
+                    status, elapsed = self.post(client, body)
+                    statuses[status] += 1
+                    latencies.append(elapsed)
+            finally:
+                connection.close()
+            with lock:
+                results["write"].append((statuses, latencies))
+
+        def reader(number):
+            client = self.new_client()
+            random = np.random.default_rng([self.args.seed, number])
+            statuses, latencies = Counter(), []
+            try:
+                while writing.is_set():
+                    if random.random() < 0.5:
+                        url, params = "/fetch-measurements/", {
+                            "experiments[]": identifiers[random.integers(len(identifiers))],
+                            "page_size": self.args.page_size,
+                            "last": "1",
+                        }
+                    else:
+                        url, params = "/get-data", {}
+                    started = time.perf_counter()
+                    response = client.get(url, params)
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] += 1
+            finally:
+                connection.close()
+            with lock:
+                results["read"].append((statuses, latencies))
+
+        writers = [threading.Thread(target=writer, args=(number,)) for number in range(self.args.writers)]
+        readers = [threading.Thread(target=reader, args=(number,)) for number in range(self.args.readers)]
+        started = time.perf_counter()
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        writing.clear()
+        for thread in readers:
+            thread.join()
+
+        def summary(kind):
+            statuses = sum((outcome[0] for outcome in results[kind]), Counter())
+            latencies = [value for outcome in results[kind] for value in outcome[1]]
+            return {
+                "requests": len(latencies),
+                "per_second": rate(len(latencies), elapsed),
+                "latency_ms": latency(latencies),
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            }
+
+        samples = sum(body.count(b'"date"') for _, _, body in sends)
+        return {
+            "writers": self.args.writers,
+            "readers": self.args.readers,
+            "seconds": round(elapsed, 3),
+            "samples_per_second": rate(samples, elapsed),
+            "write": summary("write"),
+            "read": summary("read"),
+        }
+
+    """
+    Add --experiments experiments of a few samples and time the experiments list
+    """
+    def experiments(self):
+        from apps.dataAPI.ingestion import MeasurementBatch, ingest_batch
+
+        self.ensure_ingested()
+        for number in range(self.args.experiments):
+            dates = [1700000000000 + number * 1000 + i * 20 for i in range(10)]
+            ingest_batch(MeasurementBatch(f"benchmark-experiment-{number:05d}", dates, ["heart_rate"] * 10, [70.0] * 10))
+        response, _, _, _ = self.get("/get-data", {})
+        return {
+            "experiments": len(response.context["experiments"]),
+            "get_data_ms": self.measure("/get-data", {}),
+        }
+
+    """
+    Time pages of the measurements table of one watch and of every watch
+    """
+    def fetch(self):
+        self.ensure_ingested()
+        watch = {"experiments[]": watch_identifier(0), "page_size": self.args.page_size}
+        everything = {"experiments[]": self.identifiers(), "page_size": self.args.page_size}
+
+        # Pages after the first one, following the cursors
+        latencies, params = [], dict(watch)
+        for _ in range(self.args.repeat):
+            response, _, elapsed, _ = self.get("/fetch-measurements/", params)
+            latencies.append(elapsed)
+            cursor = json.loads(response.content)["next"]
+            if cursor is None:
+                break
+            params = {**watch, "after": cursor}
+
+        return {
+            "first_page_ms": self.measure("/fetch-measurements/", watch),
+            "next_pages_ms": {**latency(latencies[1:]), "pages": len(latencies) - 1},
+            "last_page_ms": self.measure("/fetch-measurements/", {**watch, "last": "1"}),
+            "search_ms": self.measure("/fetch-measurements/", {**watch, "search": "acc-x"}),
+            "sort_value_ms": self.measure("/fetch-measurements/", {**watch, "sort": "value", "order": "desc"}),
+            "all_watches_ms": self.measure("/fetch-measurements/", everything),
+        }
+
+    """
+    Time the download of every watch in each text format
+    """
+    def export(self):
+        self.ensure_ingested()
+        samples = sum(body.count(b'"date"') for _, _, body in self.get_sends())
+        results = {}
+        for file_format in ("csv", "ndjson"):
+            params = {"experiments[]": self.identifiers(), "format": file_format}
+            best = None
+            for _ in range(max(1, self.args.repeat // 10)):
+                _, content, elapsed, _ = self.get("/export-measurements/", params)
+                best = elapsed if best is None else min(best, elapsed)
+            results[file_format] = {
+                "seconds": round(best, 3),
+                "samples_per_second": rate(samples, best),
+                "megabytes_per_second": rate(len(content) / 2 ** 20, best),
+                "bytes": len(content),
+            }
+        return results
+
+
+"""
+Return the numbers of a results dict as {"scenario.metric...": value}
+"""
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(results, baseline):
+    old, new = flatten(baseline["scenarios"]), flatten(results["scenarios"])
+    print(f"\nCompared with {baseline.get('commit') or 'unknown commit'} ({baseline.get('created')})")
+    if baseline.get("options") != results.get("options"):
+        print("Warning: the options differ, the results may not be comparable")
+    if baseline.get("settings") != results.get("settings"):
+        print("Warning: the settings differ")
+    print(f"{'metric':<50} {'before':>12} {'after':>12} {'change':>8}")
+    for name in new:
+        if name not in old:
+            continue
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "-"
+        print(f"{name:<50} {old[name]:>12} {new[name]:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios run")
+    parser.add_argument("--watches", type=int, default=20, help="Synthetic watches")
+    parser.add_argument("--seconds", type=float, default=300, help="Seconds recorded by each watch")
+    parser.add_argument(
+        "--sensors",
+        nargs="+",
+        default=list(SENSORS),
+        help="Sensors of every watch, as name[:rate[:readings per data send]] (default: the SmartBioStream ones)",
+    )
+    parser.add_argument("--writers", type=int, default=4, help="Threads posting data sends in the concurrent scenario")
+    parser.add_argument("--readers", type=int, default=2, help="Threads reading in the concurrent scenario")
+    parser.add_argument("--experiments", type=int, default=1000, help="Experiments added for the experiments list")
+    parser.add_argument("--page-size", type=int, default=100, help="Rows per page of measurements")
+    parser.add_argument("--repeat", type=int, default=20, help="Times each read is timed")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic values")
+    parser.add_argument("--output", help="JSON file with the results")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+    try:
+        parse_sensors(args.sensors)
+    except SensorSpecError as e:
+        parser.error(str(e))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    setup_django()
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    directory = tempfile.TemporaryDirectory()
+    if connection.vendor == "sqlite":
+        # A file, as the server uses, instead of the in-memory test database
+        connection.settings_dict["TEST"]["NAME"] = str(Path(directory.name) / "benchmark.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "numpy": np.__version__,
+            "database": connection.vendor,
+            "cpus": os.cpu_count(),
+        },
+        "settings": {name: repr(getattr(settings, name, None)) for name in RECORDED_SETTINGS},
+        "options": {
+            name: value for name, value in vars(args).items() if name not in ("scenarios", "output", "compare")
+        },
+        "scenarios": {},
+    }
+    try:
+        suite = Suite(args)
+        for scenario in SCENARIOS:
+            if scenario not in args.scenarios:
+                continue
+            print(f"Running {scenario}...", flush=True)
+            started = time.perf_counter()
+            results["scenarios"][scenario] = getattr(suite, scenario)()
+            print(json.dumps(results["scenarios"][scenario], indent=2))
+            print(f"({time.perf_counter() - started:.1f} s)", flush=True)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        directory.cleanup()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Results written to {args.output}")
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark of the two validation paths of /measurements-api/send/:
+MeasurementsSerializer (DRF ListField of GroupSerializer) against the columnar
+fast path of apps.dataAPI.validation.
+
+    python -m benchmarks.validation --samples 5000 --repeat 20
+"""
+import argparse
+import random
+import timeit
+
+from . import setup_django
+
+
+# Build a data send with the shape SmartBioStream uses for the accelerometer
+def build_data_send(samples, start=1700000000000):
+    measurements = []
+    for i in range(samples):
+        measurements.append(
+            {"date": start + (i // 3) * 20, "type": ("acc-x", "acc-y", "acc-z")[i % 3], "value": random.uniform(-20, 20)}
+        )
+    return {"identifier": "benchmark", "measurements": measurements}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000, 5000], help="Samples per data send")
+    parser.add_argument("--repeat", type=int, default=20, help="Validations timed per path")
+    args = parser.parse_args()
+
+    setup_django()
+    from apps.dataAPI.serializer import MeasurementsSerializer
+    from apps.dataAPI.validation import validate_data_send
+
+    def serializer_path(data):
+        serializer = MeasurementsSerializer(data=data)
+        assert serializer.is_valid()
+
+    def fast_path(data):
+        batch, errors = validate_data_send(data)
+        assert not errors
+
+    print(f"{'samples':>8} {'serializer ms':>14} {'fast ms':>10} {'speedup':>8}")
+    for samples in args.samples:
+        data = build_data_send(samples)
+        serializer_time = min(timeit.repeat(lambda: serializer_path(data), number=1, repeat=args.repeat))
+        fast_time = min(timeit.repeat(lambda: fast_path(data), number=1, repeat=args.repeat))
+        print(
+            f"{samples:>8} {serializer_time * 1000:>14.2f} {fast_time * 1000:>10.2f} {serializer_time / fast_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
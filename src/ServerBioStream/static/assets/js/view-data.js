@@ -117,39 +117,79 @@ function applyFilter() {
   applyFilter();
 }
 
+// Measurements table: paginated, searched and sorted by the server, so only
+// one page of measurements is loaded at a time
+let measurementsQuery = {
+  experiments: [],
+  sort: "timestamp",
+  order: "asc",
+  search: "",
+  position: {},
+  next: null,
+  previous: null
+};
+
+// Sort key of each column of the measurements table
+const measurementsSortColumns = ["experiment", "timestamp", "type", "value"];
+
 // Function to load the measurements (in measurements table)
 // of the selected experiments
 function fetchMeasurementsForSelectedExperiments() {
+    measurementsQuery.experiments = [...document.querySelectorAll(".experiment-checkbox:checked")].map(cb => cb.value);
+    loadMeasurementsPage({});
+    if (liveMeasurements) {
+      stopLiveMeasurements();
+      if (measurementsQuery.experiments.length > 0) startLiveMeasurements();
+    }
+  }
 
+// Load one page of measurements. The position is {} for the first page,
+// {after: cursor}, {before: cursor} or {last: 1}
+function loadMeasurementsPage(position) {
     const measurementsCountElement = document.getElementById('measurements-count');
-
-    let selectedExperimentsArray = [...document.querySelectorAll(".experiment-checkbox:checked")].map(cb => cb.value);
     let measurementsTableBody = document.getElementById("measurementsTableBody");
-    measurementsTableBody.innerHTML = "";
+    let pagination = document.getElementById("paginationMeasurements");
+
+    if (measurementsQuery.experiments.length === 0) {
+      measurementsTableBody.innerHTML = `<tr><td colspan="4" class="text-center">Select an experiment.</td></tr>`;
+      measurementsCountElement.textContent = 0;
+      pagination.innerHTML = "";
+      return;
+    }
 
-    if (selectedExperimentsArray.length === 0) return;
+    measurementsQuery.position = position;
     $.ajax({
       url: "/fetch-measurements/",
       type: "GET",
-      data: { experiments: selectedExperimentsArray },
+      data: {
+        experiments: measurementsQuery.experiments,
+        page_size: document.getElementById("rowsPerPageMeasurements").value,
+        sort: measurementsQuery.sort,
+        order: measurementsQuery.order,
+        search: measurementsQuery.search,
+        ...position
+      },
       dataType: "json",
       success: function (data) {
-        let table = $("#measurementsTable")
-        if (data.measurements.length > 0) {
-          data.measurements.forEach(meas => {
-            let row = document.createElement("tr");
-            row.innerHTML = `
-                            <td>${meas.experiment}</td>
-                            <td>${meas.timestamp}</td>
-                            <td>${meas.type}</td>
-                            <td>${meas.value}</td>
-                        `;
-            measurementsTableBody.appendChild(row);
-          });
+        measurementsTableBody.innerHTML = "";
+        data.measurements.forEach(meas => {
+          let row = document.createElement("tr");
+          row.innerHTML = `
+                          <td>${meas.experiment}</td>
+                          <td>${meas.timestamp}</td>
+                          <td>${meas.type}</td>
+                          <td>${meas.value}</td>
+                      `;
+          measurementsTableBody.appendChild(row);
+        });
+        if (data.measurements.length === 0) {
+          measurementsTableBody.innerHTML = `<tr><td colspan="4" class="text-center">No measurements found.</td></tr>`;
+        }
 
-          measurementsCountElement.textContent = data.measurements.length;
-          setupPagination("measurementsTable", "measurementsTableBody", "searchInputMeasurements", "rowsPerPageMeasurements", "paginationMeasurements");
-        } else { }
+        measurementsCountElement.textContent = data.count;
+        measurementsQuery.next = data.next;
+        measurementsQuery.previous = data.previous;
+        updateMeasurementsPagination();
       },
       error: function (error) {
         console.error("Error fetching measurements:", error);
@@ -157,6 +197,54 @@ function fetchMeasurementsForSelectedExperiments() {
     });
   }
 
+// Pagination controls of the measurements table: first, previous, next and last page
+function updateMeasurementsPagination() {
+    let pagination = document.getElementById("paginationMeasurements");
+    let paginationHTML = "";
+
+    if (measurementsQuery.previous) {
+      paginationHTML += `<li class='page-item'><a class='page-link' href='#' onclick='loadMeasurementsPage({}); return false;'>&lt;&lt;</a></li>`;
+      paginationHTML += `<li class='page-item'><a class='page-link' href='#' onclick='loadMeasurementsPage({before: measurementsQuery.previous}); return false;'>&lt;</a></li>`;
+    }
+    if (measurementsQuery.next) {
+      paginationHTML += `<li class='page-item'><a class='page-link' href='#' onclick='loadMeasurementsPage({after: measurementsQuery.next}); return false;'>&gt;</a></li>`;
+      paginationHTML += `<li class='page-item'><a class='page-link' href='#' onclick='loadMeasurementsPage({last: 1}); return false;'>&gt;&gt;</a></li>`;
+    }
+
+    pagination.innerHTML = paginationHTML;
+  }
+
+// Search, page length and sorting of the measurements table
+function setupMeasurementsTable() {
+    const searchInput = document.getElementById("searchInputMeasurements");
+    const rowsPerPageElement = document.getElementById("rowsPerPageMeasurements");
+    let searchTimeout = null;
+
+    // Wait until the user stops typing before searching
+    searchInput.addEventListener("input", function () {
+      clearTimeout(searchTimeout);
+      searchTimeout = setTimeout(() => {
+        measurementsQuery.search = searchInput.value.trim();
+        loadMeasurementsPage({});
+      }, 300);
+    });
+
+    rowsPerPageElement.addEventListener("change", function () {
+      loadMeasurementsPage({});
+    });
+
+    let table = document.getElementById("measurementsTable");
+    table.querySelectorAll("th").forEach((header, index) => {
+      header.style.cursor = "pointer";
+      header.addEventListener("click", function () {
+        let sort = measurementsSortColumns[index];
+        measurementsQuery.order = (measurementsQuery.sort === sort && measurementsQuery.order === "asc") ? "desc" : "asc";
+        measurementsQuery.sort = sort;
+        loadMeasurementsPage({});
+      });
+    });
+  }
+
 // Configure a sortable table by columns
 function setupSortableTable(tableId) {
     let table = document.getElementById(tableId);
@@ -193,9 +281,73 @@ function refreshExperimentsTable() {
 }
 
 function refreshMeasurementsTable() {
-    fetchMeasurementsForSelectedExperiments();
+    loadMeasurementsPage(measurementsQuery.position);
 }
 
+// Live view: the new measurements of the selected experiments are pushed by the
+// server (Server-Sent Events) and added on top of the measurements table
+let liveMeasurements = null;
+
+function toggleLiveMeasurements() {
+    if (liveMeasurements) {
+      stopLiveMeasurements();
+    } else {
+      startLiveMeasurements();
+    }
+  }
+
+function startLiveMeasurements() {
+    if (measurementsQuery.experiments.length === 0) {
+      Swal.fire('Live view', 'Select an experiment first.', 'info');
+      return;
+    }
+    const params = new URLSearchParams();
+    measurementsQuery.experiments.forEach(experiment => params.append('experiments[]', experiment));
+    liveMeasurements = new EventSource(`/live-measurements/?${params.toString()}`);
+    liveMeasurements.onmessage = event => addLiveMeasurements(JSON.parse(event.data));
+    document.getElementById('liveMeasurementsButton').classList.replace('btn-outline-primary', 'btn-primary');
+  }
+
+function stopLiveMeasurements() {
+    if (liveMeasurements) liveMeasurements.close();
+    liveMeasurements = null;
+    document.getElementById('liveMeasurementsButton').classList.replace('btn-primary', 'btn-outline-primary');
+  }
+
+// Same format as the timestamps of fetch-measurements (UTC)
+function formatTimestamp(millis) {
+    const date = new Date(millis);
+    const pad = (value, length = 2) => String(value).padStart(length, '0');
+    return `${pad(date.getUTCDate())}/${pad(date.getUTCMonth() + 1)}/${date.getUTCFullYear()} ` +
+      `${pad(date.getUTCHours())}:${pad(date.getUTCMinutes())}:${pad(date.getUTCSeconds())}.${pad(date.getUTCMilliseconds(), 3)}000`;
+  }
+
+function addLiveMeasurements(data) {
+    const measurementsTableBody = document.getElementById("measurementsTableBody");
+    const measurementsCountElement = document.getElementById('measurements-count');
+    const rowsPerPage = parseInt(document.getElementById("rowsPerPageMeasurements").value);
+    let received = 0;
+
+    data.measurements.forEach(series => {
+      received += series.samples;
+      series.points.forEach(([timestamp, value]) => {
+        let row = document.createElement("tr");
+        row.innerHTML = `
+                        <td>${series.experiment}</td>
+                        <td>${formatTimestamp(timestamp)}</td>
+                        <td>${series.type}</td>
+                        <td>${value}</td>
+                    `;
+        measurementsTableBody.insertBefore(row, measurementsTableBody.firstChild);
+      });
+    });
+    // Only the newest page of rows is kept
+    while (measurementsTableBody.rows.length > rowsPerPage) {
+      measurementsTableBody.deleteRow(-1);
+    }
+    measurementsCountElement.textContent = parseInt(measurementsCountElement.textContent || 0) + received;
+  }
+
 // Function to manage the deletion of an experiment button
 function handleDeleteExperiment(event) {
     const targetButton = event.target.closest('.delete-button');
@@ -226,13 +378,7 @@ function handleDeleteExperiment(event) {
           .then(response => response.json())
           .then(data => {
             if (data.status === 'success') {
-              Swal.fire(
-                'Deleted!',
-                'Your experiment has been deleted.',
-                'success'
-              ).then(() => {
-                window.location.reload();
-              });
+              showDeletionProgress(data);
             } else {
               Swal.fire('Error!', data.message, 'error');
             }
@@ -245,6 +391,37 @@ function handleDeleteExperiment(event) {
     });
   }
   
+// Show the progress of a deletion, polling the server until it finishes
+function showDeletionProgress(deletion) {
+    if (deletion.state === 'done') {
+      Swal.fire(
+        'Deleted!',
+        'Your experiment has been deleted.',
+        'success'
+      ).then(() => {
+        window.location.reload();
+      });
+      return;
+    }
+    if (deletion.state === 'failed') {
+      Swal.fire('Error!', deletion.error || 'There was an issue deleting the experiment case.', 'error');
+      return;
+    }
+
+    const text = `Deleted ${deletion.deleted} of ${deletion.total} rows (${deletion.progress}%)`;
+    if (Swal.isVisible() && Swal.getTitle() && Swal.getTitle().textContent === 'Deleting...') {
+      Swal.update({ text: text });
+    } else {
+      Swal.fire({ title: 'Deleting...', text: text, allowOutsideClick: false, showConfirmButton: false });
+    }
+    setTimeout(() => {
+      fetch(`/delete-experiment-status/?deletion=${deletion.deletion}`)
+        .then(response => response.json())
+        .then(showDeletionProgress)
+        .catch(error => Swal.fire('Error!', error.message, 'error'));
+    }, 1000);
+  }
+
 // Clear and re-initialize table pagination, sorting, and filtering after updating content dynamically
 function reinitializeTable(tableId, tbodyId, searchInputId, rowsPerPageId, paginationId) {
     if (paginationConfigs[tableId]) delete paginationConfigs[tableId];
@@ -255,10 +432,8 @@ function reinitializeTable(tableId, tbodyId, searchInputId, rowsPerPageId, pagin
 // Configuration when loading the html template
 document.addEventListener("DOMContentLoaded", function () {
     setupPagination("experimentsTable", "experimentsTableBody", "searchInputExperiments", "rowsPerPageExperiments", "paginationExperiments");
-    setupPagination("measurementsTable", "measurementsTableBody", "searchInputMeasurements", "rowsPerPageMeasurements", "paginationMeasurements");
-
     setupSortableTable("experimentsTable");
-    setupSortableTable("measurementsTable");
+    setupMeasurementsTable();
 
     // Checkbox to select an experiment and load its measurements
     document.querySelectorAll(".experiment-checkbox").forEach(checkbox => {
@@ -294,26 +469,46 @@ function export_experiments() {
     });
   }
 
-//Manage the export measurements button
+//Manage the export measurements button. CSV, NDJSON and columnar files contain
+//every measurement of the selected experiments and are generated by the server;
+//Excel and PDF export the page shown in the table.
 function export_measurements() {
     Swal.fire({
       title: 'Select format export',
       input: 'select',
       inputOptions: {
-        'csv': 'CSV',
-        'excel': 'Excel',
-        'pdf': 'PDF'
+        'csv': 'CSV (all measurements)',
+        'ndjson': 'NDJSON (all measurements)',
+        'columnar': 'Parquet / NPZ (all measurements)',
+        'excel': 'Excel (current page)',
+        'pdf': 'PDF (current page)'
       },
       inputPlaceholder: 'Select a format',
       showCancelButton: true
     }).then((result) => {
       if (result.isConfirmed) {
         let format = result.value;
-        exportTableData("measurementsTable", [0, 1, 2, 3], format);
+        if (format === 'excel' || format === 'pdf') {
+          exportTableData("measurementsTable", [0, 1, 2, 3], format);
+        } else {
+          downloadMeasurements(format);
+        }
       }
     });
   }
 
+// Download the measurements of the selected experiments from the server
+function downloadMeasurements(format) {
+    if (measurementsQuery.experiments.length === 0) {
+      Swal.fire('No experiments selected', 'Select the experiments to export.', 'info');
+      return;
+    }
+    window.location.href = "/export-measurements/?" + $.param({
+      experiments: measurementsQuery.experiments,
+      format: format
+    });
+  }
+
 // Controller function to export data from any table
 function exportTableData(tableId, columnsToExport, format) {
     let table = document.getElementById(tableId);